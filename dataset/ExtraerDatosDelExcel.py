@@ -1,62 +1,307 @@
+import numpy as np
 import pandas as pd
 
+import argparse
+import copy
+import functools
+import glob
+import hashlib
+import os
 import re
 import json
+import sys
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from fuzzywuzzy import fuzz
+from openpyxl import load_workbook
+
+import perfilado
+from almacen import RUTA_ALMACEN, abrir_almacen, guardar_visitas
+from intercambio import es_ruta_jsonl, escribir_pacientes_jsonl
+from registros import PacienteRegistro, a_json, normalizar_nombre
+
+# ---------------------------------------------------------------------------
+# Catálogo de patrones precompilados
+# ---------------------------------------------------------------------------
+# Cada campo extraído tiene su patrón compilado una sola vez al importar el
+# módulo, junto con un "ancla": el prefijo literal obligatorio con el que
+# empieza cualquier coincidencia del patrón. Con las anclas de un catálogo se
+# arma un único localizador que recorre el texto una vez y anota dónde aparece
+# cada campo por primera vez; luego cada patrón se evalúa sólo desde esa
+# posición (o no se evalúa si el campo no aparece).
+# Ningún ancla es prefijo de otra, así que dos campos nunca compiten por la
+# misma posición del texto.
+
+PATRONES_EVALUACION = {
+    "edad": (r'paciente\s+de\s',
+             re.compile(r'Paciente\s+de\s+(\d+)\s+años', re.IGNORECASE)),
+    "diagnostico": (r'diagnóstico\s+de\s',
+                    re.compile(r'diagnóstico\s+de\s+(.*?)(?:\s+\(|,|\n|$)', re.IGNORECASE)),
+    "codigo_cie10": (r'(?-i:\([A-Z]\d)',
+                     re.compile(r'\(([A-Z]\d{2,4})\)')),
+    "ram": (r'ram',
+            re.compile(r'RAM\s*[:\-]?\s*(\w+)', re.IGNORECASE)),
+    "interacciones_farmacologicas": (r'interacciones\s+farmacológicas',
+                                     re.compile(r'Interacciones\s+farmacológicas.*?[:\-]?\s*(.*?)(?=\n|$)',
+                                                re.IGNORECASE)),
+    "adherencia_global": (r'\b(?:totalmente|no|parcialmente|adherente)\b',
+                          re.compile(r'\b(totalmente adherente|no adherente|parcialmente adherente|adherente)\b',
+                                     re.IGNORECASE)),
+}
+
+PATRONES_OBJETIVO = {
+    "otro_diagnostico": (r'otros?\s*diagnóstico',
+                         re.compile(r'Otros?\s*diagnósticos?\s*[:\-]?\s*(.*?)(?=\n{2,}|\n\s*\w+:|$)',
+                                    re.DOTALL | re.IGNORECASE)),
+    "tratamiento_principal": (r'tratamiento principal',
+                              re.compile(r'Tratamiento principal\s*[:\-]?\s*(.*?)(?:\n\n|\n\s*\w+:|$)',
+                                         re.DOTALL | re.IGNORECASE)),
+    "conciliacion_medicamentos": (r'conciliación\s+(?:de\s+medicamentos|medicamentosa)',
+                                  re.compile(r'Conciliación\s+(?:de\s+medicamentos|medicamentosa)\s*[:\-]?\s*(.*?)(?:\n\n|\n\s*\w+:|$)',
+                                             re.DOTALL | re.IGNORECASE)),
+    "nivel_escolaridad": (r'nivel\s+de\s+escolaridad',
+                          re.compile(r'Nivel\s+de\s+escolaridad\s*[:\-]?\s*(.*)', re.IGNORECASE)),
+    "consumo_alcohol": (r'consumo\s+de\s+alcohol',
+                        re.compile(r'Consumo\s+de\s+alcohol\s*[:\-]?\s*(.*)', re.IGNORECASE)),
+    "consumo_tabaco": (r'consumo\s+de\s+tabaco',
+                       re.compile(r'Consumo\s+de\s+tabaco\s*[:\-]?\s*(.*)', re.IGNORECASE)),
+    "consumo_sustancias": (r'consumo\s+de\s+sustancia',
+                           re.compile(r'Consumo\s+de\s+sustancia[s]?\s+psicoactivas\s*[:\-]?\s*(.*)', re.IGNORECASE)),
+    "hospitalizacion_ultimos_6_meses": (r'hospitalización',
+                                        re.compile(r'Hospitalización\s*(?:en\s*los\s*|los\s*)?últimos\s*6\s*meses\s*[:\-]?\s*(.*)',
+                                                   re.IGNORECASE)),
+}
+
+# Clinimetrías: el patrón de DAS28 no tiene prefijo obligatorio, así que no
+# pasan por el localizador; sólo se precompilan.
+PATRON_DAS28 = re.compile(r'(DAS|AS)?\s*[-/]?\s*28\s*[-/]?\s*(PCR|VSG)?\s*[:\-]?\s*([0-9]+(?:\.[0-9]+)?)',
+                          re.IGNORECASE)
+PATRON_SLEDAI = re.compile(r'SLEDAI\s*[:\-]?\s*([0-9]+(?:\.[0-9]+)?)', re.IGNORECASE)
+
+# Dispensación (se aplican sobre el texto ya en minúsculas)
+PATRON_EPS_IPS = re.compile(r'\b(eps|epps|ep\s|ips|ipss|ip\s)\b')
+PATRON_PROBLEMAS_DISPENSACION = re.compile(
+    r'(no\s+entregado|no\s+dispensado|no\s+recibido|demora|pendiente\s+de\s+entrega|falta\s+de\s+medicamento)')
+PATRON_NO_DISPENSACION = re.compile(
+    r'no\s+adh[eé]rente.*?(no\s+ha\s+recibido|no\s+entregado|no\s+dispensado|no\s+dispensaron)')
+
+PATRON_ESPACIOS = re.compile(r'\s+')
+
+# Fecha de consulta en el nombre del libro: CIUDAD-dd-mm-aaaa.xlsx
+PATRON_FECHA_ARCHIVO = re.compile(r'-(\d{2})-(\d{2})-(\d{4})\.')
+
+
+# ---------------------------------------------------------------------------
+# Detector difuso de palabras clave
+# ---------------------------------------------------------------------------
+# fuzz.ratio vale 2*M / (len(a) + len(b)), donde M (caracteres emparejados)
+# nunca supera ni la longitud de la palabra más corta ni la cantidad de
+# caracteres que ambas palabras tienen en común. Con esas dos cotas se descartan
+# casi todas las palabras del texto sin llamar a fuzz.ratio: primero por
+# longitud (un diccionario longitud -> términos posibles) y luego por la firma
+# de caracteres. Sólo las candidatas que pasan ambos filtros se puntúan con
+# fuzz.ratio, por lo que el resultado es el mismo que comparar palabra por
+# palabra.
+
+# Términos que se buscan con tolerancia a errores de digitación
+TERMINOS_DIFUSOS = ("parcialmente", "adherente", "dispensado", "entregado")
+
+
+def _cota_puntaje(coincidencias, longitud_total):
+    # Mismo redondeo que usa fuzzywuzzy (utils.intr)
+    return int(round(100 * 2 * coincidencias / longitud_total))
+
+
+def crear_detector_difuso(terminos, umbral=85, max_cache=50000):
+    """
+    Devuelve una función detectar(palabras) -> set con los términos de
+    `terminos` para los que alguna palabra tiene fuzz.ratio >= umbral.
+    El resultado de cada palabra distinta se guarda en un caché acotado.
+    """
+    indice_longitud = {}
+    for termino in terminos:
+        firma = Counter(termino)
+        longitud = len(termino)
+        largo = 1
+        # Longitudes de palabra con las que el término todavía puede alcanzar el umbral
+        while largo <= longitud or _cota_puntaje(longitud, largo + longitud) >= umbral:
+            if _cota_puntaje(min(largo, longitud), largo + longitud) >= umbral:
+                indice_longitud.setdefault(largo, []).append((termino, firma))
+            largo += 1
+
+    cache = {}
+
+    def puntuar_palabra(palabra):
+        candidatos = indice_longitud.get(len(palabra))
+        if not candidatos:
+            return ()
+        firma_palabra = Counter(palabra)
+        return tuple(
+            termino for termino, firma in candidatos
+            if _cota_puntaje(sum((firma & firma_palabra).values()), len(palabra) + len(termino)) >= umbral
+            and fuzz.ratio(palabra, termino) >= umbral
+        )
+
+    def detectar(palabras):
+        encontrados = set()
+        for palabra in palabras:
+            coincidencias = cache.get(palabra)
+            if coincidencias is None:
+                coincidencias = puntuar_palabra(palabra)
+                if len(cache) >= max_cache:
+                    cache.clear()
+                cache[palabra] = coincidencias
+            encontrados.update(coincidencias)
+            if len(encontrados) == len(terminos):
+                break
+        return encontrados
+
+    return detectar
+
+
+DETECTOR_DISPENSACION = crear_detector_difuso(TERMINOS_DIFUSOS, umbral=85)
+
+
+# ---------------------------------------------------------------------------
+# Memoización por celda
+# ---------------------------------------------------------------------------
+# Los libros repiten mucho texto entre pacientes y visitas ("Otros
+# diagnósticos: Niega", las líneas de consumo, interacciones copiadas...).
+# Los extractores de celda se memorizan en un LRU acotado cuya clave es un hash
+# del texto, no el texto mismo, para que la memoria dependa sólo del número de
+# entradas.
+
+TAMANO_CACHE_CELDAS = 4096
+
+# nombre de función -> wrapper memorizado, para consultar las estadísticas
+_FUNCIONES_MEMORIZADAS = {}
+
+
+def memoizar_por_texto(max_entradas=TAMANO_CACHE_CELDAS):
+    def decorador(funcion):
+        cache = OrderedDict()
+        contadores = {"aciertos": 0, "fallos": 0}
+
+        @functools.wraps(funcion)
+        def envoltura(texto):
+            if not isinstance(texto, str):
+                return funcion(texto)
+            clave = hashlib.blake2b(texto.encode("utf-8"), digest_size=16).digest()
+            resultado = cache.get(clave)
+            if resultado is not None:
+                cache.move_to_end(clave)
+                contadores["aciertos"] += 1
+            else:
+                contadores["fallos"] += 1
+                resultado = funcion(texto)
+                cache[clave] = resultado
+                if len(cache) > max_entradas:
+                    cache.popitem(last=False)
+            # Copia profunda: los valores pueden ser diccionarios o listas (extraer_clinimetrias);
+            # quien llama puede modificar el resultado a cualquier nivel sin tocar el caché
+            return copy.deepcopy(resultado)
+
+        def info_cache():
+            return {**contadores, "entradas": len(cache), "max_entradas": max_entradas}
+
+        def limpiar_cache():
+            cache.clear()
+            contadores["aciertos"] = contadores["fallos"] = 0
+
+        envoltura.info_cache = info_cache
+        envoltura.limpiar_cache = limpiar_cache
+        _FUNCIONES_MEMORIZADAS[funcion.__name__] = envoltura
+        return envoltura
+
+    return decorador
+
+
+def estadisticas_cache_celdas():
+    """Aciertos, fallos y tamaño del caché de cada extractor memorizado."""
+    return {nombre: funcion.info_cache() for nombre, funcion in _FUNCIONES_MEMORIZADAS.items()}
+
+
+def mostrar_estadisticas_cache_celdas():
+    for nombre, info in estadisticas_cache_celdas().items():
+        total = info["aciertos"] + info["fallos"]
+        porcentaje = 100 * info["aciertos"] / total if total else 0
+        print(f"  {nombre}: {info['aciertos']} aciertos / {info['fallos']} fallos "
+              f"({porcentaje:.1f}%), {info['entradas']} entradas")
+
+
+def compilar_localizador(catalogo):
+    """Une las anclas de un catálogo en un solo patrón con un grupo nombrado por campo."""
+    alternativas = "|".join(f"(?P<{campo}>{ancla})" for campo, (ancla, _) in catalogo.items())
+    return re.compile(f"(?=(?:{alternativas}))", re.IGNORECASE)
+
+
+LOCALIZADOR_EVALUACION = compilar_localizador(PATRONES_EVALUACION)
+LOCALIZADOR_OBJETIVO = compilar_localizador(PATRONES_OBJETIVO)
+
+
+def buscar_campos(texto, catalogo, localizador):
+    """
+    Recorre el texto una sola vez con el localizador y devuelve un diccionario
+    campo -> match (o None si el campo no aparece en el texto).
+    """
+    posiciones = {}
+    for ancla in localizador.finditer(texto):
+        posiciones.setdefault(ancla.lastgroup, ancla.start())
+        if len(posiciones) == len(catalogo):
+            break
 
+    matches = {}
+    for campo, (_, patron) in catalogo.items():
+        pos = posiciones.get(campo)
+        matches[campo] = patron.search(texto, pos) if pos is not None else None
+    return matches
+
+
+@memoizar_por_texto()
 def extraer_datos_evaluacion(texto):
     if not isinstance(texto, str):
         return {}
     info_extraida = {}
+    matches = buscar_campos(texto, PATRONES_EVALUACION, LOCALIZADOR_EVALUACION)
 
     # Edad del paciente
-    match = re.search(r'Paciente\s+de\s+(\d+)\s+años', texto, re.IGNORECASE)
+    match = matches["edad"]
     info_extraida["edad"] = int(match.group(1)) if match else None
 
     # Diagnóstico principal (puede ir seguido del código CIE-10)
-    match = re.search(r'diagnóstico\s+de\s+(.*?)(?:\s+\(|,|\n|$)', texto, re.IGNORECASE)
+    match = matches["diagnostico"]
     info_extraida["diagnostico"] = match.group(1).strip() if match else "No especificado"
 
     # Código CIE-10
-    match = re.search(r'\(([A-Z]\d{2,4})\)', texto)
+    match = matches["codigo_cie10"]
     info_extraida["codigo_cie10"] = match.group(1) if match else "No especificado"
 
     # Reacción adversa a medicamentos (RAM)
-    match = re.search(r'RAM\s*[:\-]?\s*(\w+)', texto, re.IGNORECASE)
+    match = matches["ram"]
     info_extraida["ram"] = match.group(1).strip() if match else "No especificado"
 
     # Interacciones farmacológicas
-    match = re.search(r'Interacciones\s+farmacológicas.*?[:\-]?\s*(.*?)(?=\n|$)', texto, re.IGNORECASE)
+    match = matches["interacciones_farmacologicas"]
     info_extraida["interacciones_farmacologicas"] = match.group(1).strip() if match else "No especificado"
 
     # Adherencia global (de fase de intervención)
-
-    # Suponiendo que 'texto' es el texto completo donde buscas
-    match = re.search(
-        r'\b(totalmente adherente|no adherente|parcialmente adherente|adherente)\b',
-        texto, re.IGNORECASE
-    )
+    match = matches["adherencia_global"]
     info_extraida["adherencia_global"] = match.group(1).strip().capitalize() if match else "No especificado"
 
     # ---- Nueva parte: Clasificación de dispensación ----
     texto_min = texto.lower()
 
-    # Detectar palabras similares a "parcialmente"
+    # Detectar palabras similares a "parcialmente" (y al resto del vocabulario difuso)
     palabras = texto_min.split()
-    parcial_detectado = any(fuzz.ratio(palabra, "parcialmente") >= 85 for palabra in palabras)
+    terminos_detectados = DETECTOR_DISPENSACION(palabras)
+    parcial_detectado = "parcialmente" in terminos_detectados
 
     # Detectar mención de problemas de entrega
-    menciona_eps_ips = bool(re.search(r'\b(eps|epps|ep\s|ips|ipss|ip\s)\b', texto_min))
-    problemas_dispensacion = bool(re.search(
-        r'(no\s+entregado|no\s+dispensado|no\s+recibido|demora|pendiente\s+de\s+entrega|falta\s+de\s+medicamento)',
-        texto_min
-    ))
+    menciona_eps_ips = bool(PATRON_EPS_IPS.search(texto_min))
+    problemas_dispensacion = bool(PATRON_PROBLEMAS_DISPENSACION.search(texto_min))
 
     # Detectar no adherencia grave
-    no_dispensacion_regex = re.search(
-        r'no\s+adh[eé]rente.*?(no\s+ha\s+recibido|no\s+entregado|no\s+dispensado|no\s+dispensaron)',
-        texto_min
-    )
+    no_dispensacion_regex = PATRON_NO_DISPENSACION.search(texto_min)
 
     # Clasificar
     if no_dispensacion_regex:
@@ -72,15 +317,16 @@ def extraer_datos_evaluacion(texto):
     return info_extraida
 
 
+@memoizar_por_texto()
 def extraer_info_relevante_objetivo(texto):
     if not isinstance(texto, str):
         return {}
 
     info_extraida = {}
+    matches = buscar_campos(texto, PATRONES_OBJETIVO, LOCALIZADOR_OBJETIVO)
     #TODO FALTA EL OTRO DIAGNIOSTICO:
     # Otro diagnóstico (considerando "Niega" y otros diagnósticos con saltos de línea o comas)
-    match = re.search(r'Otros?\s*diagnósticos?\s*[:\-]?\s*(.*?)(?=\n{2,}|\n\s*\w+:|$)', texto,
-                      re.DOTALL | re.IGNORECASE)
+    match = matches["otro_diagnostico"]
 
     if match:
         # Si el diagnóstico es "Niega" o algo similar, lo manejamos adecuadamente
@@ -89,36 +335,36 @@ def extraer_info_relevante_objetivo(texto):
             info_extraida["otro_diagnostico"] = "Niega"
         else:
             # Limpiamos y dejamos los diagnósticos adecuados
-            info_extraida["otro_diagnostico"] = re.sub(r'\s+', ' ', diagnostico)
+            info_extraida["otro_diagnostico"] = PATRON_ESPACIOS.sub(' ', diagnostico)
     else:
         info_extraida["otro_diagnostico"] = "No especificado"
 
     # Tratamiento principal
-    match = re.search(r'Tratamiento principal\s*[:\-]?\s*(.*?)(?:\n\n|\n\s*\w+:|$)', texto, re.DOTALL | re.IGNORECASE)
+    match = matches["tratamiento_principal"]
     info_extraida["tratamiento_principal"] = match.group(1).strip() if match else "No especificado"
 
     # Conciliación de medicamentos / medicamentosa
-    match = re.search(r'Conciliación\s+(?:de\s+medicamentos|medicamentosa)\s*[:\-]?\s*(.*?)(?:\n\n|\n\s*\w+:|$)', texto, re.DOTALL | re.IGNORECASE)
+    match = matches["conciliacion_medicamentos"]
     info_extraida["conciliacion_medicamentos"] = match.group(1).strip() if match else "No especificado"
 
     # Nivel de escolaridad
-    match = re.search(r'Nivel\s+de\s+escolaridad\s*[:\-]?\s*(.*)', texto, re.IGNORECASE)
+    match = matches["nivel_escolaridad"]
     info_extraida["nivel_escolaridad"] = match.group(1).strip() if match else "No especificado"
 
     # Consumo de alcohol
-    match = re.search(r'Consumo\s+de\s+alcohol\s*[:\-]?\s*(.*)', texto, re.IGNORECASE)
+    match = matches["consumo_alcohol"]
     info_extraida["consumo_alcohol"] = match.group(1).strip() if match else "No especificado"
 
     # Consumo de tabaco
-    match = re.search(r'Consumo\s+de\s+tabaco\s*[:\-]?\s*(.*)', texto, re.IGNORECASE)
+    match = matches["consumo_tabaco"]
     info_extraida["consumo_tabaco"] = match.group(1).strip() if match else "No especificado"
 
     # Consumo de sustancias psicoactivas
-    match = re.search(r'Consumo\s+de\s+sustancia[s]?\s+psicoactivas\s*[:\-]?\s*(.*)', texto, re.IGNORECASE)
+    match = matches["consumo_sustancias"]
     info_extraida["consumo_sustancias"] = match.group(1).strip() if match else "No especificado"
 
     # Hospitalización en/los últimos 6 meses
-    match = re.search(r'Hospitalización\s*(?:en\s*los\s*|los\s*)?últimos\s*6\s*meses\s*[:\-]?\s*(.*)', texto, re.IGNORECASE)
+    match = matches["hospitalizacion_ultimos_6_meses"]
     info_extraida["hospitalizacion_ultimos_6_meses"] = match.group(1).strip() if match else "No especificado"
 
     return info_extraida
@@ -129,6 +375,7 @@ def extraer_info_relevante_objetivo(texto):
 
 
 
+@memoizar_por_texto()
 def extraer_clinimetrias(texto):
     """
     Extrae clinimetrías como DAS28 (PCR/VSG) y SLEDAI desde un texto clínico.
@@ -140,9 +387,7 @@ def extraer_clinimetrias(texto):
     clinimetrias = {}
 
     # Buscar DAS28 o AS28 con posibles variantes
-    match_das = re.search(
-        r'(DAS|AS)?\s*[-/]?\s*28\s*[-/]?\s*(PCR|VSG)?\s*[:\-]?\s*([0-9]+(?:\.[0-9]+)?)',
-        texto, re.IGNORECASE)
+    match_das = PATRON_DAS28.search(texto)
     if match_das:
         tipo = "DAS28"
         subtipo = match_das.group(2).upper() if match_das.group(2) else "NO ESPECIFICADO"
@@ -150,9 +395,7 @@ def extraer_clinimetrias(texto):
         clinimetrias[tipo] = {"tipo": f"{tipo} {subtipo}", "valor": float(valor)}
 
     # Buscar SLEDAI con número
-    match_sledai = re.search(
-        r'SLEDAI\s*[:\-]?\s*([0-9]+(?:\.[0-9]+)?)',
-        texto, re.IGNORECASE)
+    match_sledai = PATRON_SLEDAI.search(texto)
     if match_sledai:
         clinimetrias["SLEDAI"] = {"tipo": "SLEDAI", "valor": float(match_sledai.group(1))}
 
@@ -160,75 +403,504 @@ def extraer_clinimetrias(texto):
 
 
 
-def extraer_y_organizar_datos(df, filas_por_bloque=7, tripletas_columnas=[(2, 3, 4), (7, 8, 9), (12, 13, 14)],ruta_archivo=None):
-    bloques_extraidos = {}
-    fila_actual = 0
-    id_paciente = 0
+def extraer_fecha_archivo(ruta_archivo):
+    """
+    Devuelve la fecha de consulta ("dd-mm-aaaa") codificada en el nombre del
+    libro, o None si el nombre no sigue la convención CIUDAD-dd-mm-aaaa.xlsx.
+    """
+    if not ruta_archivo:
+        return None
+    nombre_archivo = ruta_archivo.split('/')[-1]  # Obtener solo el nombre del archivo
+    coincidencia = PATRON_FECHA_ARCHIVO.search(nombre_archivo)
+    if not coincidencia:
+        return None
+    dia, mes, anio = coincidencia.groups()
+    return f"{dia}-{mes}-{anio}"
+
+
+def localizar_bloques(df, filas_por_bloque=7, tripletas_columnas=[(2, 3, 4), (7, 8, 9), (12, 13, 14)]):
+    """
+    Recorre la hoja y devuelve, en orden, las celdas crudas de cada bloque de
+    paciente: (nombre, objetivo, observaciones, evaluacion, clinimetria).
+    Es la parte barata del recorrido; el trabajo de regex se hace después en
+    construir_paciente, bloque por bloque.
+    """
+    return localizar_bloques_arreglo(df.to_numpy(dtype=object), filas_por_bloque, tripletas_columnas)
 
-    while fila_actual + filas_por_bloque <= df.shape[0]:
-        fila_nombre = df.iloc[fila_actual]
 
-        if fila_nombre.count() < 1:
+def localizar_bloques_arreglo(valores, filas_por_bloque=7, tripletas_columnas=[(2, 3, 4), (7, 8, 9), (12, 13, 14)]):
+    """
+    Igual que localizar_bloques pero sobre la hoja ya convertida en un arreglo
+    NumPy de objetos. Las celdas se leen con indexación simple y los chequeos de
+    filas o bloques vacíos salen de máscaras calculadas una sola vez.
+    """
+    num_filas, num_columnas = valores.shape
+    nulos = pd.isna(valores)
+    # Equivale a fila_nombre.count() >= 1
+    fila_con_datos = ~nulos.all(axis=1)
+
+    # Por tripleta: cuántas filas con algún dato hay antes de cada fila
+    # (suma acumulada), así "bloque vacío" es una resta en vez de un isnull()
+    acumulados = {}
+    for tripleta in tripletas_columnas:
+        if tripleta[2] >= num_columnas:
+            continue
+        filas_utiles = ~nulos[:, list(tripleta)].all(axis=1)
+        acumulados[tripleta] = np.concatenate(([0], np.cumsum(filas_utiles)))
+
+    bloques = []
+    fila_actual = 0
+
+    while fila_actual + filas_por_bloque <= num_filas:
+        if not fila_con_datos[fila_actual]:
             fila_actual += 1
             continue
 
-        for col1, col2, col3 in tripletas_columnas:
-            if col3 >= df.shape[1]:
+        fin_bloque = fila_actual + filas_por_bloque
+        for tripleta in tripletas_columnas:
+            acumulado = acumulados.get(tripleta)
+            if acumulado is None:
                 continue
-            if fila_actual + filas_por_bloque > df.shape[0]:
+            if acumulado[fin_bloque] == acumulado[fila_actual]:
                 continue
 
-            bloque_data = df.iloc[fila_actual:fila_actual + filas_por_bloque, [col1, col2, col3]]
+            col1, col2, col3 = tripleta
+            clinimetria_raw = valores[fila_actual + 6, col1] if fila_actual + 6 < num_filas else None
+
+            bloques.append((
+                valores[fila_actual, col1],        # nombre
+                valores[fila_actual + 2, col2],    # objetivo
+                valores[fila_actual + 2, col3],    # observaciones
+                valores[fila_actual + 4, col1],    # evaluación / análisis
+                clinimetria_raw,
+            ))
 
-            if bloque_data.isnull().all().all():
+        fila_actual += filas_por_bloque
+
+    return bloques
+
+
+def construir_paciente(nombre, objetivo_raw, observaciones, evaluacion_raw, clinimetria_raw, fecha_archivo=None):
+    """Aplica todos los extractores a las celdas de un bloque y arma el diccionario del paciente."""
+    clinimetria_valor = extraer_clinimetrias(clinimetria_raw)
+
+    clinimetria_tipo = None
+    clinimetria_valor_num = None
+
+    if clinimetria_valor:
+        clave = list(clinimetria_valor.keys())[0]
+        clinimetria_tipo = clinimetria_valor[clave]["tipo"]
+        clinimetria_valor_num = clinimetria_valor[clave]["valor"]
+    else:
+        clinimetria_tipo = "No aplica"
+        clinimetria_valor_num = "No aplica"
+
+    objetivo_dict = extraer_info_relevante_objetivo(objetivo_raw)
+    eva_ana = extraer_datos_evaluacion(evaluacion_raw)
+
+    paciente_dict = {
+        "nombre": nombre,
+        "clinimetria_tipo": clinimetria_tipo,
+        "clinimetria_valor": clinimetria_valor_num,
+        "observaciones": observaciones,
+    }
+
+    # Añadir cada clave del objetivo al mismo nivel
+    paciente_dict.update(objetivo_dict)
+    paciente_dict.update(eva_ana)
+    # AGREGAR FECHA DE LAS CONSULTAS ACADA PACIENTE
+    if fecha_archivo:
+        paciente_dict["fecha_consulta"] = fecha_archivo
+
+    return paciente_dict
+
+
+def _construir_paciente_bloque(args):
+    # Envoltorio de un solo argumento para ProcessPoolExecutor.map
+    return construir_paciente(*args)
+
+
+def extraer_y_organizar_datos(df, filas_por_bloque=7, tripletas_columnas=[(2, 3, 4), (7, 8, 9), (12, 13, 14)],ruta_archivo=None,
+                              trabajadores=1):
+    """
+    Extrae los pacientes de una hoja. Con trabajadores > 1 los bloques se
+    reparten en un pool de procesos; el resultado (incluidos los ids) es
+    idéntico al de la ejecución en serie porque el pool devuelve los bloques
+    en el mismo orden en que se enviaron.
+    """
+    # La fecha es la misma para todo el libro: se toma una sola vez del nombre
+    fecha_archivo = extraer_fecha_archivo(ruta_archivo)
+    bloques = [celdas + (fecha_archivo,) for celdas in localizar_bloques(df, filas_por_bloque, tripletas_columnas)]
+
+    if trabajadores > 1 and len(bloques) > 1:
+        tamano_lote = max(1, len(bloques) // (trabajadores * 4))
+        with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+            pacientes = list(pool.map(_construir_paciente_bloque, bloques, chunksize=tamano_lote))
+    else:
+        pacientes = [construir_paciente(*bloque) for bloque in bloques]
+
+    # Guardar usando id numérico
+    return {id_paciente: paciente_dict for id_paciente, paciente_dict in enumerate(pacientes)}
+
+
+# ---------------------------------------------------------------------------
+# Lectura en streaming (openpyxl, read_only=True)
+# ---------------------------------------------------------------------------
+
+# Cadenas que pd.read_excel convierte en NaN por defecto
+VALORES_NA = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+
+def _normalizar_celda(valor):
+    # Deja la celda como la entregaría pd.read_excel(header=None)
+    if valor is None or (isinstance(valor, str) and valor in VALORES_NA):
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def leer_filas_libro(ruta_archivo):
+    """
+    Itera las filas de la primera hoja del libro sin cargarlo completo en
+    memoria. Devuelve tuplas (fila, vacia, sin_celdas): la fila con las celdas
+    ya normalizadas, si todas sus celdas son NaN, y si además no tiene ninguna
+    celda escrita (lo que pandas usa para recortar las filas finales).
+    """
+    libro = load_workbook(ruta_archivo, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        # Las dimensiones declaradas en el archivo no son confiables (igual que en pandas)
+        hoja.reset_dimensions()
+        for fila in hoja.iter_rows(values_only=True):
+            sin_celdas = all(valor is None or valor == "" for valor in fila)
+            fila = tuple(_normalizar_celda(valor) for valor in fila)
+            yield fila, sin_celdas or all(pd.isna(valor) for valor in fila), sin_celdas
+    finally:
+        libro.close()
+
+
+def extraer_pacientes_streaming(ruta_archivo, filas_por_bloque=7, tripletas_columnas=[(2, 3, 4), (7, 8, 9), (12, 13, 14)]):
+    """
+    Versión en streaming de extraer_y_organizar_datos: lee el libro fila a fila
+    y va entregando (id_paciente, paciente_dict) apenas se completa cada bloque,
+    de modo que en memoria sólo hay una ventana de filas a la vez.
+
+    Las filas sin celdas se retienen hasta ver la siguiente fila escrita,
+    porque pd.read_excel descarta las filas vacías del final de la hoja y un
+    bloque que cae sobre ellas no se extrae. Como aquí no se conoce la hoja
+    completa de antemano hay dos diferencias con la lectura con pandas: una
+    tripleta con datos se procesa aunque su tercera columna esté vacía en toda
+    la hoja, y un número entero no se convierte a float por compartir columna
+    con decimales.
+    """
+    fecha_archivo = extraer_fecha_archivo(ruta_archivo)
+    ancho_minimo = max(max(tripleta) for tripleta in tripletas_columnas) + 1
+    ventana = deque()
+    id_paciente = 0
+    # Filas sin celdas al final de la ventana, desde la última fila escrita
+    filas_finales = 0
+
+    def consumir_ventana():
+        nonlocal id_paciente
+        while len(ventana) >= filas_por_bloque:
+            if ventana[0][1]:
+                ventana.popleft()
                 continue
 
-            clinimetria_raw = df.iloc[fila_actual + 6, col1] if fila_actual + 6 < df.shape[0] else None
-            clinimetria_valor = extraer_clinimetrias(clinimetria_raw)
+            filas = [ventana.popleft()[0] for _ in range(filas_por_bloque)]
+            ancho = max(ancho_minimo, max(len(fila) for fila in filas))
+            valores = np.full((filas_por_bloque, ancho), np.nan, dtype=object)
+            for i, fila in enumerate(filas):
+                valores[i, :len(fila)] = fila
+
+            for celdas in localizar_bloques_arreglo(valores, filas_por_bloque, tripletas_columnas):
+                yield id_paciente, construir_paciente(*celdas, fecha_archivo)
+                id_paciente += 1
+
+    for fila, vacia, sin_celdas in leer_filas_libro(ruta_archivo):
+        ventana.append((fila, vacia))
+        if not sin_celdas:
+            filas_finales = 0
+            yield from consumir_ventana()
+        else:
+            filas_finales += 1
 
-            clinimetria_tipo = None
-            clinimetria_valor_num = None
+    # Las filas sin celdas del final no forman parte de la hoja
+    for _ in range(filas_finales):
+        ventana.pop()
+    yield from consumir_ventana()
 
-            if clinimetria_valor:
-                clave = list(clinimetria_valor.keys())[0]
-                clinimetria_tipo = clinimetria_valor[clave]["tipo"]
-                clinimetria_valor_num = clinimetria_valor[clave]["valor"]
-            else:
-                clinimetria_tipo = "No aplica"
-                clinimetria_valor_num = "No aplica"
-
-            objetivo_dict = extraer_info_relevante_objetivo(df.iloc[fila_actual + 2, col2])
-            eva_ana = extraer_datos_evaluacion(df.iloc[fila_actual + 4, col1])
-
-            paciente_dict = {
-                "nombre": df.iloc[fila_actual, col1],
-                "clinimetria_tipo": clinimetria_tipo,
-                "clinimetria_valor": clinimetria_valor_num,
-                "observaciones": df.iloc[fila_actual + 2, col3],
-            }
-
-            # Añadir cada clave del objetivo al mismo nivel
-            paciente_dict.update(objetivo_dict)
-            paciente_dict.update(eva_ana)
-            # AGREGAR FECHA DE LAS CONSULTAS ACADA PACIENTE
-            nombre_archivo = ruta_archivo.split('/')[-1]  # Obtener solo el nombre del archivo
-            coincidencia = re.search(r'-(\d{2})-(\d{2})-(\d{4})\.', nombre_archivo)
-            if coincidencia:
-                dia = coincidencia.group(1)
-                mes = coincidencia.group(2)
-                anio = coincidencia.group(3)
-                fecha_archivo = f"{dia}-{mes}-{anio}"
-                # Agregar la fecha a cada diccionario de paciente
-                paciente_dict["fecha_consulta"] = fecha_archivo
-
-            # Guardar usando id numérico
-            bloques_extraidos[id_paciente] = paciente_dict
-
-            id_paciente += 1
 
-        fila_actual += filas_por_bloque
+# ---------------------------------------------------------------------------
+# Modo por lotes: varios libros de entrevistas en un solo proceso
+# ---------------------------------------------------------------------------
+
+EXTENSIONES_LIBRO = (".xlsx", ".xlsm", ".xls")
 
-    return bloques_extraidos
+
+def listar_libros(origen):
+    """
+    Devuelve la lista ordenada de libros a procesar. `origen` puede ser una
+    carpeta (se toman todos los libros de Excel que contiene) o un patrón glob.
+    Se ignoran los archivos temporales de Excel ("~$...").
+    """
+    if os.path.isdir(origen):
+        candidatos = [os.path.join(origen, nombre) for nombre in os.listdir(origen)]
+    else:
+        candidatos = glob.glob(origen)
+
+    libros = [
+        ruta for ruta in candidatos
+        if ruta.lower().endswith(EXTENSIONES_LIBRO)
+        and not os.path.basename(ruta).startswith("~$")
+        and os.path.isfile(ruta)
+    ]
+    return sorted(libros, key=clave_orden_libro)
+
+
+def clave_orden_libro(ruta_archivo):
+    """Ordena los libros por fecha de consulta (aaaa, mm, dd) y luego por nombre."""
+    fecha = extraer_fecha_archivo(ruta_archivo.replace(os.sep, '/'))
+    if fecha:
+        dia, mes, anio = fecha.split('-')
+        return (anio, mes, dia, os.path.basename(ruta_archivo))
+    return ("9999", "99", "99", os.path.basename(ruta_archivo))
+
+
+def generar_id_global(paciente_dict, nombre_archivo, id_local):
+    """
+    Id estable de un registro: no depende del orden en que se procesan los
+    libros, sólo del nombre del paciente y de la fecha de consulta. Los bloques
+    sin nombre se identifican por libro y posición.
+    """
+    nombre = paciente_dict.get("nombre")
+    if isinstance(nombre, str) and nombre.strip():
+        fecha = paciente_dict.get("fecha_consulta") or nombre_archivo
+        base = f"{normalizar_nombre(nombre)}|{fecha}"
+    else:
+        base = f"{nombre_archivo}|{id_local}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()[:16]
+
+
+def huella_registro(paciente_dict) -> str:
+    """
+    Hash del contenido de un paciente sin el nombre (que ya está en el id y
+    puede variar en tildes o mayúsculas): dos registros con el mismo id son
+    el mismo sólo si coincide todo lo demás.
+    """
+    contenido = {campo: valor for campo, valor in paciente_dict.items() if campo != "nombre"}
+    texto = json.dumps(contenido, ensure_ascii=False, sort_keys=True, default=a_json)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def resolver_id_global(vistos, id_global, huella, nombre_archivo, paciente_dict, avisados=None):
+    """
+    Decide qué hacer con un registro cuyo id base es `id_global`, dado
+    `vistos` ({id_global: (huella, libro)} de los registros ya conservados,
+    que se actualiza). Devuelve el id con que se conserva el registro, o None
+    si es un duplicado exacto (mismo contenido, p. ej. un libro copiado). Si
+    el id ya lo tiene un registro distinto (dos pacientes que se normalizan
+    al mismo nombre, vistos el mismo día) se conservan los dos: el segundo
+    recibe un id derivado de su contenido y se avisa de la colisión (una
+    sola vez por id si se pasa el conjunto `avisados`).
+    """
+    anterior = vistos.get(id_global)
+    if anterior is None:
+        vistos[id_global] = (huella, nombre_archivo)
+        return id_global
+    if anterior[0] == huella:
+        return None
+    id_alterno = hashlib.sha1(f"{id_global}|{huella}".encode("utf-8")).hexdigest()[:16]
+    if id_alterno in vistos:
+        return None
+    if avisados is None or id_alterno not in avisados:
+        print(f"⚠️ Id repetido con contenido distinto: {paciente_dict.get('nombre')} "
+              f"({paciente_dict.get('fecha_consulta')}) en {anterior[1]} y {nombre_archivo}; se conservan los dos")
+        if avisados is not None:
+            avisados.add(id_alterno)
+    vistos[id_alterno] = (huella, nombre_archivo)
+    return id_alterno
+
+
+def fusionar_resultados(resultados_por_libro):
+    """
+    Fusiona los diccionarios {id_local: paciente} de varios libros en un solo
+    diccionario {id_global: paciente}. Si el mismo paciente aparece dos veces
+    para la misma fecha con el mismo contenido (p. ej. un libro copiado) se
+    conserva el primero; si el contenido difiere se conservan los dos (ver
+    resolver_id_global). Los pacientes fusionados se guardan como
+    PacienteRegistro para que el archivo completo quepa en memoria.
+    Devuelve (datos_fusionados, duplicados_descartados, colisiones).
+    """
+    datos_fusionados = {}
+    vistos = {}
+    ids_base = set()
+    duplicados = 0
+    for ruta_archivo, bloques in resultados_por_libro:
+        nombre_archivo = os.path.basename(ruta_archivo)
+        for id_local, paciente_dict in bloques.items():
+            id_base = generar_id_global(paciente_dict, nombre_archivo, id_local)
+            ids_base.add(id_base)
+            id_global = resolver_id_global(vistos, id_base, huella_registro(paciente_dict),
+                                           nombre_archivo, paciente_dict)
+            if id_global is None:
+                duplicados += 1
+                continue
+            datos_fusionados[id_global] = PacienteRegistro.desde_dict(paciente_dict)
+    return datos_fusionados, duplicados, len(datos_fusionados) - len(ids_base)
+
+
+def procesar_libro(ruta_archivo, trabajadores=1, streaming=False):
+    """Lee un libro y devuelve sus pacientes, o None si no se pudo leer."""
+    if streaming:
+        try:
+            return dict(extraer_pacientes_streaming(ruta_archivo.replace(os.sep, '/')))
+        except Exception as e:
+            print(f"❌ Error al leer {ruta_archivo}: {e}")
+            return None
+    try:
+        df = pd.read_excel(ruta_archivo, header=None)
+    except Exception as e:
+        print(f"❌ Error al leer {ruta_archivo}: {e}")
+        return None
+    return extraer_y_organizar_datos(df, ruta_archivo=ruta_archivo.replace(os.sep, '/'), trabajadores=trabajadores)
+
+
+# ---------------------------------------------------------------------------
+# Caché incremental de extracción
+# ---------------------------------------------------------------------------
+# Cada libro ya extraído se guarda en un JSON dentro de la carpeta de caché.
+# La clave combina el hash del contenido del libro, su nombre (de ahí sale la
+# fecha de consulta), el modo de lectura y la versión del extractor, que es el
+# hash del código fuente de este módulo: cualquier cambio en los extractores
+# invalida el caché sin tener que acordarse de subir un número de versión.
+
+RUTA_CACHE_POR_DEFECTO = os.path.join("DATOSJSON", "cache_extraccion")
+
+
+def hash_archivo(ruta_archivo, tamano_bloque=1 << 20):
+    """SHA-256 del contenido de un archivo, leído por partes."""
+    digest = hashlib.sha256()
+    with open(ruta_archivo, "rb") as f:
+        for parte in iter(lambda: f.read(tamano_bloque), b""):
+            digest.update(parte)
+    return digest.hexdigest()
+
+
+def calcular_version_extractor():
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+VERSION_EXTRACTOR = calcular_version_extractor()
+
+
+def clave_cache(ruta_archivo, streaming=False):
+    modo = "streaming" if streaming else "pandas"
+    base = f"{hash_archivo(ruta_archivo)}|{os.path.basename(ruta_archivo)}|{modo}|{VERSION_EXTRACTOR}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+def leer_cache(dir_cache, clave):
+    """Devuelve los pacientes guardados para la clave, o None si no hay entrada válida."""
+    ruta = os.path.join(dir_cache, f"{clave}.json")
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            entrada = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entrada.get("version") != VERSION_EXTRACTOR:
+        return None
+    # Se guardan como lista para conservar el orden y los ids enteros
+    return dict(enumerate(entrada["pacientes"]))
+
+
+def guardar_cache(dir_cache, clave, ruta_archivo, bloques):
+    os.makedirs(dir_cache, exist_ok=True)
+    ruta = os.path.join(dir_cache, f"{clave}.json")
+    entrada = {
+        "version": VERSION_EXTRACTOR,
+        "archivo": os.path.basename(ruta_archivo),
+        "pacientes": [bloques[id_paciente] for id_paciente in sorted(bloques)],
+    }
+    try:
+        # Se escribe a un temporal y se renombra para no dejar entradas a medias
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entrada, f, ensure_ascii=False)
+        os.replace(ruta + ".tmp", ruta)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"⚠️ No se pudo guardar en caché {ruta_archivo}: {e}")
+
+
+def procesar_lote(origen, trabajadores=1, streaming=False, dir_cache=None):
+    """
+    Procesa todos los libros de una carpeta o patrón glob y fusiona los pacientes.
+    Con varios trabajadores y varios libros, cada libro se procesa en un proceso
+    aparte; con un solo libro, el paralelismo se aplica a sus bloques.
+    Si se indica dir_cache, sólo se extraen los libros nuevos o modificados y
+    el resto se toma del caché.
+    """
+    libros = listar_libros(origen)
+    if not libros:
+        print(f"No se encontraron libros de Excel en: {origen}")
+        return {}
+
+    por_libro = [None] * len(libros)
+    claves = {}
+    pendientes = []
+    for i, ruta_archivo in enumerate(libros):
+        if dir_cache:
+            claves[i] = clave_cache(ruta_archivo, streaming)
+            por_libro[i] = leer_cache(dir_cache, claves[i])
+            if por_libro[i] is not None:
+                continue
+        pendientes.append(i)
+
+    rutas_pendientes = [libros[i] for i in pendientes]
+    if trabajadores > 1 and len(rutas_pendientes) > 1:
+        with ProcessPoolExecutor(max_workers=min(trabajadores, len(rutas_pendientes))) as pool:
+            # map conserva el orden de los libros, así la fusión es determinista
+            extraidos = list(pool.map(procesar_libro, rutas_pendientes,
+                                      [1] * len(rutas_pendientes), [streaming] * len(rutas_pendientes)))
+    else:
+        extraidos = [procesar_libro(ruta_archivo, trabajadores, streaming) for ruta_archivo in rutas_pendientes]
+
+    for i, bloques in zip(pendientes, extraidos):
+        por_libro[i] = bloques
+        if dir_cache and bloques is not None:
+            guardar_cache(dir_cache, claves[i], libros[i], bloques)
+
+    resultados = []
+    extraidos_ahora = set(pendientes)
+    for i, (ruta_archivo, bloques) in enumerate(zip(libros, por_libro)):
+        if bloques is None:
+            continue
+        origen_datos = "" if i in extraidos_ahora else " (caché)"
+        print(f"📄 {os.path.basename(ruta_archivo)}: {len(bloques)} pacientes{origen_datos}")
+        resultados.append((ruta_archivo, bloques))
+
+    datos_pacientes, duplicados, colisiones = fusionar_resultados(resultados)
+    print(f"\nLibros procesados: {len(resultados)} de {len(libros)} (extraídos: {len(pendientes)}, desde caché: {len(libros) - len(pendientes)})")
+    print(f"Pacientes únicos: {len(datos_pacientes)} (duplicados descartados: {duplicados}, "
+          f"mismo nombre y fecha con datos distintos conservados aparte: {colisiones})")
+    return datos_pacientes
+
+
+# Funciones que mide perfilado.activar(...) con --perfil
+FUNCIONES_PERFILADAS = {
+    "localizar_bloques": "localización de bloques",
+    "construir_paciente": "paciente completo",
+    "extraer_datos_evaluacion": "extractor: evaluación",
+    "extraer_info_relevante_objetivo": "extractor: objetivo",
+    "extraer_clinimetrias": "extractor: clinimetrías",
+    "buscar_campos": "localizador de campos (objetivo y evaluación)",
+    "DETECTOR_DISPENSACION": "búsqueda difusa de dispensación",
+    "guardar_pacientes": "escritura del JSON",
+}
 
 
 def mostrar_datos_organizados(bloques_extraidos):
@@ -246,29 +918,162 @@ def mostrar_datos_organizados(bloques_extraidos):
 
 
 
-def main():
-    ruta_archivo = 'ENTREVISTAS\TUNJA-26-03-2025.xlsx'  # Ajusta con tu ruta
+def guardar_pacientes(pacientes, ruta_salida, reemplazar=False):
+    """
+    Guarda un iterable de (id_paciente, paciente_dict): JSON indentado, o una
+    línea por paciente si la ruta es .jsonl / .jsonl.gz (ver intercambio.py).
+    Con reemplazar=True se escribe a ruta_salida + ".tmp" y se renombra al
+    terminar: quien lea el archivo nunca lo ve a medias (un JSONL así no se
+    puede seguir mientras se escribe). Devuelve si se pudo guardar.
+    """
+    destino = ruta_salida + ".tmp" if reemplazar else ruta_salida
     try:
-        df = pd.read_excel(ruta_archivo, header=None)
-    except FileNotFoundError:
-        print(f"Error: No se pudo encontrar el archivo en la ruta: {ruta_archivo}")
-        return
+        if es_ruta_jsonl(ruta_salida):
+            escribir_pacientes_jsonl(pacientes, destino, ruta_salida.lower().endswith(".gz"))
+        else:
+            with open(destino, 'w', encoding='utf-8') as f:
+                json.dump(dict(pacientes), f, ensure_ascii=False, indent=4, default=a_json)
+        if reemplazar:
+            os.replace(destino, ruta_salida)
+        print(f"\n✅ Datos guardados exitosamente en {ruta_salida}")
+        return True
     except Exception as e:
-        print(f"Error al leer el archivo Excel: {e}")
-        return
-
-    datos_pacientes = extraer_y_organizar_datos(df,ruta_archivo=ruta_archivo)
-    mostrar_datos_organizados(datos_pacientes)
+        print(f"❌ Error al guardar archivo JSON: {e}")
+        return False
 
 
-    # Guardar como JSON
-    ruta_salida = 'DATOSJSON\datos_pacientes.json'
+def guardar_en_almacen(pacientes, ruta_almacen, libro=None):
+    """Inserta o actualiza los pacientes {id_global: paciente} en el almacén SQLite (ver almacen.py)."""
     try:
-        with open(ruta_salida, 'w', encoding='utf-8') as f:
-            json.dump(datos_pacientes, f, ensure_ascii=False, indent=4)
-        print(f"\n✅ Datos guardados exitosamente en {ruta_salida}")
+        conexion = abrir_almacen(ruta_almacen)
+        try:
+            conteo = guardar_visitas(conexion, pacientes.items(), libro)
+        finally:
+            conexion.close()
     except Exception as e:
-        print(f"❌ Error al guardar archivo JSON: {e}")
+        print(f"❌ Error al guardar en el almacén {ruta_almacen}: {e}")
+        return
+    print(f"✅ Almacén {ruta_almacen}: {conteo['nuevas']} visitas nuevas, {conteo['actualizadas']} actualizadas, "
+          f"{conteo['sin_cambios']} sin cambios")
+    if conteo["descartadas"]:
+        print(f"⚠️ {conteo['descartadas']} pacientes con el id repetido no se guardaron")
+
+
+def _mostrar_a_medida(pacientes):
+    for id_paciente, paciente_dict in pacientes:
+        mostrar_datos_organizados({id_paciente: paciente_dict})
+        yield id_paciente, paciente_dict
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Extrae los datos de pacientes de los libros de entrevistas.")
+    parser.add_argument("origen", nargs="?", default='ENTREVISTAS\TUNJA-26-03-2025.xlsx',
+                        help="Libro de Excel, carpeta o patrón glob (p. ej. 'ENTREVISTAS/*.xlsx')")
+    parser.add_argument("--salida", default='DATOSJSON\datos_pacientes.json',
+                        help="Ruta del JSON de salida (.jsonl o .jsonl.gz: un paciente por línea)")
+    parser.add_argument("--trabajadores", type=int, default=1,
+                        help="Procesos para la extracción (1 = en serie, 0 = todos los núcleos)")
+    parser.add_argument("--cache", nargs="?", const=RUTA_CACHE_POR_DEFECTO, default=None,
+                        help="Modo por lotes: reutilizar la extracción de los libros que no cambiaron "
+                             f"(carpeta de caché, por defecto {RUTA_CACHE_POR_DEFECTO})")
+    parser.add_argument("--excel", nargs="?", const='HOJAexcelSUBIR\\pacientes_detallado.xlsx', default=None,
+                        help="Puntuar los pacientes con parte10 en el mismo proceso y guardar la hoja para subir")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Leer los libros fila a fila con openpyxl (read_only) en vez de pd.read_excel")
+    parser.add_argument("--almacen", nargs="?", const=RUTA_ALMACEN, default=None,
+                        help="Guardar además las visitas en el almacén SQLite (por defecto "
+                             f"{RUTA_ALMACEN}), actualizando las que ya estaban")
+    parser.add_argument("--perfil", nargs="?", const="", default=None,
+                        help="Medir tiempos, llamadas y regex por etapa y extractor; con una ruta, "
+                             "guardar además el reporte en JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    if args.perfil is None:
+        return ejecutar(args)
+
+    modulos = [sys.modules[__name__]]
+    if args.excel:
+        import parte10
+        modulos.append(parte10)
+    if args.trabajadores != 1:
+        print("⚠️ Con --perfil sólo se mide el proceso principal: use --trabajadores 1 para ver los extractores")
+    perfilado.activar(*modulos, funciones_extra=[(pd, "read_excel", "lectura del libro")])
+    try:
+        ejecutar(args)
+    finally:
+        perfilado.desactivar()
+        perfilado.mostrar_reporte()
+        if args.perfil:
+            perfilado.guardar_reporte(args.perfil)
+
+
+def ejecutar(args):
+    ruta_archivo = args.origen  # Ajusta con tu ruta
+    trabajadores = args.trabajadores if args.trabajadores > 0 else (os.cpu_count() or 1)
+    es_lote = os.path.isdir(ruta_archivo) or any(c in ruta_archivo for c in "*?[")
+    ruta_salida = args.salida
+    # Libro leído en streaming hacia JSONL: cada paciente se escribe apenas se
+    # extrae, sin acumular el libro en memoria
+    en_flujo = args.streaming and not es_lote and es_ruta_jsonl(ruta_salida) and not args.excel and not args.almacen
+
+    if es_lote:
+        datos_pacientes = procesar_lote(ruta_archivo, trabajadores, args.streaming, args.cache)
+    elif en_flujo:
+        if not os.path.isfile(ruta_archivo):
+            print(f"Error: No se pudo encontrar el archivo en la ruta: {ruta_archivo}")
+            return
+        datos_pacientes = None
+    elif args.streaming:
+        datos_pacientes = {}
+        try:
+            for id_paciente, paciente_dict in extraer_pacientes_streaming(ruta_archivo):
+                mostrar_datos_organizados({id_paciente: paciente_dict})
+                datos_pacientes[id_paciente] = paciente_dict
+        except FileNotFoundError:
+            print(f"Error: No se pudo encontrar el archivo en la ruta: {ruta_archivo}")
+            return
+    else:
+        try:
+            df = pd.read_excel(ruta_archivo, header=None)
+        except FileNotFoundError:
+            print(f"Error: No se pudo encontrar el archivo en la ruta: {ruta_archivo}")
+            return
+        except Exception as e:
+            print(f"Error al leer el archivo Excel: {e}")
+            return
+
+        datos_pacientes = extraer_y_organizar_datos(df,ruta_archivo=ruta_archivo, trabajadores=trabajadores)
+        mostrar_datos_organizados(datos_pacientes)
+
+
+    # Guardar como JSON (o JSONL)
+    if en_flujo:
+        guardar_pacientes(_mostrar_a_medida(extraer_pacientes_streaming(ruta_archivo)), ruta_salida)
+    else:
+        guardar_pacientes(datos_pacientes.items(), ruta_salida)
+
+    if args.almacen:
+        if es_lote:
+            guardar_en_almacen(datos_pacientes, args.almacen)
+        else:
+            # Un solo libro sale con ids locales: el almacén usa los globales, como el lote
+            por_id_global, _, _ = fusionar_resultados([(ruta_archivo, datos_pacientes)])
+            guardar_en_almacen(por_id_global, args.almacen, os.path.basename(ruta_archivo))
+
+    # Puntuación en el mismo proceso, sin pasar por el JSON
+    if args.excel:
+        import parte10
+        hoja = parte10.puntuar_pacientes_columnar(datos_pacientes)
+        parte10.exportar_excel(hoja, args.excel)
+        print(f"✅ {len(hoja)} pacientes puntuados en {args.excel}")
+
+    # Con el pool de procesos cada trabajador tiene su propio caché
+    if any(info["aciertos"] + info["fallos"] for info in estadisticas_cache_celdas().values()):
+        print("\nCaché de celdas:")
+        mostrar_estadisticas_cache_celdas()
 
 
 if __name__ == "__main__":
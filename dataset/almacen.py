@@ -0,0 +1,312 @@
+"""
+Almacén SQLite de visitas de pacientes.
+
+El extractor guarda aquí cada paciente extraído (una fila por visita, clave
+el id global del extractor, el mismo del JSON) y el puntaje lo lee de aquí, todo o
+sólo lo nuevo desde su última lectura. A diferencia del JSON, que se
+sobrescribe en cada corrida, el almacén acumula todas las consultas y se
+puede preguntar por la historia de un paciente sin releer los libros:
+
+    python almacen.py DATOSJSON/pacientes.sqlite --historial "Ana Lucía Rodríguez"
+    python almacen.py DATOSJSON/pacientes.sqlite --cie10 M069
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from registros import a_json, normalizar_nombre
+
+RUTA_ALMACEN = os.path.join("DATOSJSON", "pacientes.sqlite")
+EXTENSIONES_ALMACEN = (".sqlite", ".sqlite3", ".db")
+
+# La clave es el id global: dos pacientes que se normalizan al mismo nombre y
+# se vieron el mismo día tienen ids distintos (ver resolver_id_global en el
+# extractor) y se guardan los dos. Nombre y fecha sólo se indexan, para el
+# historial. `version` crece en cada guardado que agrega o cambia visitas;
+# cada lector anota en `lecturas` hasta qué versión ya leyó.
+TABLA_VISITAS = """
+CREATE TABLE IF NOT EXISTS visitas (
+    id INTEGER PRIMARY KEY,
+    id_global TEXT NOT NULL UNIQUE,
+    nombre TEXT NOT NULL,
+    nombre_normalizado TEXT NOT NULL,
+    fecha_consulta TEXT NOT NULL,
+    fecha_iso TEXT NOT NULL,
+    diagnostico TEXT,
+    codigo_cie10 TEXT,
+    libro TEXT,
+    version INTEGER NOT NULL,
+    actualizado REAL NOT NULL,
+    paciente TEXT NOT NULL
+);
+"""
+ESQUEMA = TABLA_VISITAS + """
+CREATE INDEX IF NOT EXISTS idx_visitas_nombre ON visitas (nombre_normalizado, fecha_consulta);
+CREATE INDEX IF NOT EXISTS idx_visitas_fecha ON visitas (fecha_iso);
+CREATE INDEX IF NOT EXISTS idx_visitas_diagnostico ON visitas (diagnostico);
+CREATE INDEX IF NOT EXISTS idx_visitas_cie10 ON visitas (codigo_cie10);
+CREATE INDEX IF NOT EXISTS idx_visitas_version ON visitas (version);
+CREATE TABLE IF NOT EXISTS lecturas (
+    consumidor TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# Sólo se toca la fila (y su versión) si el paciente cambió
+SQL_GUARDAR = """
+INSERT INTO visitas (id_global, nombre, nombre_normalizado, fecha_consulta, fecha_iso, diagnostico,
+                     codigo_cie10, libro, version, actualizado, paciente)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id_global) DO UPDATE SET
+    nombre = excluded.nombre,
+    nombre_normalizado = excluded.nombre_normalizado,
+    diagnostico = excluded.diagnostico,
+    codigo_cie10 = excluded.codigo_cie10,
+    libro = COALESCE(excluded.libro, visitas.libro),
+    version = excluded.version,
+    actualizado = excluded.actualizado,
+    paciente = excluded.paciente
+WHERE visitas.paciente IS NOT excluded.paciente
+"""
+
+# Al sincronizar un resultado ya fusionado también cuenta de qué libro viene la visita
+SQL_SINCRONIZAR = """
+INSERT INTO visitas (id_global, nombre, nombre_normalizado, fecha_consulta, fecha_iso, diagnostico,
+                     codigo_cie10, libro, version, actualizado, paciente)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id_global) DO UPDATE SET
+    nombre = excluded.nombre,
+    nombre_normalizado = excluded.nombre_normalizado,
+    diagnostico = excluded.diagnostico,
+    codigo_cie10 = excluded.codigo_cie10,
+    libro = excluded.libro,
+    version = excluded.version,
+    actualizado = excluded.actualizado,
+    paciente = excluded.paciente
+WHERE visitas.paciente IS NOT excluded.paciente OR visitas.libro IS NOT excluded.libro
+"""
+
+
+def es_ruta_almacen(ruta: str) -> bool:
+    return ruta.lower().endswith(EXTENSIONES_ALMACEN)
+
+
+def abrir_almacen(ruta: str = RUTA_ALMACEN) -> sqlite3.Connection:
+    """Abre (y si hace falta crea) el almacén. En modo WAL se puede leer mientras el extractor escribe."""
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    conexion = sqlite3.connect(ruta)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    _migrar_a_id_global(conexion)
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def _migrar_a_id_global(conexion: sqlite3.Connection):
+    """
+    Los almacenes anteriores usaban nombre normalizado + fecha como clave. Se
+    rehace la tabla con el id global, que para esas visitas es el mismo que
+    calcula generar_id_global del extractor a partir del nombre y la fecha.
+    """
+    columnas = [columna for _, columna, *_ in conexion.execute("PRAGMA table_info(visitas)")]
+    if not columnas or "id_global" in columnas:
+        return
+    conexion.create_function(
+        "id_global", 2, lambda nombre, fecha: hashlib.sha1(f"{nombre}|{fecha}".encode("utf-8")).hexdigest()[:16])
+    with conexion:
+        conexion.execute("BEGIN IMMEDIATE")
+        conexion.execute("ALTER TABLE visitas RENAME TO visitas_anteriores")
+        conexion.execute(TABLA_VISITAS)
+        conexion.execute(
+            "INSERT INTO visitas (id, id_global, nombre, nombre_normalizado, fecha_consulta, fecha_iso, diagnostico, "
+            "codigo_cie10, libro, version, actualizado, paciente) "
+            "SELECT id, id_global(nombre_normalizado, fecha_consulta), nombre, nombre_normalizado, fecha_consulta, "
+            "fecha_iso, diagnostico, codigo_cie10, libro, version, actualizado, paciente FROM visitas_anteriores")
+        conexion.execute("DROP TABLE visitas_anteriores")
+    print("✅ Almacén migrado: las visitas ahora se identifican por el id global del extractor")
+
+
+def fecha_iso(fecha_consulta) -> str:
+    """"dd-mm-aaaa" -> "aaaa-mm-dd", para ordenar y filtrar por rango en SQL ("" si no tiene esa forma)."""
+    partes = str(fecha_consulta).split("-")
+    if len(partes) != 3:
+        return ""
+    dia, mes, anio = partes
+    return f"{anio}-{mes}-{dia}"
+
+
+def _texto(valor):
+    return valor if isinstance(valor, str) else None
+
+
+def _guardar(conexion: sqlite3.Connection, visitas, sql: str) -> tuple:
+    """
+    Inserta o actualiza [(id_global, paciente, libro)] dentro de la
+    transacción abierta. Devuelve (conteo, ids guardados).
+    """
+    conteo = {"nuevas": 0, "actualizadas": 0, "sin_cambios": 0, "descartadas": 0}
+    total_antes = conexion.execute("SELECT COUNT(*) FROM visitas").fetchone()[0]
+    version = conexion.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM visitas").fetchone()[0]
+    ahora = time.time()
+    vistas = set()
+    modificadas = 0
+    for id_global, paciente, libro in visitas:
+        id_global = str(id_global)
+        if id_global in vistas:
+            conteo["descartadas"] += 1
+            continue
+        vistas.add(id_global)
+        # Los bloques sin nombre o sin fecha también tienen id: se guardan con "" en esas columnas
+        nombre = paciente.get("nombre")
+        nombre = nombre if isinstance(nombre, str) else ""
+        fecha = paciente.get("fecha_consulta")
+        fecha = str(fecha) if fecha else ""
+        cursor = conexion.execute(sql, (
+            id_global, nombre, normalizar_nombre(nombre), fecha, fecha_iso(fecha),
+            _texto(paciente.get("diagnostico")), _texto(paciente.get("codigo_cie10")),
+            libro, version, ahora,
+            json.dumps(paciente, ensure_ascii=False, default=a_json),
+        ))
+        modificadas += cursor.rowcount
+    total_despues = conexion.execute("SELECT COUNT(*) FROM visitas").fetchone()[0]
+
+    conteo["nuevas"] = total_despues - total_antes
+    conteo["actualizadas"] = modificadas - conteo["nuevas"]
+    conteo["sin_cambios"] = len(vistas) - modificadas
+    return conteo, vistas
+
+
+def guardar_visitas(conexion: sqlite3.Connection, pacientes, libro=None) -> dict:
+    """
+    Inserta o actualiza las visitas de un iterable de pares (id_global,
+    paciente) (p. ej. los items del resultado del extractor; el paciente es un
+    diccionario o un PacienteRegistro) en una sola transacción. Si el mismo
+    id aparece dos veces se conserva el primero. Devuelve cuántas visitas
+    fueron nuevas, actualizadas, sin cambios y descartadas.
+    """
+    with conexion:
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer MAX(version):
+        # dos escritores (el vigilante y una corrida del extractor) no pueden
+        # obtener la misma versión, y una versión se confirma con todas sus filas
+        conexion.execute("BEGIN IMMEDIATE")
+        conteo, _ = _guardar(conexion, ((id_global, paciente, libro) for id_global, paciente in pacientes),
+                             SQL_GUARDAR)
+    return conteo
+
+
+def sincronizar_libros(conexion: sqlite3.Connection, visitas, libros) -> dict:
+    """
+    Deja el almacén de acuerdo con un resultado ya fusionado: inserta o
+    actualiza las visitas [(id_global, paciente, libro)] (también si sólo cambió el
+    libro del que vienen) y borra las visitas de `libros` (los que cambiaron
+    o se quitaron) que ya no están en el resultado. Todo en una transacción.
+    Devuelve el conteo de guardar_visitas más las visitas quitadas.
+    """
+    with conexion:
+        conexion.execute("BEGIN IMMEDIATE")
+        conteo, ids = _guardar(conexion, visitas, SQL_SINCRONIZAR)
+        sobrantes = [
+            (id_visita,)
+            for libro in libros
+            for id_visita, id_global in conexion.execute(
+                "SELECT id, id_global FROM visitas WHERE libro = ?", (libro,))
+            if id_global not in ids
+        ]
+        conexion.executemany("DELETE FROM visitas WHERE id = ?", sobrantes)
+    conteo["quitadas"] = len(sobrantes)
+    return conteo
+
+
+def _pacientes(filas):
+    return [json.loads(paciente) for (paciente,) in filas]
+
+
+def historial_paciente(conexion: sqlite3.Connection, nombre: str) -> list:
+    """Todas las visitas de un paciente (por nombre normalizado), de la más antigua a la más reciente."""
+    return _pacientes(conexion.execute(
+        "SELECT paciente FROM visitas WHERE nombre_normalizado = ? ORDER BY fecha_iso",
+        (normalizar_nombre(nombre),)))
+
+
+def visitas_por_cie10(conexion: sqlite3.Connection, codigo: str, desde=None, hasta=None) -> list:
+    """Visitas con ese código CIE-10, opcionalmente entre dos fechas "aaaa-mm-dd" (inclusive)."""
+    return _pacientes(conexion.execute(
+        "SELECT paciente FROM visitas WHERE codigo_cie10 = ? AND fecha_iso BETWEEN ? AND ? "
+        "ORDER BY fecha_iso, nombre_normalizado",
+        (codigo, desde or "", hasta or "9999-99-99")))
+
+
+def todas_las_visitas(conexion: sqlite3.Connection) -> list:
+    return _pacientes(conexion.execute("SELECT paciente FROM visitas ORDER BY fecha_iso, nombre_normalizado"))
+
+
+def visitas_nuevas(conexion: sqlite3.Connection, consumidor: str):
+    """
+    Visitas agregadas o cambiadas desde la última lectura confirmada de
+    `consumidor`. Devuelve (pacientes, version): la versión se pasa a
+    confirmar_lectura una vez procesados los pacientes.
+    """
+    fila = conexion.execute("SELECT version FROM lecturas WHERE consumidor = ?", (consumidor,)).fetchone()
+    desde = fila[0] if fila else 0
+    version = conexion.execute("SELECT COALESCE(MAX(version), 0) FROM visitas").fetchone()[0]
+    pacientes = _pacientes(conexion.execute(
+        "SELECT paciente FROM visitas WHERE version > ? AND version <= ? ORDER BY fecha_iso, nombre_normalizado",
+        (desde, version)))
+    return pacientes, version
+
+
+def confirmar_lectura(conexion: sqlite3.Connection, consumidor: str, version: int):
+    with conexion:
+        conexion.execute(
+            "INSERT INTO lecturas (consumidor, version) VALUES (?, ?) "
+            "ON CONFLICT (consumidor) DO UPDATE SET version = excluded.version",
+            (consumidor, version))
+
+
+def mostrar_visitas(pacientes):
+    if not pacientes:
+        print("No se encontraron visitas.")
+        return
+    for paciente in pacientes:
+        print(f"{paciente.get('fecha_consulta')}  {paciente.get('nombre')}  "
+              f"{paciente.get('diagnostico')} ({paciente.get('codigo_cie10')})  "
+              f"adherencia: {paciente.get('adherencia_global')}  "
+              f"{paciente.get('clinimetria_tipo')}: {paciente.get('clinimetria_valor')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas sobre el almacén de visitas.")
+    parser.add_argument("almacen", nargs="?", default=RUTA_ALMACEN, help="Archivo SQLite del almacén")
+    parser.add_argument("--historial", default=None, help="Visitas de un paciente por nombre")
+    parser.add_argument("--cie10", default=None, help="Visitas con un código CIE-10")
+    parser.add_argument("--desde", default=None, help="Con --cie10: fecha mínima aaaa-mm-dd")
+    parser.add_argument("--hasta", default=None, help="Con --cie10: fecha máxima aaaa-mm-dd")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.almacen):
+        print(f"❌ No existe el almacén {args.almacen}")
+        return
+    conexion = abrir_almacen(args.almacen)
+    try:
+        inicio = time.perf_counter()
+        if args.historial:
+            pacientes = historial_paciente(conexion, args.historial)
+        elif args.cie10:
+            pacientes = visitas_por_cie10(conexion, args.cie10, args.desde, args.hasta)
+        else:
+            total, pacientes_distintos = conexion.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT nombre_normalizado) FROM visitas").fetchone()
+            print(f"{total} visitas de {pacientes_distintos} pacientes en {args.almacen}")
+            return
+        mostrar_visitas(pacientes)
+        print(f"\n{len(pacientes)} visitas ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+    finally:
+        conexion.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Mide cuántas fechas por segundo convierte el motor de fechas de parte10
+(parsear_fecha) frente a la conversión anterior, que probaba los formatos de
+strptime uno por uno dentro de try/except.
+
+Uso:
+    python benchmark_fechas.py [--fechas 200000] [--repeticiones 3]
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+
+from parte10 import parsear_fecha
+
+
+# Conversión anterior, se conserva sólo como referencia para la comparación
+FORMATOS_ANTERIORES = [
+    "%d/%m/%Y", "%d-%m-%Y",
+    "%d/%m/%y", "%d-%m-%y",
+    "%m/%Y", "%m-%Y",
+    "%m/%y", "%m-%y",
+    "%Y", "%y"
+]
+
+
+def parsear_fecha_anterior(fecha_str):
+    fecha_str = fecha_str.strip()
+    fecha = None
+    for fmt in FORMATOS_ANTERIORES:
+        try:
+            fecha = datetime.strptime(fecha_str, fmt)
+            break
+        except ValueError:
+            continue
+    if fecha is None and re.match(r"^\d{2}$", fecha_str):
+        year = int(fecha_str)
+        year += 2000 if year < 50 else 1900
+        fecha = datetime(year, 1, 1)
+    return fecha
+
+
+def generar_fechas(cantidad, semilla=0):
+    """Textos con la mezcla de formas que salen de los tratamientos (incluye no-fechas)."""
+    aleatorio = random.Random(semilla)
+    formas = [
+        lambda: f"{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/{aleatorio.randint(2010, 2025)}",
+        lambda: f"{aleatorio.randint(1, 28)}-{aleatorio.randint(1, 12)}-{aleatorio.randint(10, 25)}",
+        lambda: f"{aleatorio.randint(1, 12):02d}/{aleatorio.randint(10, 25)}",
+        lambda: f"{aleatorio.randint(1, 12)}-{aleatorio.randint(2010, 2025)}",
+        lambda: str(aleatorio.randint(2010, 2025)),
+        lambda: f"{aleatorio.randint(10, 99)}",
+        lambda: f"{aleatorio.randint(1, 31)}/{aleatorio.randint(13, 40)}",  # parece fecha pero no lo es
+    ]
+    return [aleatorio.choice(formas)() for _ in range(cantidad)]
+
+
+def medir(funcion, fechas, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for fecha_str in fechas:
+            funcion(fecha_str)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return len(fechas) / mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Velocidad de conversión de fechas: strptime vs parsear_fecha.")
+    parser.add_argument("--fechas", type=int, default=200000, help="Cantidad de textos a convertir.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se reporta la mejor de N repeticiones.")
+    args = parser.parse_args()
+
+    fechas = generar_fechas(args.fechas)
+
+    # Ambas conversiones deben dar exactamente el mismo resultado
+    diferentes = sum(parsear_fecha_anterior(f) != parsear_fecha(f) for f in fechas)
+    if diferentes:
+        print(f"❌ {diferentes} fechas convertidas de forma distinta")
+        return
+
+    antes = medir(parsear_fecha_anterior, fechas, args.repeticiones)
+    despues = medir(parsear_fecha, fechas, args.repeticiones)
+    print(f"strptime (anterior): {antes:>12,.0f} fechas/s")
+    print(f"parsear_fecha:       {despues:>12,.0f} fechas/s")
+    print(f"✅ {despues / antes:.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Mide la calidad y la velocidad de la resolución de identidad (identidad.py)
+sobre visitas sintéticas con el nombre escrito de distintas formas: sin
+tildes, en mayúsculas, con espacios de más, sin el segundo apellido o con un
+error de digitación.
+
+Como se sabe a qué persona pertenece cada visita se calculan precisión y
+recall por pares de visitas (un par es correcto si las dos visitas son de la
+misma persona y quedaron juntas). Aparte se reporta el recall de los nombres
+de dos tokens con un error de digitación ("JUAN PEREX" frente a "JUAN
+PEREZ"), el caso que más depende de las claves de bloqueo. Antes de medir
+se verifica que los grupos no dependan de PYTHONHASHSEED (el orden de los
+conjuntos cambia entre corridas y los ids de persona no deben cambiar).
+
+Uso:
+    python benchmark_identidad.py [--personas 20000] [--visitas 60000]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import unicodedata
+from collections import Counter
+from math import comb
+
+from identidad import normalizar_para_comparar, resolver_personas
+
+NOMBRES = [
+    "María José", "Juan Carlos", "Ana Lucía", "Pedro Nel", "Luz Marina", "José Ángel", "Carmen Rosa",
+    "Luis Fernando", "Gloria Inés", "Jorge Eliécer", "Martha Cecilia", "Diego Alejandro", "Sofía",
+    "Valentina", "Camilo", "Andrés Felipe", "Yolanda", "Héctor", "Beatriz", "Rubén Darío", "Zoila",
+    "Víctor Hugo", "Gilberto", "Cecilia", "Esperanza", "Olga Lucía", "Nelly", "Álvaro", "Hernando", "Fabio",
+]
+APELLIDOS = [
+    "Pérez", "Gómez", "Rodríguez", "Suárez", "Díaz", "Niño", "Torres", "Martínez", "Rojas", "Castañeda",
+    "Moreno", "Vargas", "Quintero", "Barrera", "Sánchez", "Cárdenas", "Velásquez", "Zambrano", "Chaparro",
+    "Villamil", "Hurtado", "Guevara", "Bohórquez", "Cely", "Ávila", "Pinzón", "Galindo", "Benavides",
+    "Lizarazo", "Ochoa", "Vega", "Salamanca", "Rincón", "Acosta", "Medina", "Parra",
+]
+PROPORCION_DOS_TOKENS = 0.2   # personas registradas con un solo nombre y un solo apellido
+
+# Nombres abreviados encadenados: el resultado dependía del orden de un conjunto
+NOMBRES_ORDEN_FIJO = [
+    "LUZ MARINA ACOSTA", "LUZ MARINA ACOSTA ROJAS", "LUZ MARINA ACOSTA VEGA", "LUZ MARINA ACOSTA ROJAS VEGA",
+]
+SEMILLAS_HASH = range(1, 11)
+
+
+def _sin_tildes(nombre):
+    return unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode("ascii")
+
+
+def _con_error(nombre, aleatorio):
+    """Una letra cambiada, borrada o duplicada (nunca la primera ni la última)."""
+    letras = list(nombre)
+    posicion = aleatorio.randrange(1, len(letras) - 1)
+    operacion = aleatorio.choice("cbd")
+    if operacion == "c":
+        letras[posicion] = aleatorio.choice("aeiourlnm")
+    elif operacion == "b":
+        del letras[posicion]
+    else:
+        letras.insert(posicion, letras[posicion])
+    return "".join(letras)
+
+
+def variante(nombre, aleatorio):
+    """(nombre como se escribió en la visita, si tiene un error de digitación)."""
+    r = aleatorio.random()
+    if r < 0.5:
+        return nombre, False
+    if r < 0.6:
+        return _sin_tildes(nombre), False
+    if r < 0.7:
+        return nombre.upper(), False
+    if r < 0.78:
+        return "  " + nombre.replace(" ", "  ") + " ", False
+    if r < 0.88 and len(nombre.split()) > 2:
+        return " ".join(nombre.split()[:-1]), False
+    return _con_error(nombre, aleatorio), True
+
+
+def generar_visitas(personas, visitas, semilla=1):
+    """({id_visita: paciente}, {id_visita: persona real}, ids de visitas de dos tokens con error)."""
+    aleatorio = random.Random(semilla)
+    nombres = set()
+    for _ in range(personas):
+        if aleatorio.random() < PROPORCION_DOS_TOKENS:
+            nombre = f"{aleatorio.choice(NOMBRES).split()[0]} {aleatorio.choice(APELLIDOS)}"
+        else:
+            nombre = f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}"
+        nombres.add(nombre)
+    nombres = sorted(nombres)
+
+    pacientes, verdad, dos_tokens_con_error = {}, {}, set()
+    for id_visita in range(visitas):
+        persona = aleatorio.randrange(len(nombres))
+        nombre, con_error = variante(nombres[persona], aleatorio)
+        pacientes[id_visita] = {
+            "nombre": nombre,
+            "fecha_consulta": f"{aleatorio.randint(1, 28):02d}-{aleatorio.randint(1, 12):02d}-"
+                              f"{aleatorio.randint(2023, 2025)}",
+        }
+        verdad[id_visita] = persona
+        if con_error and len(nombres[persona].split()) == len(normalizar_para_comparar(nombre).split()) == 2:
+            dos_tokens_con_error.add(id_visita)
+    return pacientes, verdad, dos_tokens_con_error
+
+
+def calidad_por_pares(verdad, asignadas):
+    """(precisión, recall) por pares de visitas."""
+    juntas_bien = sum(comb(n, 2) for n in Counter((verdad[v], asignadas[v]) for v in verdad).values())
+    juntas = sum(comb(n, 2) for n in Counter(asignadas[v] for v in verdad).values())
+    reales = sum(comb(n, 2) for n in Counter(verdad.values()).values())
+    return juntas_bien / juntas if juntas else 1.0, juntas_bien / reales if reales else 1.0
+
+
+def recall_visitas_con_error(verdad, asignadas, visitas_con_error):
+    """Proporción de visitas con error unidas a alguna otra visita (sin error) de su persona."""
+    por_persona = {}
+    for id_visita, persona in verdad.items():
+        if id_visita not in visitas_con_error:
+            por_persona.setdefault(persona, set()).add(asignadas[id_visita])
+    evaluables = [v for v in visitas_con_error if verdad[v] in por_persona]
+    unidas = sum(asignadas[v] in por_persona[verdad[v]] for v in evaluables)
+    return unidas / len(evaluables) if evaluables else 1.0, len(evaluables)
+
+
+def verificar_orden_fijo(nombres=NOMBRES_ORDEN_FIJO, semillas=SEMILLAS_HASH) -> bool:
+    """Agrupa `nombres` con varios PYTHONHASHSEED (un proceso por semilla) y compara los resultados."""
+    codigo = ("import json, sys; from identidad import agrupar_nombres; "
+              "print(json.dumps(agrupar_nombres(json.loads(sys.argv[1]))[0], sort_keys=True))")
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    resultados = set()
+    for semilla in semillas:
+        entorno = {**os.environ, "PYTHONHASHSEED": str(semilla), "PYTHONWARNINGS": "ignore"}
+        salida = subprocess.run([sys.executable, "-c", codigo, json.dumps(nombres)], cwd=carpeta, env=entorno,
+                                capture_output=True, text=True, check=True).stdout
+        resultados.add(salida.strip())
+    if len(resultados) != 1:
+        print(f"❌ Los grupos cambian con PYTHONHASHSEED: {len(resultados)} resultados distintos "
+              f"en {len(semillas)} corridas")
+        return False
+    personas = len(set(json.loads(resultados.pop()).values()))
+    print(f"✅ Mismos grupos con {len(semillas)} valores de PYTHONHASHSEED ({personas} persona(s))")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precisión, recall y velocidad de la resolución de identidad.")
+    parser.add_argument("--personas", type=int, default=20000, help="Personas sintéticas.")
+    parser.add_argument("--visitas", type=int, default=60000, help="Visitas sintéticas.")
+    args = parser.parse_args()
+
+    verificar_orden_fijo()
+    pacientes, verdad, dos_tokens_con_error = generar_visitas(args.personas, args.visitas)
+    inicio = time.perf_counter()
+    asignadas, estadisticas = resolver_personas(pacientes)
+    segundos = time.perf_counter() - inicio
+
+    precision, recall = calidad_por_pares(verdad, asignadas)
+    recall_dos_tokens, evaluables = recall_visitas_con_error(verdad, asignadas, dos_tokens_con_error)
+    print(f"{len(pacientes)} visitas, {estadisticas['nombres']} nombres distintos, "
+          f"{len(set(verdad.values()))} personas reales, {estadisticas['personas']} encontradas")
+    print(f"Precisión por pares: {precision:.3f}   recall por pares: {recall:.3f}   ({segundos:.2f} s)")
+    print(f"Nombres de dos tokens con un error: {recall_dos_tokens:.3f} unidos a su persona "
+          f"({evaluables} visitas)")
+
+
+if __name__ == "__main__":
+    main()
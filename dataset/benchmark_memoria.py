@@ -0,0 +1,86 @@
+"""
+Memoria que ocupan los pacientes y las filas puntuadas como diccionarios
+frente a PacienteRegistro (registros.py) y FilaPuntuada (parte10), medida
+con tracemalloc sobre pacientes sintéticos (los textos de benchmark_pipeline).
+También comprueba que la conversión no pierde nada.
+
+Uso:
+    python benchmark_memoria.py [--pacientes 50000]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+
+import ExtraerDatosDelExcel as extractor
+import parte10
+from benchmark_pipeline import APELLIDOS, NOMBRES, texto_clinimetria, texto_evaluacion, texto_objetivo
+from registros import compactar_paciente
+
+
+def generar_pacientes(cantidad, semilla=0):
+    aleatorio = random.Random(semilla)
+    pacientes = {}
+    for id_paciente in range(cantidad):
+        nombre = f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}"
+        fecha = f"{aleatorio.randint(1, 28):02d}-{aleatorio.randint(1, 12):02d}-2025"
+        pacientes[id_paciente] = extractor.construir_paciente(
+            nombre, texto_objetivo(aleatorio), aleatorio.choice(["FEMENINO", "MASCULINO"]),
+            texto_evaluacion(aleatorio), texto_clinimetria(aleatorio), fecha)
+    return pacientes
+
+
+def memoria_retenida(construir):
+    """Bytes que siguen asignados después de construir() (lo que ocupa su resultado)."""
+    gc.collect()
+    tracemalloc.start()
+    resultado = construir()
+    gc.collect()
+    retenidos, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, retenidos
+
+
+def mostrar(titulo, antes, despues, cantidad):
+    print(f"{titulo}")
+    print(f"  diccionarios: {antes / 2**20:>9.1f} MiB ({antes / cantidad:>7.0f} B c/u)")
+    print(f"  compacto:     {despues / 2**20:>9.1f} MiB ({despues / cantidad:>7.0f} B c/u)")
+    print(f"  ✅ {antes / despues:.1f}x menos memoria")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria de pacientes y filas: diccionarios vs registros compactos.")
+    parser.add_argument("--pacientes", type=int, default=50000, help="Cantidad de pacientes sintéticos.")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta_json = os.path.join(carpeta, "datos_pacientes.json")
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(generar_pacientes(args.pacientes, args.semilla), f, ensure_ascii=False)
+
+        # El archivo completo cargado, como lo lee parte10
+        dicts, memoria_dicts = memoria_retenida(lambda: parte10.cargar_pacientes(ruta_json, compacto=False))
+        registros, memoria_registros = memoria_retenida(lambda: parte10.cargar_pacientes(ruta_json))
+
+    perdidos = sum(registro.a_dict() != original or list(registro) != list(original)
+                   for registro, original in zip(registros.values(), dicts.values()))
+    if perdidos:
+        print(f"❌ {perdidos} pacientes no se recuperan igual desde el registro compacto")
+        return
+
+    filas, memoria_filas = memoria_retenida(lambda: parte10.puntuar_pacientes(registros))
+    filas_dict, memoria_filas_dict = memoria_retenida(lambda: [fila.a_dict() for fila in filas])
+    if any(fila != fila_dict for fila, fila_dict in zip(filas, filas_dict)):
+        print("❌ Hay filas puntuadas que no se recuperan igual")
+        return
+
+    mostrar(f"Pacientes cargados ({len(registros)})", memoria_dicts, memoria_registros, len(registros))
+    mostrar(f"Filas puntuadas ({len(filas)})", memoria_filas_dict, memoria_filas, len(filas))
+
+
+if __name__ == "__main__":
+    main()
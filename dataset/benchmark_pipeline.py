@@ -0,0 +1,305 @@
+"""
+Benchmark del flujo completo sobre libros de entrevistas sintéticos.
+
+Genera libros con el mismo formato que leen ExtraerDatosDelExcel y parte10
+(bloques de 7 filas, pacientes en las tripletas de columnas (2,3,4), (7,8,9)
+y (12,13,14), fecha de consulta en el nombre del archivo) y mide cada etapa:
+lectura del libro, localización de bloques, cada extractor de campos, armado
+de los pacientes, puntuación y exportación de la hoja para subir.
+
+Los resultados se imprimen como tabla y se guardan en JSON para comparar
+corridas entre versiones:
+
+    python benchmark_pipeline.py --tamanos 1000 10000 100000 --salida bench.json
+    python benchmark_pipeline.py --tamanos 1000 --comparar bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+
+import ExtraerDatosDelExcel as extractor
+import parte10
+
+TRIPLETAS = [(2, 3, 4), (7, 8, 9), (12, 13, 14)]
+FILAS_POR_BLOQUE = 7
+ANCHO_HOJA = 15
+
+# Una etapa más lenta que esto respecto de la corrida anterior se marca
+UMBRAL_REGRESION = 1.20
+
+# ---------------------------------------------------------------------------
+# Textos sintéticos
+# ---------------------------------------------------------------------------
+
+NOMBRES = ["María José", "Juan Carlos", "Ana Lucía", "Pedro Nel", "Luz Marina", "José Ángel", "Carmen Rosa",
+           "Luis Fernando", "Gloria Inés", "Jorge Eliécer", "Martha Cecilia", "Diego Alejandro"]
+APELLIDOS = ["Pérez", "Gómez", "Rodríguez", "Suárez", "Díaz", "Niño", "Torres", "Martínez", "Rojas", "Castañeda",
+             "Moreno", "Vargas", "Quintero", "Barrera", "Sánchez", "Cárdenas"]
+DIAGNOSTICOS = [("artritis reumatoide", "M069"), ("lupus eritematoso sistémico", "M329"),
+                ("espondilitis anquilosante", "M45X"), ("artritis psoriásica", "L405"),
+                ("artritis reumatoide seropositiva", "M059")]
+OTROS_DIAGNOSTICOS = ["HTA", "diabetes mellitus tipo 2", "hipotiroidismo", "gastritis crónica", "osteoporosis",
+                      "artrosis de rodilla", "cáncer de mama en remisión", "migraña", "insuficiencia renal crónica",
+                      "hígado graso", "dolor lumbar", "ansiedad", "hipertensión arterial", "dislipidemia",
+                      "síndrome de Sjögren", "colon irritable"]
+MEDICAMENTOS = [("metotrexato", ["15 mg semanal", "20 mg semanal", "10 mg vo"]),
+                ("metotrexato sc", ["20 mg semanal", "25 mg"]),
+                ("adalimumab", ["40 mg sc cada 15 días"]), ("etanercept", ["50 mg semanal"]),
+                ("tofacitinib", ["5 mg vo c/12h"]), ("baricitinib", ["4 mg día"]),
+                ("leflunomida", ["20 mg día"]), ("hidroxicloroquina", ["200 mg día", "400 mg día"]),
+                ("prednisolona", ["5 mg día", "7.5 mg día"]), ("rituximab", ["1 g cada 6 meses"]),
+                ("sulfasalazina", ["500 mg c/12h"]), ("tocilizumab", ["162 mg sc semanal"]),
+                ("azatioprina", ["50 mg 2 tabletas"]), ("ácido fólico", ["1 mg día"]),
+                ("vita D", ["1000 ui día"]), ("calcio + vitamina d", ["600/400 mg"]),
+                ("omeprazol", ["20 mg día"]), ("losartan", ["50 mg c/12h"]), ("acetaminofén", ["500 mg si dolor"])]
+ESCOLARIDAD = ["Bachiller", "Primaria completa", "Primaria incompleta", "Profesional", "Técnico en sistemas",
+               "Tecnólogo", "Analfabeta", "Maestría", "Bachillerato incompleto"]
+CONSUMO = ["Niega", "Niega", "Niega", "Ocasional", "Sí, social", "Exfumador hace 10 años"]
+RAM = ["RAM: Niega", "RAM: náuseas con metotrexato", "RAM: Niega", "RAM - niega", "RAM: cefalea con leflunomida"]
+INTERACCIONES = ["ninguna", "ninguna", "metotrexato - omeprazol", "leflunomida con warfarina",
+                 "hidroxicloroquina y losartan", "Ninguna"]
+ADHERENCIA = ["Adherente", "Adherente", "Parcialmente adherente", "No adherente", "Totalmente adherente"]
+DISPENSACION = ["", "Dispensado sin problemas",
+                "La EPS no ha entregado el medicamento, paciente parcialmnte adherente por demora en la entrega",
+                "Refiere pendiente de entrega por la IPS, parcialmente cumplido",
+                "No adherente porque no ha recibido el medicamento"]
+CLINIMETRIAS = ["DAS28 PCR: {:.2f}", "DAS28 VSG {:.2f}", "DAS-28: {:.1f}", "SLEDAI: {:.0f}", "SLEDAI {:.0f}",
+                "ASDAS {:.1f}", "No aplica"]
+
+
+def _fecha_inicio(aleatorio):
+    anio = aleatorio.randint(2015, 2025)
+    mes = aleatorio.randint(1, 12)
+    return aleatorio.choice([
+        f"{aleatorio.randint(1, 28):02d}/{mes:02d}/{anio}",
+        f"{mes:02d}/{anio}",
+        f"{mes:02d}-{str(anio)[2:]}",
+        str(anio),
+        "aún no iniciado",
+    ])
+
+
+def texto_objetivo(aleatorio):
+    medicamentos = aleatorio.sample(MEDICAMENTOS, aleatorio.randint(1, 6))
+    lineas = []
+    for nombre, dosis in medicamentos:
+        linea = f"- {nombre} {aleatorio.choice(dosis)}"
+        if aleatorio.random() < 0.6:
+            linea += f" desde {_fecha_inicio(aleatorio)}"
+        lineas.append(linea)
+
+    otros = aleatorio.sample(OTROS_DIAGNOSTICOS, aleatorio.randint(0, 4))
+    partes = [
+        "Otros diagnósticos: " + (", ".join(otros) if otros else "Niega"),
+        "Tratamiento principal:\n" + "\n".join(lineas),
+    ]
+    if aleatorio.random() < 0.7:
+        partes.append("Conciliación medicamentosa: " + aleatorio.choice(
+            ["sin cambios", "se ajusta dosis de prednisolona", "se suspende omeprazol"]))
+    partes += [
+        "Nivel de escolaridad: " + aleatorio.choice(ESCOLARIDAD),
+        "Consumo de alcohol: " + aleatorio.choice(CONSUMO),
+        "Consumo de tabaco: " + aleatorio.choice(CONSUMO),
+        "Consumo de sustancias psicoactivas: " + aleatorio.choice(CONSUMO),
+        "Hospitalización en los últimos 6 meses: " + aleatorio.choice(["No", "No", "Sí, por neumonía"]),
+    ]
+    # Las secciones van separadas por una línea en blanco, como en las entrevistas
+    return "\n\n".join(partes)
+
+
+def texto_evaluacion(aleatorio):
+    diagnostico, cie10 = aleatorio.choice(DIAGNOSTICOS)
+    return (
+        f"Paciente de {aleatorio.randint(16, 88)} años con diagnóstico de {diagnostico} ({cie10}), "
+        f"{aleatorio.choice(RAM)}\n"
+        f"Interacciones farmacológicas significativas: {aleatorio.choice(INTERACCIONES)}\n"
+        f"Test Morisky Green: {aleatorio.choice(ADHERENCIA)}\n"
+        f"{aleatorio.choice(DISPENSACION)}"
+    )
+
+
+def texto_clinimetria(aleatorio):
+    return aleatorio.choice(CLINIMETRIAS).format(aleatorio.uniform(0.5, 7.5) if aleatorio.random() < 0.7
+                                                 else aleatorio.uniform(0, 30))
+
+
+def generar_libro(ruta_archivo, pacientes, semilla=0):
+    """
+    Escribe un libro sintético con `pacientes` bloques, tres por cada grupo de
+    7 filas, y devuelve la ruta. El nombre del archivo debería llevar la fecha
+    de consulta (CIUDAD-dd-mm-aaaa.xlsx) como los libros reales.
+    """
+    aleatorio = random.Random(semilla)
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+
+    restantes = pacientes
+    while restantes > 0:
+        filas = [[None] * ANCHO_HOJA for _ in range(FILAS_POR_BLOQUE)]
+        for col1, col2, col3 in TRIPLETAS[:restantes]:
+            filas[0][col1] = (f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} "
+                              f"{aleatorio.choice(APELLIDOS)}")
+            filas[2][col2] = texto_objetivo(aleatorio)
+            filas[2][col3] = aleatorio.choice(["FEMENINO", "MASCULINO", "Femenino, 54 años", None])
+            filas[4][col1] = texto_evaluacion(aleatorio)
+            filas[6][col1] = texto_clinimetria(aleatorio)
+        for fila in filas:
+            hoja.append(fila)
+        restantes -= len(TRIPLETAS)
+
+    libro.save(ruta_archivo)
+    return ruta_archivo
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+
+def _limpiar_caches():
+    for extractor_memo in (extractor.extraer_datos_evaluacion, extractor.extraer_info_relevante_objetivo,
+                           extractor.extraer_clinimetrias):
+        extractor_memo.limpiar_cache()
+
+
+def medir_flujo(ruta_archivo, carpeta):
+    """Corre cada etapa del flujo sobre el libro y devuelve {etapa: segundos} y el total de pacientes."""
+    etapas = {}
+
+    def cronometrar(etapa, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        etapas[etapa] = time.perf_counter() - inicio
+        return resultado
+
+    df = cronometrar("lectura", pd.read_excel, ruta_archivo, header=None)
+    bloques = cronometrar("bloques", extractor.localizar_bloques, df, FILAS_POR_BLOQUE, TRIPLETAS)
+
+    # Cada extractor con su caché vacío, sobre la celda que le corresponde en cada bloque
+    campos = {
+        "extractor_objetivo": (extractor.extraer_info_relevante_objetivo, 1),
+        "extractor_evaluacion": (extractor.extraer_datos_evaluacion, 3),
+        "extractor_clinimetrias": (extractor.extraer_clinimetrias, 4),
+    }
+    for etapa, (funcion, indice) in campos.items():
+        _limpiar_caches()
+        cronometrar(etapa, lambda: [funcion(bloque[indice]) for bloque in bloques])
+
+    _limpiar_caches()
+    fecha_archivo = extractor.extraer_fecha_archivo(ruta_archivo)
+    pacientes = cronometrar("armado_pacientes",
+                            lambda: {i: extractor.construir_paciente(*bloque, fecha_archivo)
+                                     for i, bloque in enumerate(bloques)})
+
+    hoja = cronometrar("puntuacion", parte10.puntuar_pacientes_columnar, pacientes)
+    cronometrar("exportacion", parte10.exportar_excel, hoja, os.path.join(carpeta, "pacientes_detallado.xlsx"))
+
+    etapas["total"] = sum(etapas.values())
+    return etapas, len(pacientes)
+
+
+def correr(tamanos, semilla=0, carpeta_libros=None):
+    resultados = []
+    with tempfile.TemporaryDirectory() as carpeta_temporal:
+        carpeta = carpeta_libros or carpeta_temporal
+        os.makedirs(carpeta, exist_ok=True)
+        for tamano in tamanos:
+            ruta_archivo = os.path.join(carpeta, f"BENCH{tamano}-26-03-2025.xlsx")
+            inicio = time.perf_counter()
+            generar_libro(ruta_archivo, tamano, semilla)
+            generacion = time.perf_counter() - inicio
+
+            etapas, extraidos = medir_flujo(ruta_archivo, carpeta_temporal)
+            resultados.append({
+                "pacientes": tamano,
+                "pacientes_extraidos": extraidos,
+                "generacion_segundos": round(generacion, 4),
+                "etapas": {etapa: round(segundos, 4) for etapa, segundos in etapas.items()},
+            })
+            mostrar_resultado(resultados[-1])
+    return resultados
+
+
+def mostrar_resultado(resultado):
+    print(f"\n📊 {resultado['pacientes']} pacientes ({resultado['pacientes_extraidos']} extraídos)")
+    for etapa, segundos in resultado["etapas"].items():
+        por_paciente = segundos / max(resultado["pacientes_extraidos"], 1) * 1e6
+        print(f"  {etapa:<24} {segundos:>10.3f} s {por_paciente:>12.1f} µs/paciente")
+
+
+def cargar_anteriores(ruta_anterior):
+    """{pacientes: resultado} de una corrida anterior."""
+    with open(ruta_anterior, "r", encoding="utf-8") as f:
+        return {r["pacientes"]: r for r in json.load(f)["resultados"]}
+
+
+def comparar(resultados, anteriores, ruta_anterior, umbral=UMBRAL_REGRESION):
+    """Compara contra la corrida anterior del mismo tamaño y marca las etapas más lentas que el umbral."""
+    regresiones = 0
+    for resultado in resultados:
+        anterior = anteriores.get(resultado["pacientes"])
+        if anterior is None:
+            continue
+        print(f"\nComparación con {ruta_anterior} ({resultado['pacientes']} pacientes):")
+        for etapa, segundos in resultado["etapas"].items():
+            antes = anterior["etapas"].get(etapa)
+            if not antes:
+                continue
+            razon = segundos / antes
+            marca = "⚠️" if razon > umbral else "✅"
+            regresiones += razon > umbral
+            print(f"  {marca} {etapa:<24} {antes:>10.3f} s -> {segundos:>10.3f} s ({razon:.2f}x)")
+    return regresiones
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del flujo de entrevistas.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Cantidad de pacientes de cada libro sintético")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla del generador de textos")
+    parser.add_argument("--salida", default="benchmark_pipeline.json", help="JSON con los resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--conservar-libros", default=None,
+                        help="Carpeta donde dejar los libros generados (por defecto se borran)")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    # La corrida anterior se lee antes de medir: --salida puede ser el mismo
+    # archivo (--comparar benchmark_pipeline.json) y se sobrescribe al terminar
+    anteriores = None
+    if args.comparar:
+        try:
+            anteriores = cargar_anteriores(args.comparar)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ No se pudo leer la corrida anterior {args.comparar}: {e}")
+            return
+    resultados = correr(args.tamanos, args.semilla, args.conservar_libros)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "version_extractor": extractor.VERSION_EXTRACTOR,
+            "semilla": args.semilla,
+            "resultados": resultados,
+        }, f, ensure_ascii=False, indent=4)
+    print(f"\n✅ Resultados guardados en {args.salida}")
+
+    if anteriores is not None:
+        regresiones = comparar(resultados, anteriores, args.comparar)
+        if regresiones:
+            print(f"\n⚠️ {regresiones} etapas más lentas que {UMBRAL_REGRESION:.2f}x la corrida anterior")
+
+
+if __name__ == "__main__":
+    main()
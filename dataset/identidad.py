@@ -0,0 +1,283 @@
+"""
+Resolución de identidad: qué visitas son del mismo paciente.
+
+El mismo paciente aparece en muchos libros con el nombre escrito distinto
+(tildes, mayúsculas, espacios, un apellido de menos, un error de digitación).
+Comparar todos los nombres contra todos con fuzz es cuadrático, así que:
+
+1. Cada nombre se normaliza (sin tildes, mayúsculas, sólo letras) y las
+   visitas con el mismo nombre normalizado se agrupan sin comparar nada.
+2. Cada nombre distinto genera claves de bloqueo: sus tokens ordenados, los
+   tokens en clave fonética y cada par de tokens en clave fonética (para
+   cuando falta un nombre o un apellido); en los nombres de dos tokens, cada
+   token con las dos primeras y con las dos últimas letras del otro (para un
+   error de digitación en uno de los dos). Sólo se comparan nombres que
+   comparten alguna clave; las claves demasiado comunes (más de
+   MAX_TAMANO_BLOQUE nombres, p. ej. "MARIA JOSE") no se usan.
+3. Cada par candidato se confirma token a token (fonética y fuzz.ratio; el
+   orden de los apellidos importa) y los confirmados se unen (union-find) en
+   una persona. Un nombre al que le falta un token se une a su versión
+   completa sólo si esa versión es de una única persona; si no, queda aparte
+   en lugar de unir a varias.
+
+    python identidad.py DATOSJSON/datos_pacientes.json --salida DATOSJSON/personas.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+from fuzzywuzzy import fuzz
+
+from almacen import abrir_almacen, es_ruta_almacen, todas_las_visitas
+
+UMBRAL_MISMA_PERSONA = 80     # fuzz.ratio mínimo del único token que puede diferir entre dos nombres
+MAX_TAMANO_BLOQUE = 50        # claves con más nombres que esto no generan candidatos
+PALABRAS_VACIAS = frozenset({"DE", "DEL", "LA", "LAS", "LOS", "Y"})
+
+PATRON_NO_LETRAS = re.compile(r"[^A-Z ]+")
+
+# Reglas fonéticas para nombres en español, en orden de aplicación
+REGLAS_FONETICAS = [
+    (re.compile(r"CH"), "X"),
+    (re.compile(r"LL"), "Y"),
+    (re.compile(r"QU"), "K"),
+    (re.compile(r"GU(?=[EI])"), "G"),
+    (re.compile(r"G(?=[EI])"), "J"),
+    (re.compile(r"C(?=[EI])"), "S"),
+    (re.compile(r"C"), "K"),
+    (re.compile(r"Z"), "S"),
+    (re.compile(r"[VW]"), "B"),
+    (re.compile(r"H"), ""),
+    (re.compile(r"Y$"), "I"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+
+
+def normalizar_para_comparar(nombre) -> str:
+    """Mayúsculas, sin tildes ni signos y con los espacios colapsados ("" si no es texto)."""
+    if not isinstance(nombre, str):
+        return ""
+    sin_tildes = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode("ascii")
+    return " ".join(PATRON_NO_LETRAS.sub(" ", sin_tildes.upper()).split())
+
+
+@lru_cache(maxsize=None)
+def clave_fonetica(token: str) -> str:
+    for patron, reemplazo in REGLAS_FONETICAS:
+        token = patron.sub(reemplazo, token)
+    return token
+
+
+def claves_bloqueo(nombre_normalizado: str) -> set:
+    tokens = [token for token in nombre_normalizado.split() if token not in PALABRAS_VACIAS]
+    foneticos = sorted(clave_fonetica(token) for token in tokens)
+    claves = {"T:" + " ".join(sorted(tokens)), "F:" + " ".join(foneticos)}
+    if len(foneticos) >= 3:
+        claves.update("P:" + " ".join(par) for par in itertools.combinations(foneticos, 2))
+    elif len(tokens) == 2:
+        # Con dos tokens un error de digitación cambia las claves T: y F:. Cada
+        # token (en su posición) con el principio y con el final del otro:
+        # "JUAN PEREX" y "JUAN PEREZ" comparten "D:JUAN PE-" sin juntar a todos
+        # los JUAN, y un error al principio del otro token deja igual el final
+        primero, segundo = (clave_fonetica(token) for token in tokens)
+        claves.update({f"D:{primero} {segundo[:2]}-", f"D:{primero} -{segundo[-2:]}",
+                       f"D:{primero[:2]}- {segundo}", f"D:-{primero[-2:]} {segundo}"})
+    return claves
+
+
+def nombres_similares(nombre_a: str, nombre_b: str, umbral: int = UMBRAL_MISMA_PERSONA) -> bool:
+    """
+    Confirmación difusa, token a token y en el mismo orden (el orden de los
+    apellidos importa): todos los tokens suenan igual, salvo a lo sumo uno
+    con fuzz.ratio >= umbral (un error de digitación). Comparar el nombre
+    entero no sirve: "DIEGO ALEJANDRO BARRERA DIAZ" y "... BARRERA PEREZ"
+    superan el 90 sólo por el nombre largo que comparten.
+    """
+    tokens_a, tokens_b = nombre_a.split(), nombre_b.split()
+    if len(tokens_a) != len(tokens_b):
+        return False
+    distintos = [(token_a, token_b) for token_a, token_b in zip(tokens_a, tokens_b)
+                 if token_a != token_b and clave_fonetica(token_a) != clave_fonetica(token_b)]
+    if len(distintos) > 1:
+        return False
+    return not distintos or fuzz.ratio(*distintos[0]) >= umbral
+
+
+def nombre_abreviado(corto: str, largo: str) -> bool:
+    """
+    True si `largo` tiene todos los tokens de `corto` en el mismo orden y más
+    (un segundo nombre o apellido de más). `corto` necesita al menos tres
+    tokens: "ANA PEREZ" no identifica a nadie.
+    """
+    tokens_corto, tokens_largo = corto.split(), largo.split()
+    if len(tokens_corto) < 3 or len(tokens_corto) >= len(tokens_largo):
+        return False
+    restantes = iter(tokens_largo)
+    return all(token in restantes for token in tokens_corto)
+
+
+def _buscar(padres, nombre):
+    while padres[nombre] != nombre:
+        padres[nombre] = padres[padres[nombre]]
+        nombre = padres[nombre]
+    return nombre
+
+
+def agrupar_nombres(nombres, umbral: int = UMBRAL_MISMA_PERSONA, max_bloque: int = MAX_TAMANO_BLOQUE):
+    """
+    Agrupa nombres normalizados distintos en personas. Devuelve
+    ({nombre: representante}, estadisticas); el representante de cada grupo
+    es su nombre menor en orden alfabético.
+    """
+    nombres = sorted(set(nombres))
+    bloques = defaultdict(list)
+    for nombre in nombres:
+        for clave in claves_bloqueo(nombre):
+            bloques[clave].append(nombre)
+
+    candidatos = set()
+    bloques_omitidos = 0
+    for miembros in bloques.values():
+        if len(miembros) > max_bloque:
+            bloques_omitidos += 1
+            continue
+        candidatos.update(itertools.combinations(miembros, 2))
+
+    padres = {nombre: nombre for nombre in nombres}
+    confirmados = 0
+
+    def unir(nombre_a, nombre_b):
+        raiz_a, raiz_b = _buscar(padres, nombre_a), _buscar(padres, nombre_b)
+        # La raíz es siempre la menor de las dos: así el representante no depende del orden
+        padres[max(raiz_a, raiz_b)] = min(raiz_a, raiz_b)
+
+    # Primero los nombres casi iguales; los abreviados se anotan aparte. Todo se
+    # recorre en un orden fijo (no el de los conjuntos, que cambia con
+    # PYTHONHASHSEED) para que los grupos y los ids no cambien entre corridas
+    abreviados = defaultdict(set)
+    for nombre_a, nombre_b in sorted(candidatos):
+        if _buscar(padres, nombre_a) == _buscar(padres, nombre_b):
+            continue
+        if nombres_similares(nombre_a, nombre_b, umbral):
+            confirmados += 1
+            unir(nombre_a, nombre_b)
+        elif nombre_abreviado(nombre_a, nombre_b):
+            abreviados[nombre_a].add(nombre_b)
+        elif nombre_abreviado(nombre_b, nombre_a):
+            abreviados[nombre_b].add(nombre_a)
+
+    # Un nombre abreviado se une sólo si todos sus nombres completos son de la
+    # misma persona: "LUZ MARINA ACOSTA" no une a "... ACOSTA ROJAS" con "... ACOSTA VEGA".
+    # Los más largos van primero: "... ACOSTA ROJAS" y "... ACOSTA VEGA" se unen
+    # antes a "... ACOSTA ROJAS VEGA", y entonces "LUZ MARINA ACOSTA" ya no es ambiguo
+    ambiguos = 0
+    for corto in sorted(abreviados, key=lambda nombre: (-len(nombre.split()), nombre)):
+        largos = abreviados[corto]
+        personas = {_buscar(padres, largo) for largo in largos}
+        if len(personas) == 1:
+            confirmados += 1
+            unir(corto, min(largos))
+        else:
+            ambiguos += 1
+
+    representantes = {nombre: _buscar(padres, nombre) for nombre in nombres}
+    estadisticas = {
+        "nombres": len(nombres),
+        "personas": len(set(representantes.values())),
+        "pares_comparados": len(candidatos),
+        "pares_confirmados": confirmados,
+        "abreviados_ambiguos": ambiguos,
+        "bloques_omitidos": bloques_omitidos,
+    }
+    return representantes, estadisticas
+
+
+def id_persona(representante: str) -> str:
+    return hashlib.sha1(representante.encode("utf-8")).hexdigest()[:12]
+
+
+def resolver_personas(pacientes, umbral: int = UMBRAL_MISMA_PERSONA, max_bloque: int = MAX_TAMANO_BLOQUE):
+    """
+    Asigna un id de persona a cada visita de {id: paciente}. Devuelve
+    ({id_visita: id_persona}, estadisticas); las visitas sin nombre quedan
+    fuera. El id se deriva del nombre representante del grupo, así que es
+    estable mientras ese nombre siga en el grupo.
+    """
+    normalizados = {}
+    for id_visita, paciente in pacientes.items():
+        nombre = normalizar_para_comparar(paciente.get("nombre"))
+        if nombre:
+            normalizados[id_visita] = nombre
+
+    representantes, estadisticas = agrupar_nombres(normalizados.values(), umbral, max_bloque)
+    estadisticas["visitas"] = len(normalizados)
+    return {id_visita: id_persona(representantes[nombre]) for id_visita, nombre in normalizados.items()}, estadisticas
+
+
+def agrupar_visitas(pacientes, personas: dict) -> dict:
+    """{id_persona: [pacientes ordenados por fecha de consulta]} a partir de resolver_personas."""
+    visitas = defaultdict(list)
+    for id_visita, persona in personas.items():
+        visitas[persona].append(pacientes[id_visita])
+    for lista in visitas.values():
+        lista.sort(key=lambda paciente: "-".join(reversed(str(paciente.get("fecha_consulta", "")).split("-"))))
+    return dict(visitas)
+
+
+def cargar_visitas(ruta: str) -> dict:
+    """{id: paciente} desde el JSON del extractor o desde el almacén SQLite."""
+    if es_ruta_almacen(ruta):
+        conexion = abrir_almacen(ruta)
+        try:
+            return dict(enumerate(todas_las_visitas(conexion)))
+        finally:
+            conexion.close()
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrupa las visitas del mismo paciente aunque el nombre varíe.")
+    parser.add_argument("entrada", help="JSON del extractor o almacén SQLite")
+    parser.add_argument("--salida", default=None, help="JSON con {id_visita: id_persona} y los grupos")
+    parser.add_argument("--umbral", type=int, default=UMBRAL_MISMA_PERSONA, help="Similitud mínima (0-100) del token que difiere")
+    parser.add_argument("--mostrar", type=int, default=10, help="Grupos con variantes de nombre a mostrar")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.entrada):
+        print(f"❌ No existe {args.entrada}")
+        return
+    pacientes = cargar_visitas(args.entrada)
+    inicio = time.perf_counter()
+    personas, estadisticas = resolver_personas(pacientes, args.umbral)
+    segundos = time.perf_counter() - inicio
+
+    grupos = agrupar_visitas(pacientes, personas)
+    variantes = {persona: sorted({str(paciente.get("nombre")).strip() for paciente in visitas})
+                 for persona, visitas in grupos.items()}
+    con_variantes = [(persona, nombres) for persona, nombres in variantes.items() if len(nombres) > 1]
+    for persona, nombres in sorted(con_variantes, key=lambda item: -len(item[1]))[:args.mostrar]:
+        print(f"{persona}: {len(grupos[persona])} visitas -> {' | '.join(nombres)}")
+
+    print(f"\n✅ {estadisticas['visitas']} visitas, {estadisticas['nombres']} nombres distintos, "
+          f"{estadisticas['personas']} personas ({len(con_variantes)} con variantes de nombre) en {segundos:.2f} s")
+    print(f"   {estadisticas['pares_comparados']} pares comparados, {estadisticas['pares_confirmados']} uniones, "
+          f"{estadisticas['abreviados_ambiguos']} nombres abreviados ambiguos sin unir, "
+          f"{estadisticas['bloques_omitidos']} claves demasiado comunes omitidas")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"personas": {str(id_visita): persona for id_visita, persona in personas.items()},
+                       "variantes": variantes}, f, ensure_ascii=False, indent=4)
+        print(f"✅ Personas guardadas en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Formato de intercambio JSONL entre ExtraerDatosDelExcel (que escribe) y
+parte10 (que lee): un paciente por línea, {"id": ..., "paciente": {...}}.
+Con extensión .gz el archivo va comprimido con gzip (para archivar).
+
+A diferencia del JSON indentado, ninguno de los dos lados necesita tener
+todos los pacientes en memoria, y el lector puede seguir un archivo que
+todavía se está escribiendo (como `tail -f`).
+"""
+import gzip
+import json
+import time
+
+from registros import a_json
+
+EXTENSIONES_JSONL = (".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz")
+
+
+def es_ruta_jsonl(ruta: str) -> bool:
+    return ruta.lower().endswith(EXTENSIONES_JSONL)
+
+
+def abrir_jsonl(ruta: str, modo: str, comprimido=None):
+    """Abre en modo texto ('rt', 'wt' o 'at'); con .gz (o comprimido=True) a través de gzip."""
+    if comprimido is None:
+        comprimido = ruta.lower().endswith(".gz")
+    if comprimido:
+        return gzip.open(ruta, modo, encoding="utf-8")
+    return open(ruta, modo, encoding="utf-8")
+
+
+def escribir_pacientes_jsonl(pacientes, ruta: str, comprimido=None) -> int:
+    """
+    Escribe un iterable de (id_paciente, paciente_dict) a medida que llega y
+    devuelve cuántos se escribieron. Sin comprimir, cada línea se vacía al
+    disco enseguida para que un lector que sigue el archivo la vea completa.
+    `comprimido` por defecto depende de la extensión (.gz).
+    """
+    if comprimido is None:
+        comprimido = ruta.lower().endswith(".gz")
+    total = 0
+    with abrir_jsonl(ruta, "wt", comprimido) as f:
+        for id_paciente, paciente_dict in pacientes:
+            f.write(json.dumps({"id": id_paciente, "paciente": paciente_dict}, ensure_ascii=False, default=a_json) + "\n")
+            if not comprimido:
+                f.flush()
+            total += 1
+    return total
+
+
+def leer_pacientes_jsonl(ruta: str, seguir: bool = False, espera_maxima=None, intervalo: float = 0.5):
+    """
+    Itera los pacientes (el diccionario de cada línea) de un archivo JSONL.
+
+    Con seguir=True, al llegar al final espera nuevas líneas en lugar de
+    terminar; una línea sólo se procesa cuando está completa. Termina cuando
+    pasan `espera_maxima` segundos sin datos nuevos (None = esperar siempre).
+    Los archivos .gz no se pueden seguir mientras crecen: se leen hasta el final.
+    Las líneas que no son JSON válido se reportan y se saltan.
+    """
+    if seguir and ruta.lower().endswith(".gz"):
+        print(f"⚠️ {ruta} está comprimido: se lee completo sin seguirlo")
+        seguir = False
+
+    def decodificar(linea, numero):
+        try:
+            registro = json.loads(linea)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Línea {numero} de {ruta} no es JSON válido: {e}")
+            return None
+        return registro.get("paciente") if isinstance(registro, dict) else None
+
+    with abrir_jsonl(ruta, "rt") as f:
+        pendiente = ""
+        numero = 0
+        inactivo = 0.0
+        while True:
+            linea = f.readline()
+            if linea:
+                pendiente += linea
+                if pendiente.endswith("\n"):
+                    numero += 1
+                    if pendiente.strip():
+                        paciente = decodificar(pendiente, numero)
+                        if paciente is not None:
+                            yield paciente
+                    pendiente = ""
+                    inactivo = 0.0
+                continue
+
+            if not seguir or (espera_maxima is not None and inactivo >= espera_maxima):
+                break
+            time.sleep(intervalo)
+            inactivo += intervalo
+
+        # Última línea sin salto de línea
+        if pendiente.strip():
+            paciente = decodificar(pendiente, numero + 1)
+            if paciente is not None:
+                yield paciente
@@ -1,17 +1,58 @@
+import argparse
+import glob
+import hashlib
 import json
+import os
+import sys
+from collections.abc import Mapping
 
+import numpy as np
 import pandas as pd
 import re
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
+from functools import lru_cache
+from bisect import bisect_right
 
+import perfilado
+from almacen import abrir_almacen, confirmar_lectura, es_ruta_almacen, todas_las_visitas, visitas_nuevas
+from intercambio import es_ruta_jsonl, leer_pacientes_jsonl
+import reglas
+from reglas import RUTA_REGLAS, cargar_reglas
+from registros import a_json, compactar_paciente
 
-# Cargar los datos desde el archivo JSON
-with open("DATOSJSON\datos_pacientes.json", "r", encoding="utf-8") as file:
-    data = json.load(file)
 
-# Lista para almacenar los datos de cada paciente
-pacientes_data = []
+# Rutas por defecto del flujo por archivos
+RUTA_JSON_PACIENTES = "DATOSJSON\datos_pacientes.json"
+RUTA_EXCEL_SALIDA = "HOJAexcelSUBIR\pacientes_detallado.xlsx"
+
+# Pacientes por lote al puntuar un JSONL en streaming
+TAMANO_LOTE_PUNTUACION = 5000
+
+# Salida columnar opcional (necesita pyarrow): archivo de cada partición por formato
+FORMATOS_COLUMNARES = {"parquet": "pacientes.parquet", "feather": "pacientes.feather"}
+COLUMNA_MES = "mes_consulta"
+MAX_PROPORCION_CATEGORIA = 0.5   # columnas de texto con más valores distintos que esto quedan como string
+
+# Criterios clínicos (bandas de clinimetría, ventanas de tratamiento,
+# polimedicación, escolaridad): se leen de reglas_puntuacion.json y se
+# compilan una sola vez, la primera vez que se puntúa (importar el módulo
+# no lee archivos)
+_REGLAS = None
+
+
+def reglas_puntuacion():
+    """Reglas compiladas en uso; las del archivo por defecto si no se eligieron otras con usar_reglas."""
+    global _REGLAS
+    if _REGLAS is None:
+        _REGLAS = cargar_reglas()
+    return _REGLAS
+
+
+def usar_reglas(ruta: str = RUTA_REGLAS):
+    """Reemplaza las reglas de puntuación por las de otro archivo (ValueError si no es válido)."""
+    global _REGLAS
+    _REGLAS = cargar_reglas(ruta)
 
 # Diccionario de categorías de enfermedades
 categorias = {
@@ -53,34 +94,103 @@ categorias = {
     ]
 }
 
-#clasificar por profesion----------------
-def clasificar_escolaridad(escolaridad_raw):
-    escolaridad_raw = str(escolaridad_raw).lower().strip()
+#clasificador de comorbilidades----------------
+# Todas las palabras clave de `categorias` se compilan en una sola expresión
+# regular con forma de trie (los prefijos comunes se escriben una sola vez),
+# envuelta en un lookahead para que se evalúe en cada posición del texto y
+# devuelva la palabra clave más larga que empieza ahí. Cualquier otra palabra
+# clave que empiece en esa misma posición es prefijo de la más larga, así que
+# basta precalcular para cada palabra la mejor categoría (la primera en el
+# orden de `categorias`) entre todos sus prefijos que también son palabras
+# clave. Con eso un solo recorrido del fragmento da la misma categoría que
+# probar categoría por categoría con `in`, y el costo no crece con el número
+# de palabras clave sino con la profundidad del trie.
+
+def _regex_trie(nodo):
+    ramas = [re.escape(caracter) + _regex_trie(hijo) for caracter, hijo in sorted(nodo.items()) if caracter]
+    if not ramas:
+        return ""
+    cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+    # "" marca el fin de una palabra clave: la continuación es opcional y, por
+    # ser codiciosa, se prefiere la palabra más larga
+    return f"(?:{cuerpo})?" if "" in nodo else cuerpo
+
+
+def compilar_patron_palabras(palabras):
+    """
+    Patrón de una sola pasada para un conjunto de palabras clave: en cada
+    posición del texto captura (grupo 1) la palabra más larga que empieza ahí.
+    """
+    trie = {}
+    for palabra in palabras:
+        nodo = trie
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = {}
+    return re.compile(f"(?=({_regex_trie(trie)}))")
 
-    # Correcciones manuales comunes
-    escolaridad_raw = escolaridad_raw.replace("ptofesional", "profesional")
-    escolaridad_raw = escolaridad_raw.replace("bachillera", "bachillerato")
 
-    # Eliminar entradas de ocupación
-    if "ocupación" in escolaridad_raw:
-        return 2  # Asumimos bachillerato
+def compilar_clasificador_categorias(categorias):
+    """
+    Devuelve (patron, mejor_categoria, nombres): el patrón de una sola pasada,
+    el índice de categoría que corresponde a cada palabra clave encontrada y la
+    lista de nombres de categoría en orden.
+    """
+    nombres = list(categorias)
+    indice_palabra = {}
+    for indice, palabras in enumerate(categorias.values()):
+        for palabra in palabras:
+            if palabra:
+                indice_palabra.setdefault(palabra, indice)
+
+    mejor_categoria = {}
+    for palabra in indice_palabra:
+        mejor_categoria[palabra] = min(
+            indice_palabra[palabra[:fin]] for fin in range(1, len(palabra) + 1) if palabra[:fin] in indice_palabra
+        )
+
+    return compilar_patron_palabras(indice_palabra), mejor_categoria, nombres
+
+
+PATRON_COMORBILIDADES, MEJOR_CATEGORIA_PALABRA, NOMBRES_CATEGORIAS = compilar_clasificador_categorias(categorias)
+PATRON_SEPARADOR_DIAGNOSTICOS = re.compile(r'[;,.\n]+')
+
+
+def clasificar_fragmento(enfermedad: str):
+    """Índice de la primera categoría con alguna palabra clave en el fragmento, o None."""
+    mejor = None
+    for encontrada in PATRON_COMORBILIDADES.finditer(enfermedad):
+        indice = MEJOR_CATEGORIA_PALABRA[encontrada.group(1)]
+        if mejor is None or indice < mejor:
+            mejor = indice
+            if mejor == 0:
+                break
+    return mejor
+
 
-    if "analfabeta" in escolaridad_raw:
-        return 4
-    elif "primaria" in escolaridad_raw:
-        return 3
-    elif "bachiller" in escolaridad_raw:
-        return 2
-    elif "técnico" in escolaridad_raw or "tecnico" in escolaridad_raw:
-        return 1
-    elif "tecnólogo" in escolaridad_raw or "tecnologo" in escolaridad_raw:
-        return 1
-    elif "profesional" in escolaridad_raw:
-        return 0
-    elif "maestría" in escolaridad_raw or "maestria" in escolaridad_raw or "posgrado" in escolaridad_raw:
-        return 0
-    else:
-        return 2  # Default conservador: bachillerato
+def clasificar_comorbilidades(otro_diag: str):
+    """
+    Separa el texto de otros diagnósticos en fragmentos y clasifica cada uno
+    en la primera categoría que le corresponda. Devuelve (clasificacion,
+    otros_enfermedades) con los fragmentos que no cayeron en ninguna.
+    """
+    clasificacion = {key: 0 for key in categorias}
+    otros_enfermedades = []
+
+    for enfermedad in PATRON_SEPARADOR_DIAGNOSTICOS.split(otro_diag):
+        enfermedad = enfermedad.strip()
+        indice = clasificar_fragmento(enfermedad)
+        if indice is not None:
+            clasificacion[NOMBRES_CATEGORIAS[indice]] = 1
+        elif enfermedad and enfermedad != "niega":
+            otros_enfermedades.append(enfermedad)
+
+    return clasificacion, otros_enfermedades
+
+#clasificar por profesion----------------
+def clasificar_escolaridad(escolaridad_raw):
+    # Correcciones manuales y palabras clave por puntaje en reglas_puntuacion.json
+    return reglas_puntuacion().escolaridad.clasificar(escolaridad_raw)
 
 #-----------------------------clasificar clinimetria-------------
 def clasificar_clinimetria(tipo, valor):
@@ -88,137 +198,156 @@ def clasificar_clinimetria(tipo, valor):
     Recibe el tipo de clinimetría ('das28', 'sledai', 'asdas') y su valor numérico,
     y devuelve una tupla con los valores correspondientes para cada columna.
     """
-    das28, sledai, asdas = 0, 0, 0
+    puntajes = {"das28": 0, "sledai": 0, "asdas": 0}
+    if tipo in puntajes:
+        puntajes[tipo] = reglas_puntuacion().clinimetria[tipo].puntuar(valor)
+    return puntajes["das28"], puntajes["sledai"], puntajes["asdas"]
 
-    if tipo == "das28":
-        if valor < 2.6:
-            das28 = 1
-        elif valor < 3.2:
-            das28 = 2
-        elif valor < 5.1:
-            das28 = 3
-        else:
-            das28 = 4
-
-    elif tipo == "sledai":
-        if valor == 0:
-            sledai = 0
-        elif valor <= 5:
-            sledai = 1
-        elif valor <= 10:
-            sledai = 2
-        elif valor <= 19:
-            sledai = 3
-        else:
-            sledai = 4
-
-    elif tipo == "asdas":
-        if valor < 1.3:
-            asdas = 1
-        elif valor < 2.1:
-            asdas = 2
-        elif valor < 3.5:
-            asdas = 3
-        else:
-            asdas = 4
+
+
+
+#motor de fechas-------------------------------------------------------
+# Un único patrón con grupos nombrados reconoce las formas que el flujo acepta
+# como fecha y construye el datetime directamente con los dígitos capturados,
+# en lugar de probar formatos de strptime uno por uno dentro de try/except.
+# Acepta exactamente lo mismo que la lista de formatos que se usaba
+# ("%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%m/%Y", "%m-%Y",
+# "%m/%y", "%m-%y", "%Y", "%y"): mismo separador entre día, mes y año,
+# día y mes con o sin cero a la izquierda y años de 2 dígitos con el pivote
+# de strptime (69-99 -> 1900, 00-68 -> 2000).
+PATRON_FECHA = re.compile(
+    r"(?P<dia>3[01]|[12]\d|0[1-9]|[1-9])(?P<sep>[/-])(?P<mes>1[0-2]|0[1-9]|[1-9])(?P=sep)(?P<anio>\d{4}|\d{2})"
+    r"|(?P<mes_sin_dia>1[0-2]|0[1-9]|[1-9])[/-](?P<anio_con_mes>\d{4}|\d{2})"
+    r"|(?P<anio_solo>\d{4}|\d{2})"
+)
+
+DIAS_POR_MES = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _anio_fecha(digitos: str) -> int:
+    anio = int(digitos)
+    if len(digitos) == 2:
+        anio += 2000 if anio < 69 else 1900
+    return anio
+
+
+def parsear_fecha(fecha_str: str) -> Optional[datetime]:
+    """
+    Convierte un texto como '12/04/2023', '4-23', '2024' o '25' en datetime
+    (día 1 y/o enero cuando faltan). Devuelve None si el texto no es una
+    fecha válida.
+    """
+    encontrado = PATRON_FECHA.fullmatch(fecha_str.strip())
+    if encontrado is None:
+        return None
+
+    forma = encontrado.lastgroup
+    if forma == "anio":
+        anio, mes, dia = _anio_fecha(encontrado["anio"]), int(encontrado["mes"]), int(encontrado["dia"])
+    elif forma == "anio_con_mes":
+        anio, mes, dia = _anio_fecha(encontrado["anio_con_mes"]), int(encontrado["mes_sin_dia"]), 1
     else:
-        sledai = 0
-        asdas = 0
-        das28 = 0
+        anio, mes, dia = _anio_fecha(encontrado["anio_solo"]), 1, 1
+
+    if anio < 1:
+        return None
+    bisiesto = anio % 4 == 0 and (anio % 100 != 0 or anio % 400 == 0)
+    if dia > DIAS_POR_MES[mes - 1] + (mes == 2 and bisiesto):
+        return None
+    return datetime(anio, mes, dia)
+
+
+#fecha de consulta-----------------------------------------------------
+# Todos los pacientes de un libro comparten la fecha de consulta del nombre
+# del archivo, así que se convierte una vez por fecha y no por paciente.
+# Las diferencias en meses se calculan con índices enteros de mes.
+@lru_cache(maxsize=1024)
+def _parsear_fecha_consulta_texto(fecha_str: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(fecha_str, "%d-%m-%Y")
+    except ValueError:
+        return None
 
-    return das28, sledai, asdas
 
+def parsear_fecha_consulta(fecha_consulta) -> Optional[datetime]:
+    """
+    Fecha de consulta como datetime. Acepta el texto "dd-mm-aaaa" del JSON o
+    un date/datetime ya convertido; devuelve None si no es válida.
+    """
+    if isinstance(fecha_consulta, datetime):
+        return fecha_consulta
+    if isinstance(fecha_consulta, date):
+        return datetime(fecha_consulta.year, fecha_consulta.month, fecha_consulta.day)
+    if not isinstance(fecha_consulta, str):
+        return None
+    return _parsear_fecha_consulta_texto(fecha_consulta)
 
 
+def indice_mes(fecha: datetime) -> int:
+    """Meses transcurridos desde el año 0: la resta de dos índices da la diferencia en meses."""
+    return fecha.year * 12 + fecha.month
+
+
+# Patrones para detectar formatos válidos de fechas
+PATRONES_FECHA_TEXTO = [
+    re.compile(r'\b(0[1-9]|[12][0-9]|3[01])[/-](0[1-9]|1[0-2])[/-](\d{2}|\d{4})\b', re.IGNORECASE),  # dd/mm/aa o dd-mm-aaaa
+    re.compile(r'\b(0[1-9]|1[0-2])[/-](\d{2}|\d{4})\b', re.IGNORECASE),                             # mm/aa o mm/aaaa
+    re.compile(r'\b(19|20)\d{2}\b', re.IGNORECASE),                                                # años: 2014, 2025
+]
+
+# Patrones que deben excluirse (dosis como 1500/400 mg)
+PATRONES_EXCLUSION_FECHA = [
+    re.compile(r'\b\d{2,4}/\d{2,4}\s*(mg|ui|mg\/día|mg\/semana)?\b', re.IGNORECASE),
+    re.compile(r'\b\d{1,4}\s*(mg|ui|mg\/día|mg\/semana)\b', re.IGNORECASE),
+]
+
+PATRON_NO_INICIADO = re.compile(r'\ba[uú]n\s+no(\s+ha)?\s+iniciado\b', re.IGNORECASE)
 
-# Tu función de extracción de fechas
-import re
-from typing import List
 
-def extraer_fechas(texto: str, fecha_actual: str) -> List[str]:
+def extraer_fechas(texto: str, fecha_actual: Optional[datetime]) -> list:
     """
     Extrae fechas de un texto clínico, evitando confundirlas con dosis.
     Si el texto contiene la frase 'aún no iniciado' o 'aun no iniciado',
-    añade la fecha_actual como indicativo de inicio del tratamiento.
+    añade la fecha_actual (ya convertida) como indicativo de inicio del
+    tratamiento.
     """
 
-    # Patrones para detectar formatos válidos de fechas
-    patrones = [
-        r'\b(0[1-9]|[12][0-9]|3[01])[/-](0[1-9]|1[0-2])[/-](\d{2}|\d{4})\b',  # dd/mm/aa o dd-mm-aaaa
-        r'\b(0[1-9]|1[0-2])[/-](\d{2}|\d{4})\b',                             # mm/aa o mm/aaaa
-        r'\b(19|20)\d{2}\b',                                                # años: 2014, 2025
-    ]
-
-    # Patrones que deben excluirse (dosis como 1500/400 mg)
-    patrones_exclusion = [
-        r'\b\d{2,4}/\d{2,4}\s*(mg|ui|mg\/día|mg\/semana)?\b',
-        r'\b\d{1,4}\s*(mg|ui|mg\/día|mg\/semana)\b',
-    ]
-
     fechas_encontradas = []
 
     # Si el tratamiento no ha iniciado aún, se toma la fecha actual como fecha de inicio
-    if re.search(r'\ba[uú]n\s+no(\s+ha)?\s+iniciado\b', texto, flags=re.IGNORECASE):
+    if PATRON_NO_INICIADO.search(texto):
         fechas_encontradas.append(fecha_actual)
 
     # Buscar fechas reales y filtrar las que no son dosis
-    for patron in patrones:
-        for match in re.finditer(patron, texto, flags=re.IGNORECASE):
+    for patron in PATRONES_FECHA_TEXTO:
+        for match in patron.finditer(texto):
             posible_fecha = match.group()
-            if not any(re.search(p_exc, posible_fecha, re.IGNORECASE) for p_exc in patrones_exclusion):
+            if not any(p_exc.search(posible_fecha) for p_exc in PATRONES_EXCLUSION_FECHA):
                 fechas_encontradas.append(posible_fecha)
 
     return fechas_encontradas
-def clasificar_fecha_tratamiento(fechas: List[str], fecha_actual_str: str) -> int:
+def clasificar_fecha_tratamiento(fechas: list, fecha_actual_str) -> int:
     """
     Clasifica fechas en base a la más reciente:
     - 0 si no hay fechas válidas
-    - 4 si la diferencia con la fecha actual es < 6 meses
-    - 3 si la diferencia es entre 6 y < 12 meses
-    - 1 si es 12 meses o más
+    - si no, el puntaje de la ventana de meses "cambio_medicacion" de
+      reglas_puntuacion.json en la que cae la diferencia con la fecha actual
+      (4 si es < 6 meses, 3 si es < 12 y 1 si es 12 meses o más)
     """
 
     if not fechas:
         return 0
 
-    # Convertimos la fecha actual
-    try:
-        fecha_actual = datetime.strptime(fecha_actual_str, "%d-%m-%Y")
-    except ValueError:
+    # Convertimos la fecha actual (texto "dd-mm-aaaa" o datetime)
+    fecha_actual = parsear_fecha_consulta(fecha_actual_str)
+    if fecha_actual is None:
         print("⚠️ Fecha actual con formato incorrecto")
         return 0
 
-    fechas_convertidas = []
-
-    for fecha_str in fechas:
-        fecha_str = fecha_str.strip()
-        fecha = None
-
-        # Intentamos distintos formatos
-        formatos = [
-            "%d/%m/%Y", "%d-%m-%Y",   # día completo
-            "%d/%m/%y", "%d-%m-%y",   # día completo corto
-            "%m/%Y", "%m-%Y",         # mes/año completo
-            "%m/%y", "%m-%y",         # mes/año corto
-            "%Y",                     # solo año completo
-            "%y"                      # solo año corto
-        ]
-
-        for fmt in formatos:
-            try:
-                fecha = datetime.strptime(fecha_str, fmt)
-                break
-            except ValueError:
-                continue
-
-        # Si es solo año (ej: 25), lo interpretamos como 2025
-        if fecha is None and re.match(r"^\d{2}$", fecha_str):
-            year = int(fecha_str)
-            year += 2000 if year < 50 else 1900
-            fecha = datetime(year, 1, 1)
-
-        if fecha:
-            fechas_convertidas.append(fecha)
+    # Las fechas del texto se convierten; la de consulta ya llega como datetime
+    fechas_convertidas = [fecha if isinstance(fecha, datetime) else parsear_fecha(fecha)
+                          for fecha in fechas if fecha is not None]
+    fechas_convertidas = [fecha for fecha in fechas_convertidas if fecha is not None]
 
     if not fechas_convertidas:
         return 0
@@ -227,188 +356,254 @@ def clasificar_fecha_tratamiento(fechas: List[str], fecha_actual_str: str) -> in
     fecha_mas_reciente = max(fechas_convertidas)
 
     # Calcular diferencia en meses
-    diferencia_meses = (fecha_actual.year - fecha_mas_reciente.year) * 12 + (fecha_actual.month - fecha_mas_reciente.month)
+    diferencia_meses = indice_mes(fecha_actual) - indice_mes(fecha_mas_reciente)
+
+    return reglas_puntuacion().ventanas["cambio_medicacion"].puntuar(diferencia_meses)
+
+#catalogo de medicamentos----------------------------------------------
+# Un solo catálogo para todas las columnas que miran medicamentos. Cada entrada
+# tiene su clase, su vía de administración, los alias con que aparece en el
+# texto y los grupos (columnas de la hoja) en los que cuenta:
+#   inicio_biologico_jak  -> INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK
+#   inicio_dmards         -> INICIO TRATAMIENTO DMARDS
+#   adherencia_biologicos -> ADHERENCIA MIROSKY GREEN BIOLOGICO
+#   adherencia_jak        -> ADHERENCIA MIROSKY GREEN JACK
+#   adherencia_dmards     -> ADHERENCIA MIROSKY DMARDS
+#   parenteral            -> Dispensacion parenteral
+#   interacciones         -> descripcion de las molecula
+# El orden del catálogo es el orden en que se listan las moléculas en la
+# descripción de interacciones.
+CATALOGO_MEDICAMENTOS = {
+    "leflunomida": {"clase": "dmard", "via": "oral", "alias": ["leflunomida"],
+                    "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "metotrexato": {"clase": "dmard", "via": "oral", "alias": ["metotrexato"],
+                    "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "cloroquina": {"clase": "dmard", "via": "oral", "alias": ["cloroquina"],
+                   "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "sulfasalazina": {"clase": "dmard", "via": "oral", "alias": ["sulfasalazina"],
+                      "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "prednisolona": {"clase": "corticoide", "via": "oral", "alias": ["prednisolona"],
+                     "grupos": {"adherencia_dmards", "interacciones"}},
+    "azatioprina": {"clase": "dmard", "via": "oral", "alias": ["azatioprina"],
+                    "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "hidroxicloroquina": {"clase": "dmard", "via": "oral", "alias": ["hidroxicloroquina"],
+                          "grupos": {"inicio_dmards", "adherencia_dmards", "interacciones"}},
+    "daflazacort": {"clase": "corticoide", "via": "oral", "alias": ["daflazacort"],
+                    "grupos": {"adherencia_dmards", "interacciones"}},
+    "etoricoxib": {"clase": "aine", "via": "oral", "alias": ["etoricoxib"],
+                   "grupos": {"adherencia_dmards", "interacciones"}},
+    "etanercept": {"clase": "biologico", "via": "parenteral", "alias": ["etanercept"],
+                   "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "adalimumab": {"clase": "biologico", "via": "parenteral", "alias": ["adalimumab"],
+                   "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "rituximab": {"clase": "biologico", "via": "parenteral", "alias": ["rituximab"],
+                  "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "tocilizumab": {"clase": "biologico", "via": "parenteral", "alias": ["tocilizumab"],
+                    "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "abatacept": {"clase": "biologico", "via": "parenteral", "alias": ["abatacept"],
+                  "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "infliximab": {"clase": "biologico", "via": "parenteral", "alias": ["infliximab"],
+                   "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "golimumab": {"clase": "biologico", "via": "parenteral", "alias": ["golimumab"],
+                  "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "certolizumab": {"clase": "biologico", "via": "parenteral", "alias": ["certolizumab"],
+                     "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "secukinumab": {"clase": "biologico", "via": "parenteral", "alias": ["secukinumab"],
+                    "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "belimumab": {"clase": "biologico", "via": "parenteral", "alias": ["belimumab"],
+                  "grupos": {"inicio_biologico_jak", "adherencia_biologicos", "parenteral", "interacciones"}},
+    "tofacitinib": {"clase": "jak", "via": "oral", "alias": ["tofacitinib"],
+                    "grupos": {"inicio_biologico_jak", "adherencia_jak"}},
+    "baricitinib": {"clase": "jak", "via": "oral", "alias": ["baricitinib"],
+                    "grupos": {"inicio_biologico_jak", "adherencia_jak"}},
+    "upadacitinib": {"clase": "jak", "via": "oral", "alias": ["upadacitinib"],
+                     "grupos": {"inicio_biologico_jak", "adherencia_jak"}},
+    "ciclosporina": {"clase": "dmard", "via": "oral", "alias": ["ciclosporina"],
+                     "grupos": {"inicio_dmards"}},
+    "ciclofosfamida": {"clase": "dmard", "via": "oral", "alias": ["ciclofosfamida"],
+                       "grupos": {"inicio_dmards"}},
+    "micofenolato": {"clase": "dmard", "via": "oral", "alias": ["micofenolato"],
+                     "grupos": {"inicio_dmards"}},
+    "metotrexato sc": {"clase": "dmard", "via": "parenteral", "alias": ["metotrexato sc"],
+                       "grupos": {"parenteral"}},
+}
 
-    # Clasificación según la diferencia
-    if diferencia_meses < 6:
-        return 4
-    elif diferencia_meses < 12:
-        return 3
-    else:
-        return 1
 
-def evaluar_tratamiento_con_fecha_biologico_yak(texto: str, fecha_actual_str: str) -> int:
-    medicamentos_interes = [
-        "etanercept", "adalimumab", "rituximab", "tocilizumab", "abatacept",
-        "infliximab", "golimumab", "certolizumab", "secukinumab", "belimumab",
-        "tofacitinib", "baricitinib", "upadacitinib"
-    ]
+def compilar_detector_medicamentos(catalogo):
+    """
+    Devuelve (patron, alias_en_posicion): el patrón de una sola pasada sobre
+    todos los alias del catálogo y, para cada alias, los alias que también
+    aparecen cuando él aparece en una posición (él mismo y sus prefijos).
+    """
+    alias_a_medicamento = {}
+    for medicamento, datos in catalogo.items():
+        for alias in datos["alias"]:
+            alias_a_medicamento.setdefault(alias, medicamento)
+
+    alias_en_posicion = {}
+    for alias in alias_a_medicamento:
+        alias_en_posicion[alias] = [
+            (alias[:fin], alias_a_medicamento[alias[:fin]])
+            for fin in range(1, len(alias) + 1) if alias[:fin] in alias_a_medicamento
+        ]
+    return compilar_patron_palabras(alias_a_medicamento), alias_en_posicion
 
-    # Unidades a ignorar si están presentes en el texto que parece fecha
-    unidades_a_ignorar = ['mg', 'ui', 'vo', 'ml']
 
-    if not isinstance(texto, str):
-        return 0
+PATRON_MEDICAMENTOS, ALIAS_EN_POSICION = compilar_detector_medicamentos(CATALOGO_MEDICAMENTOS)
 
-    try:
-        fecha_actual = datetime.strptime(fecha_actual_str, "%d-%m-%Y")
-    except ValueError:
-        print("⚠️ Fecha actual con formato incorrecto")
-        return 0
 
-    texto = texto.lower()
-    tratamientos = re.split(r'[\n,*\-•]+', texto)
-    tratamientos = [t.strip() for t in tratamientos if t.strip()]
+def detectar_medicamentos(texto: str) -> List[dict]:
+    """
+    Recorre el texto (ya en minúsculas) una sola vez y devuelve todos los
+    medicamentos del catálogo que aparecen, con su clase, vía, grupos y la
+    posición de cada aparición, ordenados por posición. Se detecta por
+    subcadena, igual que `med in texto`: "hidroxicloroquina" también cuenta
+    como "cloroquina" y "metotrexato sc" también como "metotrexato".
+    """
+    detectados = []
+    for encontrado in PATRON_MEDICAMENTOS.finditer(texto):
+        posicion = encontrado.start()
+        for alias, medicamento in ALIAS_EN_POSICION[encontrado.group(1)]:
+            datos = CATALOGO_MEDICAMENTOS[medicamento]
+            detectados.append({
+                "medicamento": medicamento,
+                "alias": alias,
+                "clase": datos["clase"],
+                "via": datos["via"],
+                "grupos": datos["grupos"],
+                "posicion": posicion,
+            })
+    return detectados
+
+
+def usa_grupo(medicamentos: List[dict], grupo: str) -> bool:
+    return any(grupo in detectado["grupos"] for detectado in medicamentos)
+
 
+def medicamentos_de_grupo(medicamentos: List[dict], grupo: str) -> List[str]:
+    """Nombres de los medicamentos detectados del grupo, en el orden del catálogo."""
+    presentes = {detectado["medicamento"] for detectado in medicamentos if grupo in detectado["grupos"]}
+    return [medicamento for medicamento in CATALOGO_MEDICAMENTOS if medicamento in presentes]
+
+
+#fechas de inicio por medicamento---------------------------------------
+# Separadores de los ítems del tratamiento (un medicamento por ítem)
+PATRON_ITEM_TRATAMIENTO = re.compile(r'[^\n,*\-•]+')
+
+
+# Textos con forma de fecha dentro de un ítem del tratamiento
+PATRONES_FECHA_ITEM = [
+    re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'),  # dd/mm/yyyy o dd-mm-yyyy
+    re.compile(r'\b\d{1,2}[/-]\d{2}'),               # mm/yy
+    re.compile(r'\b\d{4}\b'),                        # Año completo
+    re.compile(r'\b\d{2}\b')                         # Año corto
+]
+
+
+def _fechas_en_item(item: str) -> List[datetime]:
     fechas_convertidas = []
+    for patron in PATRONES_FECHA_ITEM:
+        for fecha_str in patron.findall(item):
+            fecha = parsear_fecha(fecha_str)
+            if fecha:
+                fechas_convertidas.append(fecha)
+    return fechas_convertidas
 
-    for item in tratamientos:
-        for med in medicamentos_interes:
-            if med in item:
-                patrones = [
-                    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',  # dd/mm/yyyy o dd-mm-yyyy
-                    r'\b\d{1,2}[/-]\d{2}',               # mm/yy
-                    r'\b\d{4}\b',                        # Año completo
-                    r'\b\d{2}\b'                         # Año corto
-                ]
-                fechas_encontradas = []
-                for patron in patrones:
-                    fechas_encontradas += re.findall(patron, item)
-
-                for fecha_str in fechas_encontradas:
-                    # Verificar si contiene unidades médicas
-                    if any(unidad in fecha_str.lower() for unidad in unidades_a_ignorar):
-                        continue
-
-                    fecha_str = fecha_str.strip()
-                    fecha = None
-                    formatos = [
-                        "%d/%m/%Y", "%d-%m-%Y",
-                        "%d/%m/%y", "%d-%m-%y",
-                        "%m/%Y", "%m-%Y",
-                        "%m/%y", "%m-%y",
-                        "%Y", "%y"
-                    ]
-                    for fmt in formatos:
-                        try:
-                            fecha = datetime.strptime(fecha_str, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    if fecha is None and re.match(r"^\d{2}$", fecha_str):
-                        year = int(fecha_str)
-                        year += 2000 if year < 50 else 1900
-                        fecha = datetime(year, 1, 1)
-                    if fecha:
-                        fechas_convertidas.append(fecha)
+
+def fechas_inicio_grupo(texto: str, medicamentos: List[dict], grupo: str) -> List[datetime]:
+    """
+    Fechas encontradas en los ítems del tratamiento que mencionan algún
+    medicamento del grupo. Las posiciones de `medicamentos` deben venir de
+    detectar_medicamentos sobre este mismo texto.
+    """
+    inicios, items = [], []
+    for item in PATRON_ITEM_TRATAMIENTO.finditer(texto):
+        inicios.append(item.start())
+        items.append(item.group())
+
+    indices = {bisect_right(inicios, detectado["posicion"]) - 1
+               for detectado in medicamentos if grupo in detectado["grupos"]}
+
+    fechas_convertidas = []
+    for indice in sorted(indices):
+        fechas_convertidas += _fechas_en_item(items[indice].strip())
+    return fechas_convertidas
+
+
+def _puntuar_inicio_grupo(texto: str, fecha_actual, medicamentos, grupo: str) -> int:
+    """
+    Puntaje de la ventana de meses del grupo (reglas_puntuacion.json) según el
+    inicio más reciente; sin fechas, puntaje_sin_fecha si el grupo se usa y 0 si no.
+    """
+    ventanas = reglas_puntuacion().ventanas[grupo]
+    fechas_convertidas = fechas_inicio_grupo(texto, medicamentos, grupo)
 
     if not fechas_convertidas:
-        if any(med in item for item in tratamientos for med in medicamentos_interes):
-            return 1
-        else:
-            return 0
+        return ventanas.puntaje_sin_fecha if usa_grupo(medicamentos, grupo) else 0
 
-    fecha_mas_reciente = max(fechas_convertidas)
-    diferencia_meses = (fecha_actual.year - fecha_mas_reciente.year) * 12 + (fecha_actual.month - fecha_mas_reciente.month)
+    diferencia_meses = indice_mes(fecha_actual) - indice_mes(max(fechas_convertidas))
+    return ventanas.puntuar(diferencia_meses)
 
-    if diferencia_meses < 3:
-        return 4
-    elif diferencia_meses < 6:
-        return 3
-    elif diferencia_meses < 12:
-        return 1
-    else:
-        return 1
 
+def evaluar_tratamiento_con_fecha_biologico_yak(texto: str, fecha_actual_str, medicamentos=None) -> int:
+    if not isinstance(texto, str):
+        return 0
+
+    fecha_actual = parsear_fecha_consulta(fecha_actual_str)
+    if fecha_actual is None:
+        print("⚠️ Fecha actual con formato incorrecto")
+        return 0
+
+    texto = texto.lower()
+    if medicamentos is None:
+        medicamentos = detectar_medicamentos(texto)
 
+    return _puntuar_inicio_grupo(texto, fecha_actual, medicamentos, "inicio_biologico_jak")
 
-#evaluacio ntratamiendo dmards
 
 
+#evaluacio ntratamiendo dmards
 
-def evaluar_tratamiento_con_fecha_dmards(texto: str, fecha_actual_str: str) -> int:
-    medicamentos_interes = [
-        "metotrexato", "leflunomida", "sulfasalazina", "hidroxicloroquina", "azatioprina",
-        "ciclosporina", "ciclofosfamida", "micofenolato", "cloroquina"
-    ]
 
-    unidades_a_ignorar = ['mg', 'ui', 'vo', 'ml']
 
+def evaluar_tratamiento_con_fecha_dmards(texto: str, fecha_actual_str, medicamentos=None) -> int:
     if not isinstance(texto, str):
         return 0
 
     texto = texto.lower()
 
-    try:
-        fecha_actual = datetime.strptime(fecha_actual_str, "%d-%m-%Y")
-    except ValueError:
+    fecha_actual = parsear_fecha_consulta(fecha_actual_str)
+    if fecha_actual is None:
         print("⚠️ Fecha actual con formato incorrecto")
         return 0
 
-    tratamientos = re.split(r'[\n,*\-•]+', texto)
-    tratamientos = [t.strip() for t in tratamientos if t.strip()]
+    if medicamentos is None:
+        medicamentos = detectar_medicamentos(texto)
 
-    fechas_convertidas = []
+    return _puntuar_inicio_grupo(texto, fecha_actual, medicamentos, "inicio_dmards")
 
-    for item in tratamientos:
-        for med in medicamentos_interes:
-            if med in item:
-                patrones = [
-                    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',  # 12/04/2023 o 12-04-2023
-                    r'\b\d{1,2}[/-]\d{2}',               # 04/23
-                    r'\b\d{4}\b',                        # Año completo
-                    r'\b\d{2}\b'                         # Año corto (p. ej. 25)
-                ]
-                fechas_encontradas = []
-                for patron in patrones:
-                    fechas_encontradas += re.findall(patron, item)
-
-                for fecha_str in fechas_encontradas:
-                    if any(unidad in fecha_str.lower() for unidad in unidades_a_ignorar):
-                        continue
-
-                    fecha_str = fecha_str.strip()
-                    fecha = None
-                    formatos = [
-                        "%d/%m/%Y", "%d-%m-%Y",
-                        "%d/%m/%y", "%d-%m-%y",
-                        "%m/%Y", "%m-%Y",
-                        "%m/%y", "%m-%y",
-                        "%Y", "%y"
-                    ]
-                    for fmt in formatos:
-                        try:
-                            fecha = datetime.strptime(fecha_str, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    if fecha is None and re.match(r"^\d{2}$", fecha_str):
-                        year = int(fecha_str)
-                        year += 2000 if year < 50 else 1900
-                        fecha = datetime(year, 1, 1)
-                    if fecha:
-                        fechas_convertidas.append(fecha)
+#-------------------------------------------------------------------
+def _puntaje_adherencia(adherencia_morisky: str) -> int:
+    adherencia = str(adherencia_morisky).strip().lower()
+    if adherencia == "adherente":
+        return 1
+    elif adherencia == "parcialmente adherente":
+        return 3
+    elif adherencia == "no adherente":
+        return 4
+    else:
+        return 0  # No evaluable
 
-    if not fechas_convertidas:
-        if any(med in item for item in tratamientos for med in medicamentos_interes):
-            return 1
-        else:
-            return 0
 
-    fecha_mas_reciente = max(fechas_convertidas)
-    diferencia_meses = (fecha_actual.year - fecha_mas_reciente.year) * 12 + (fecha_actual.month - fecha_mas_reciente.month)
+def _medicamentos_tratamiento(tratamiento_principal, medicamentos):
+    if medicamentos is not None:
+        return medicamentos
+    # Normalizar entradas
+    tratamiento = str(tratamiento_principal).lower().replace("vita d", "vitamina d")
+    return detectar_medicamentos(tratamiento)
 
-    if diferencia_meses < 6:
-        return 4
-    elif diferencia_meses <12 :
-        return 3
-    elif (diferencia_meses > 12):
-        return 1
-    else:
-        return 1
 
-#-------------------------------------------------------------------
-def evaluar_adherencia_biologicos(tratamiento_principal: str, adherencia_morisky: str) -> int:
+def evaluar_adherencia_biologicos(tratamiento_principal: str, adherencia_morisky: str, medicamentos=None) -> int:
     """
     Evalúa la adherencia a medicamentos biológicos según el tratamiento principal
     y el resultado del test de adherencia Morisky.
@@ -419,30 +614,9 @@ def evaluar_adherencia_biologicos(tratamiento_principal: str, adherencia_morisky
         4 -> No adherente
         0 -> No evaluable
     """
-
-    # Lista de medicamentos biológicos en minúsculas
-    biologicos = [
-        "etanercept", "adalimumab", "rituximab", "tocilizumab", "abatacept",
-        "infliximab", "golimumab", "certolizumab", "secukinumab", "belimumab"
-    ]
-
-    # Normalizar entradas
-    tratamiento = str(tratamiento_principal).lower().replace("vita d", "vitamina d")
-    adherencia = str(adherencia_morisky).strip().lower()
-
-    # Verificar si hay al menos un biológico en el tratamiento
-    usa_biologico = any(bio in tratamiento for bio in biologicos)
-
-    # Evaluar adherencia
-    if usa_biologico:
-        if adherencia == "adherente":
-            return 1
-        elif adherencia == "parcialmente adherente":
-            return 3
-        elif adherencia == "no adherente":
-            return 4
-        else:
-            return 0  # No evaluable
+    medicamentos = _medicamentos_tratamiento(tratamiento_principal, medicamentos)
+    if usa_grupo(medicamentos, "adherencia_biologicos"):
+        return _puntaje_adherencia(adherencia_morisky)
     else:
         return 0  # No usa biológicos, no se evalúa
 
@@ -450,9 +624,9 @@ def evaluar_adherencia_biologicos(tratamiento_principal: str, adherencia_morisky
 
 #----------------------------------------------------------------------------
 #adherencia antiyak
-def evaluar_adherencia_inhibidoresjack(tratamiento_principal: str, adherencia_morisky: str) -> int:
+def evaluar_adherencia_inhibidoresjack(tratamiento_principal: str, adherencia_morisky: str, medicamentos=None) -> int:
     """
-    Evalúa la adherencia a medicamentos biológicos según el tratamiento principal
+    Evalúa la adherencia a inhibidores JAK según el tratamiento principal
     y el resultado del test de adherencia Morisky.
 
     Retorna:
@@ -461,36 +635,16 @@ def evaluar_adherencia_inhibidoresjack(tratamiento_principal: str, adherencia_mo
         4 -> No adherente
         0 -> No evaluable
     """
-
-    # Lista de medicamentos jack en minúsculas
-    inhibidores_jak = [
-        "tofacitinib", "baricitinib", "upadacitinib"
-    ]
-
-    # Normalizar entradas
-    tratamiento = str(tratamiento_principal).lower().replace("vita d", "vitamina d")
-    adherencia = str(adherencia_morisky).strip().lower()
-
-    # Verificar si hay al menos un jack en el tratamiento
-    usa_jack = any(bio in tratamiento for bio in inhibidores_jak)
-
-    # Evaluar adherencia
-    if usa_jack:
-        if adherencia == "adherente":
-            return 1
-        elif adherencia == "parcialmente adherente":
-            return 3
-        elif adherencia == "no adherente":
-            return 4
-        else:
-            return 0  # No evaluable
+    medicamentos = _medicamentos_tratamiento(tratamiento_principal, medicamentos)
+    if usa_grupo(medicamentos, "adherencia_jak"):
+        return _puntaje_adherencia(adherencia_morisky)
     else:
         return 0  # No usa antijack, no se evalúa
 
 #----------------------------------------------------
-def evaluar_adherencia_demards(tratamiento_principal: str, adherencia_morisky: str) -> int:
+def evaluar_adherencia_demards(tratamiento_principal: str, adherencia_morisky: str, medicamentos=None) -> int:
     """
-    Evalúa la adherencia a medicamentos biológicos según el tratamiento principal
+    Evalúa la adherencia a DMARDs según el tratamiento principal
     y el resultado del test de adherencia Morisky.
 
     Retorna:
@@ -499,73 +653,101 @@ def evaluar_adherencia_demards(tratamiento_principal: str, adherencia_morisky: s
         4 -> No adherente
         0 -> No evaluable
     """
-
-    # Lista de medicamentos jack en minúsculas
-    dmards = [
-        "leflunomida",
-        "metotrexato",
-        "cloroquina",
-        "sulfasalazina",
-        "prednisolona",
-        "azatioprina",
-        "hidroxicloroquina",
-        "daflazacort",
-        "etoricoxib"
-    ]
-
-    # Normalizar entradas
-    tratamiento = str(tratamiento_principal).lower().replace("vita d", "vitamina d")
-    adherencia = str(adherencia_morisky).strip().lower()
-
-    # Verificar si hay al menos un jack en el tratamiento
-    usa_demards = any(bio in tratamiento for bio in dmards)
-
-    # Evaluar adherencia
-    if usa_demards:
-        if adherencia == "adherente":
-            return 1
-        elif adherencia == "parcialmente adherente":
-            return 3
-        elif adherencia == "no adherente":
-            return 4
-        else:
-            return 0  # No evaluable
+    medicamentos = _medicamentos_tratamiento(tratamiento_principal, medicamentos)
+    if usa_grupo(medicamentos, "adherencia_dmards"):
+        return _puntaje_adherencia(adherencia_morisky)
     else:
         return 0  # No usa demards, no se evalúa
 #-------------------------- dispeesacion parenteral
-def evaluar_parenteral():
-    # Normalizamos el tratamiento principal
-    tratamiento_principal = str(paciente_info.get("tratamiento_principal", "")).lower().replace("vita d", "vitamina d")
+def evaluar_parenteral(tratamiento_principal: str, medicamentos=None) -> int:
+    medicamentos = _medicamentos_tratamiento(tratamiento_principal, medicamentos)
+    # Si tiene medicamento parenteral, parenteral = 1, si no = 0
+    return 1 if usa_grupo(medicamentos, "parenteral") else 0
 
-    # Lista de medicamentos de administración parenteral
-    medicamentos_parenterales = [
-        "metotrexato sc",
-        "etanercept",
-        "adalimumab",
-        "rituximab",
-        "tocilizumab",
-        "abatacept",
-        "infliximab",
-        "golimumab",
-        "certolizumab",
-        "secukinumab",
-        "belimumab"
-    ]
 
-    # Verificar si alguno de los medicamentos está en el tratamiento principal
-    contiene_parenteral = any(med in tratamiento_principal for med in medicamentos_parenterales)
+#----------------------------------------------------------------------
+# Columnas adicionales de RAM: 0 si no hay RAM, vacías para diligenciar si la hay
+COLUMNAS_RAM_ADICIONALES = [
+    "MEDICAMENTO_SOSPECHOSO",
+    "ESTADO ACUTAL RAM",
+    "0NO 2 SI",
+    "TIPO",
+    "DEFINIDO POR COMITE FV",
+    "0 NO 1 SI",
+    "ADMINISTRACION ERRONEA DEL MEDICAMENTO",
+    "CARACTERISTICAS PERSONALES",
+    "CONVERSACION INADECUADA",
+    "CONTRAINDICACION",
+    "DOSIS PAUTAS",
+    "DUPLICIDAD",
+    "ERRROES EN LA DISPENSACION",
+    "ERRORES EN LA PRESCIRPCION",
+    "IN CUMPLIMIENTO",
+    "INTERACCIONES",
+    "OTROS PROBLEMAS",
+    "PROBAVBILIDAD DE EFECTOS ADVERSOS",
+    "PROBLEMA DE SALUD",
+    "OTROS"
+]
+
+# Orden de las columnas en la hoja para subir
+COLUMNAS_FINALES = ["Nombre"]+["Tipo Identificación"]+["Edad"]+["Grado Escolaridad"]+["Género"]+["Gestación"]+["Consumo de SPA"]+["4. Consumo de alcohol o drogas que interacciona con medicamento"]+["Trastornos mentales"]+["Factores relacionados con el trato paciente"]+["hospitalizacion ultimos 6 meses"]+["1. Enfermedad cardiovascular"]+["2. Hipertensión arterial"]+["3. Diabetes mellitus"]+["4. Enfermedad renal"]+["5. Enfermedad hepatica"]+["6. Osteoporosis/ Artrosis/ Osteoartrosis"]+["7. Enfermedad gastrointestinal"]+["8. Hipotiroidismo/Hipertiroidismo"]+["9. Cancer"]+["10. Otros"]+["¿Cuáles otras?"]+["4. Presenta más de 2 comorbilidades de la lista \n2. Presenta 1 comorbilidad de la lista"]+["APLICA CLINIMETRÍA\n0. No, requiere de otro parametro\n4. Si, pero es > a 2 meses"]+["das28_clasificacion"]+["sledai_clasificacion"]+["asdas_clasificacion"] +["polimedicacion"]+["Cambio en Medicacion"]+["INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK"] + ["INICIO TRATAMIENTO DMARDS"]+["ADHERENCIA MIROSKY GREEN BIOLOGICO"]+["ADHERENCIA MIROSKY GREEN JACK"]+["ADHERENCIA MIROSKY DMARDS"]+["ADHERENCIA A OTROS TRATAMIENTOS FARMACOLOGICOS"]+["Dispensacion parenteral"]+["Dispesacion medicamentos oral"]+["Interacciones 1si 2no"]+["interacciones mayores que requieran"]+["clasificacion relevancia"]+["mecanismo farmadinamicas"]+["farmaco"]+["descripcion de las molecula"]+["columna 0no 1 si de ram"]+["RAM"]+COLUMNAS_RAM_ADICIONALES
+
+# Columnas que guarda cada FilaPuntuada; las de RAM adicionales se deducen de "RAM"
+COLUMNAS_BASE = [columna for columna in COLUMNAS_FINALES if columna not in COLUMNAS_RAM_ADICIONALES]
+_INDICE_COLUMNA = {columna: indice for indice, columna in enumerate(COLUMNAS_BASE)}
+_INDICE_RAM = _INDICE_COLUMNA["RAM"]
+_COLUMNAS_RAM_ADICIONALES = frozenset(COLUMNAS_RAM_ADICIONALES)
+
+
+class FilaPuntuada(Mapping):
+    """
+    Fila de la hoja para subir guardada como una tupla de valores en el orden
+    de COLUMNAS_BASE, sin las veinte columnas RAM adicionales (0 si no hay RAM,
+    vacías si la hay). Se lee como un diccionario de sólo lectura con las
+    columnas de COLUMNAS_FINALES, en ese orden; a_dict() da la fila completa.
+    """
+    __slots__ = ("_valores",)
 
-    # Si tiene medicamento parenteral, parenteral = 1, si no = 0
-    return 1 if contiene_parenteral else 0
+    def __init__(self, valores: tuple):
+        self._valores = valores
 
+    @classmethod
+    def desde_columnas(cls, columnas: dict) -> "FilaPuntuada":
+        return cls(tuple(columnas[columna] for columna in COLUMNAS_BASE))
 
-#----------------------------------------------------------------------
-for paciente_id, paciente_info in data.items():
-    if not isinstance(paciente_info, dict):
-        continue
+    def __getitem__(self, columna):
+        indice = _INDICE_COLUMNA.get(columna)
+        if indice is not None:
+            return self._valores[indice]
+        if columna in _COLUMNAS_RAM_ADICIONALES:
+            return 0 if self._valores[_INDICE_RAM] == 0 else ""
+        raise KeyError(columna)
+
+    def __iter__(self):
+        return iter(COLUMNAS_FINALES)
+
+    def __len__(self):
+        return len(COLUMNAS_FINALES)
 
-    print(paciente_info)
+    def valores_hoja(self) -> list:
+        """Valores de todas las columnas, en el orden de COLUMNAS_FINALES."""
+        return [self[columna] for columna in COLUMNAS_FINALES]
 
+    def a_dict(self) -> dict:
+        return dict(zip(COLUMNAS_FINALES, self.valores_hoja()))
+
+    def __repr__(self):
+        return f"FilaPuntuada({self.a_dict()!r})"
+
+
+
+def puntuar_paciente(paciente_info: Mapping) -> FilaPuntuada:
+    """
+    Convierte el diccionario de un paciente (tal como lo entrega
+    ExtraerDatosDelExcel, o su PacienteRegistro) en la fila de la hoja para subir.
+    No lee ni escribe archivos ni depende de variables globales.
+    """
     nombre = str(paciente_info.get("nombre", "")).strip()
 
     # Edad y tipo identificación
@@ -622,49 +804,6 @@ for paciente_id, paciente_info in data.items():
     else:
         ultimos_6_meses = 4
 
-    # Clasificación de enfermedades
-    otro_diag = str(paciente_info.get("otro_diagnostico", "")).lower()
-    clasificacion = {key: 0 for key in categorias}
-    otros_enfermedades = []
-
-    for enfermedad in re.split(r'[;,.\n]+', otro_diag):
-        enfermedad = enfermedad.strip()
-        clasificada = False
-        for categoria, palabras in categorias.items():
-            if any(p in enfermedad for p in palabras):
-                clasificacion[categoria] = 1
-                clasificada = True
-                break
-        if enfermedad and not clasificada and enfermedad != "niega":
-            otros_enfermedades.append(enfermedad)
-
-    # -------------------------
-    # COMORBILIDADES (categorías del 1 al 9)
-    comorbilidades = sum(clasificacion[c] for c in list(categorias.keys()))
-    if comorbilidades == 1:
-        presenta_comorbilidades = 2
-    elif comorbilidades >= 2:
-        presenta_comorbilidades = 4
-    else:
-        presenta_comorbilidades = 0
-
-    # -------------------------
-    # APLICA CLINIMETRÍA
-    clinimetria_tipo = str(paciente_info.get("clinimetria_tipo", "")).strip().lower()
-    if clinimetria_tipo and clinimetria_tipo != "no aplica":
-        aplica_clinimetria = 4
-    else:
-        aplica_clinimetria = 0
-    # -------------------------
-    # COMORBILIDADES (categorías del 1 al 9)
-    comorbilidades = sum(clasificacion[c] for c in list(categorias.keys()))
-    if comorbilidades == 1:
-        presenta_comorbilidades = 2
-    elif comorbilidades >= 2:
-        presenta_comorbilidades = 4
-    else:
-        presenta_comorbilidades = 0
-
     # -------------------------
     # APLICA CLINIMETRÍA
     clinimetria_tipo = str(paciente_info.get("clinimetria_tipo", "")).strip().lower()
@@ -674,7 +813,6 @@ for paciente_id, paciente_info in data.items():
         aplica_clinimetria = 0
 
     # === CLASIFICACIÓN DE CLINIMETRÍA ===
-    clinimetria_tipo = str(paciente_info.get("clinimetria_tipo", "")).strip().lower()
     clinimetria_valor = paciente_info.get("clinimetria_valor", None)
 
     # Normalizar el tipo de clinimetría
@@ -700,9 +838,104 @@ for paciente_id, paciente_info in data.items():
     else:
         das28_clasificacion = sledai_clasificacion = asdas_clasificacion = 0
 
-    # ------------------------------------
-    # CAMBIO EN LA MEDICACIÓN (columna nueva)
+#---------columan -adherencia a otros tratamiento -----------------------
+    adherencia_mirosky=str(paciente_info.get("adherencia_global","")).lower()
+    # Evaluar adherencia para otros tratamientos
+    if adherencia_mirosky == "no adherente":
+        adherencia_otros_tratamientos = 4
+    elif adherencia_mirosky == "parcialmente adherente":
+        adherencia_otros_tratamientos = 3
+    elif adherencia_mirosky == "adherente":
+        adherencia_otros_tratamientos = 1
+    else:
+        adherencia_otros_tratamientos = 0  # No evaluable
+
+
+    # Columnas de texto libre
+    texto_libre = puntuar_columnas_texto(paciente_info)
+
+    #--------------------colimna de tipo farmaco siemroe es 1
+    tipo_farmaco=1
+    #-.--------------------------- RAM
+    texto=str(paciente_info.get("ram")).lower()
+    ram = 0 if "niega" in texto else 1
+    ram_0no_1si=0 if "niega" in texto else 1
+    # Las columnas RAM adicionales las deduce FilaPuntuada de "RAM"
+
+#-------------------------------------------------------------------------------------
+
+    # Guardar los datos del paciente
+    fila_paciente = {
+        "Nombre": nombre,
+        "Tipo Identificación": tipo_identificacion,
+        "Edad": edad,
+        "Grado Escolaridad": escolaridad,
+        "Género": genero,
+        "Gestación": gestacion,
+        "Consumo de SPA": consumo_spa,
+        "4. Consumo de alcohol o drogas que interacciona con medicamento": interaccion_medicamento,
+        "Trastornos mentales": trastornos_mentales,
+        "Factores relacionados con el trato paciente": trato_paciente,
+        "hospitalizacion ultimos 6 meses": ultimos_6_meses,
+        # Enfermedades (se asignan desde las columnas de texto libre)
+        **{categoria: texto_libre[categoria] for categoria in categorias},
+        "10. Otros": texto_libre["10. Otros"],
+        "¿Cuáles otras?": texto_libre["¿Cuáles otras?"],
+        "4. Presenta más de 2 comorbilidades de la lista \n2. Presenta 1 comorbilidad de la lista": texto_libre["4. Presenta más de 2 comorbilidades de la lista \n2. Presenta 1 comorbilidad de la lista"],
+        "APLICA CLINIMETRÍA\n0. No, requiere de otro parametro\n4. Si, pero es > a 2 meses": aplica_clinimetria,
+        "das28_clasificacion": das28_clasificacion,
+        "sledai_clasificacion": sledai_clasificacion,
+        "asdas_clasificacion": asdas_clasificacion,
+        "polimedicacion": texto_libre["polimedicacion"],
+        "Cambio en Medicacion": texto_libre["Cambio en Medicacion"],
+        "INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK": texto_libre["INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK"],
+        "INICIO TRATAMIENTO DMARDS": texto_libre["INICIO TRATAMIENTO DMARDS"],
+        "ADHERENCIA MIROSKY GREEN BIOLOGICO": texto_libre["ADHERENCIA MIROSKY GREEN BIOLOGICO"],
+        "ADHERENCIA MIROSKY GREEN JACK": texto_libre["ADHERENCIA MIROSKY GREEN JACK"],
+        "ADHERENCIA MIROSKY DMARDS": texto_libre["ADHERENCIA MIROSKY DMARDS"],
+        "ADHERENCIA A OTROS TRATAMIENTOS FARMACOLOGICOS":adherencia_otros_tratamientos,
+        "Dispensacion parenteral": texto_libre["Dispensacion parenteral"],
+        "Dispesacion medicamentos oral": texto_libre["Dispesacion medicamentos oral"],
+        "Interacciones 1si 2no": texto_libre["Interacciones 1si 2no"],
+        "interacciones mayores que requieran": texto_libre["interacciones mayores que requieran"],
+        "clasificacion relevancia": texto_libre["clasificacion relevancia"],
+        "mecanismo farmadinamicas": texto_libre["mecanismo farmadinamicas"],
+        "farmaco":tipo_farmaco,
+        "descripcion de las molecula": texto_libre["descripcion de las molecula"],
+        "columna 0no 1 si de ram":ram_0no_1si,
+        "RAM": ram,
+    }
+
+    return FilaPuntuada.desde_columnas(fila_paciente)
+
+
+# Separadores de medicamentos distintos en tratamiento + conciliación
+PATRON_SEPARADOR_MEDICAMENTOS = re.compile(r'[\n,]')
+# Texto después de "significativas:" o "significativa:" en las interacciones
+PATRON_INTERACCIONES_SIGNIFICATIVAS = re.compile(r'significativas?:\s*(.*)')
+
+
+def puntuar_columnas_texto(paciente_info: Mapping) -> dict:
+    """
+    Columnas que salen de buscar en texto libre (comorbilidades, medicamentos,
+    fechas de tratamiento, dispensación e interacciones). Es la parte de la
+    puntuación que se hace paciente por paciente también en el modo columnar.
+    """
+    # Clasificación de enfermedades
+    otro_diag = str(paciente_info.get("otro_diagnostico", "")).lower()
+    clasificacion, otros_enfermedades = clasificar_comorbilidades(otro_diag)
+
+    # -------------------------
+    # COMORBILIDADES (categorías del 1 al 9)
+    comorbilidades = sum(clasificacion[c] for c in list(categorias.keys()))
+    if comorbilidades == 1:
+        presenta_comorbilidades = 2
+    elif comorbilidades >= 2:
+        presenta_comorbilidades = 4
+    else:
+        presenta_comorbilidades = 0
 
+    # ------------------------------------
     # CAMBIO EN LA MEDICACIÓN (columna nueva)
 
     # Extraer campos de tratamiento
@@ -714,11 +947,10 @@ for paciente_id, paciente_info in data.items():
 
     # Separar solo por saltos de línea y comas (indicadores de medicamentos distintos)
 
-    meds_separados = re.split(r'[\n,]', todos_meds)
+    meds_separados = PATRON_SEPARADOR_MEDICAMENTOS.split(todos_meds)
 
     # Limpiar y mantener medicamentos que contienen '+', ya que son compuestos
     lista_meds = [med.strip() for med in meds_separados if med.strip()]
-    print("MEDICAMENTOS:", lista_meds)
 
     # Extraer el nombre base del medicamento (primeras dos palabras por seguridad)
     nombres_base = set()
@@ -733,48 +965,34 @@ for paciente_id, paciente_info in data.items():
         nombres_base.add(nombre_base)
 
     # Evaluar cuántos medicamentos únicos hay
-    polimedicacion = 4 if len(nombres_base) >= 5 else 0
+    criterios = reglas_puntuacion()
+    polimedicacion = criterios.puntaje_polimedicacion if len(nombres_base) >= criterios.minimo_polimedicacion else 0
 
     #-------------------------- mirar la fecha de los medicamentos
-    # Extraer campos de tratamiento
-    tratamiento_principal = str(paciente_info.get("tratamiento_principal", "")).lower().replace("vita d", "vitamina d")
-    fecha_actual=str(paciente_info.get("fecha_consulta", "")).lower()
+    # Se convierte una sola vez para todas las columnas (en caché para todo el
+    # libro); un date/datetime del registro se usa tal cual, sin pasar por texto
+    fecha_consulta = parsear_fecha_consulta(paciente_info.get("fecha_consulta", ""))
     # Extraer fechas del texto de tratamiento
-    fechas_tratamiento = extraer_fechas(tratamiento_principal,fecha_actual)
-    print("Fechas encontradas:", fechas_tratamiento)
+    fechas_tratamiento = extraer_fechas(tratamiento_principal,fecha_consulta)
 
-    cambio_en_medicacion=clasificar_fecha_tratamiento(fechas_tratamiento,fecha_actual)
+    cambio_en_medicacion=clasificar_fecha_tratamiento(fechas_tratamiento,fecha_consulta)
 #--------------------------------------------------------------------------
 
-    #EVALUAR INICIO BIOLOGICO YACK DMARDS ----------------------------------------------
+    # Medicamentos del tratamiento: se buscan una sola vez para todas las columnas
+    medicamentos = detectar_medicamentos(tratamiento_principal)
 
-    tratamiento_principal = str(paciente_info.get("tratamiento_principal", "")).lower().replace("vita d", "vitamina d")
-    inicio_tratamiendo_biologico_yack=evaluar_tratamiento_con_fecha_biologico_yak(tratamiento_principal,fecha_actual)
+    #EVALUAR INICIO BIOLOGICO YACK DMARDS ----------------------------------------------
+    inicio_tratamiendo_biologico_yack=evaluar_tratamiento_con_fecha_biologico_yak(tratamiento_principal,fecha_consulta,medicamentos)
     #EVALUAR DEMARDS
-    inicio_tratamiendo_demards=evaluar_tratamiento_con_fecha_dmards(tratamiento_principal,fecha_actual)
+    inicio_tratamiendo_demards=evaluar_tratamiento_con_fecha_dmards(tratamiento_principal,fecha_consulta,medicamentos)
 # adeherencia test miroski biologico ------------------------------------------------------------------
-    tratamiento_principal =str(paciente_info.get("tratamiento_principal", "")).lower().replace("vita d", "vitamina d")
     adherencia_mirosky=str(paciente_info.get("adherencia_global","")).lower()
-    BIOLOGICO_ADHERENCIA_MIROSKY = evaluar_adherencia_biologicos(tratamiento_principal, adherencia_mirosky)
+    BIOLOGICO_ADHERENCIA_MIROSKY = evaluar_adherencia_biologicos(tratamiento_principal, adherencia_mirosky, medicamentos)
 #ADHERENCIA inibidores ajck
-    JACK_ADHERENCIA_MIROSKY=evaluar_adherencia_inhibidoresjack(tratamiento_principal,adherencia_mirosky)
+    JACK_ADHERENCIA_MIROSKY=evaluar_adherencia_inhibidoresjack(tratamiento_principal,adherencia_mirosky,medicamentos)
 #ADHERENCIA DMARDS
-    DMARDS_ADHERENCIA_MIROSKY=evaluar_adherencia_demards(tratamiento_principal,adherencia_mirosky)
-#---------columan -adherencia a otros tratamiento -----------------------
-    adherencia_mirosky = str(paciente_info.get("adherencia_global", "")).lower()
-
-    # Evaluar adherencia para otros tratamientos
-    if adherencia_mirosky == "no adherente":
-        adherencia_otros_tratamientos = 4
-    elif adherencia_mirosky == "parcialmente adherente":
-        adherencia_otros_tratamientos = 3
-    elif adherencia_mirosky == "adherente":
-        adherencia_otros_tratamientos = 1
-    else:
-        adherencia_otros_tratamientos = 0  # No evaluable
-
+    DMARDS_ADHERENCIA_MIROSKY=evaluar_adherencia_demards(tratamiento_principal,adherencia_mirosky,medicamentos)
 #---------------------------------DISPENSACION tengo 2 columasn aca la columan  ORAL y la columan  parenteral---------------------------------
-    adherencia_mirosky = str(paciente_info.get("adherencia_global", "")).lower()
     dispensacion = str(paciente_info.get("dispensacion", "")).lower()
 
     # Inicializamos el valor
@@ -784,7 +1002,7 @@ for paciente_id, paciente_info in data.items():
     if adherencia_mirosky in ["adherente", "parcialmente adherente"]:
         if "dispensacion parcial" in dispensacion:
             valor_dispensacion_oral = 2
-            parenteral=evaluar_parenteral()
+            parenteral=evaluar_parenteral(tratamiento_principal, medicamentos)
         elif "dispensacion completa" in dispensacion:
             valor_dispensacion_oral = 1
             parenteral=0
@@ -801,16 +1019,8 @@ for paciente_id, paciente_info in data.items():
 #--------------------- INTERACCIOENS SI NO ---------------------------
     texto = str(paciente_info.get("interacciones_farmacologicas", "")).lower()
 
-    # Lista de medicamentos clave en minúsculas
-    medicamentos_clave = [
-        "leflunomida", "metotrexato", "cloroquina", "sulfasalazina", "prednisolona",
-        "azatioprina", "hidroxicloroquina", "daflazacort", "etoricoxib", "etanercept",
-        "adalimumab", "rituximab", "tocilizumab", "abatacept", "infliximab",
-        "golimumab", "certolizumab", "secukinumab", "belimumab"
-    ]
-
     # Buscar texto después de "significativas:" o "significativa:"
-    match = re.search(r'significativas?:\s*(.*)', texto)
+    match = PATRON_INTERACCIONES_SIGNIFICATIVAS.search(texto)
     contenido = match.group(1).strip() if match else ""
 
     if "ninguna" in contenido or contenido == "":
@@ -823,76 +1033,17 @@ for paciente_id, paciente_info in data.items():
         interacciones = 1
         # Filtrar medicamentos presentes en el contenido
         descripcion_molecula = "; ".join([
-    med.capitalize() for med in medicamentos_clave if med in contenido
+    med.capitalize() for med in medicamentos_de_grupo(detectar_medicamentos(contenido), "interacciones")
     ]) or 0
 
         interacciones_mayores = 2
         clasificacion_relevancia = 3
         mecanismo = 1 if descripcion_molecula else 2
-    #--------------------colimna de tipo farmaco siemroe es 1
-    tipo_farmaco=1
-    #-.--------------------------- RAM
-    texto=str(paciente_info.get("ram")).lower()
-    ram = 0 if "niega" in texto else 1
-    ram_0no_1si=0 if "niega" in texto else 1
-    # Nuevas columnas RAM adicionales
-    columnas_ram_adicionales = {
-        "MEDICAMENTO_SOSPECHOSO": 0 if ram == 0 else "",
-        "ESTADO ACUTAL RAM": 0 if ram == 0 else "",
-        "0NO 2 SI": 0 if ram == 0 else "",
-        "TIPO": 0 if ram == 0 else "",
-        "DEFINIDO POR COMITE FV": 0 if ram == 0 else "",
-        "0 NO 1 SI": 0 if ram == 0 else "",
-        "ADMINISTRACION ERRONEA DEL MEDICAMENTO": 0 if ram == 0 else "",
-        "CARACTERISTICAS PERSONALES": 0 if ram == 0 else "",
-        "CONVERSACION INADECUADA": 0 if ram == 0 else "",
-        "CONTRAINDICACION": 0 if ram == 0 else "",
-        "DOSIS PAUTAS": 0 if ram == 0 else "",
-        "DUPLICIDAD": 0 if ram == 0 else "",
-        "ERRROES EN LA DISPENSACION": 0 if ram == 0 else "",
-        "ERRORES EN LA PRESCIRPCION": 0 if ram == 0 else "",
-        "IN CUMPLIMIENTO": 0 if ram == 0 else "",
-        "INTERACCIONES": 0 if ram == 0 else "",
-        "OTROS PROBLEMAS": 0 if ram == 0 else "",
-        "PROBAVBILIDAD DE EFECTOS ADVERSOS": 0 if ram == 0 else "",
-        "PROBLEMA DE SALUD": 0 if ram == 0 else "",
-        "OTROS": 0 if ram == 0 else ""
-    }
-
-
-
-#-------------------------------------------------------------------------------------
-
-    # Guardar los datos del paciente
-    fila_paciente = {
-        "Nombre": nombre,
-        "Tipo Identificación": tipo_identificacion,
-        "Edad": edad,
-        "Grado Escolaridad": escolaridad,
-        "Género": genero,
-        "Gestación": gestacion,
-        "Consumo de SPA": consumo_spa,
-        "4. Consumo de alcohol o drogas que interacciona con medicamento": interaccion_medicamento,
-        "Trastornos mentales": trastornos_mentales,
-        "Factores relacionados con el trato paciente": trato_paciente,
-        "hospitalizacion ultimos 6 meses": ultimos_6_meses,
-        # Enfermedades (se asignan desde el diccionario `clasificacion`)
-        "1. Enfermedad cardiovascular": clasificacion["1. Enfermedad cardiovascular"],
-        "2. Hipertensión arterial": clasificacion["2. Hipertensión arterial"],
-        "3. Diabetes mellitus": clasificacion["3. Diabetes mellitus"],
-        "4. Enfermedad renal": clasificacion["4. Enfermedad renal"],
-        "5. Enfermedad hepatica": clasificacion["5. Enfermedad hepatica"],
-        "6. Osteoporosis/ Artrosis/ Osteoartrosis": clasificacion["6. Osteoporosis/ Artrosis/ Osteoartrosis"],
-        "7. Enfermedad gastrointestinal": clasificacion["7. Enfermedad gastrointestinal"],
-        "8. Hipotiroidismo/Hipertiroidismo": clasificacion["8. Hipotiroidismo/Hipertiroidismo"],
-        "9. Cancer": clasificacion["9. Cancer"],
+    return {
+        **clasificacion,
         "10. Otros": 1 if otros_enfermedades else 0,
         "¿Cuáles otras?": ", ".join(otros_enfermedades)if otros_enfermedades else 0,
         "4. Presenta más de 2 comorbilidades de la lista \n2. Presenta 1 comorbilidad de la lista": presenta_comorbilidades,
-        "APLICA CLINIMETRÍA\n0. No, requiere de otro parametro\n4. Si, pero es > a 2 meses": aplica_clinimetria,
-        "das28_clasificacion": das28_clasificacion,
-        "sledai_clasificacion": sledai_clasificacion,
-        "asdas_clasificacion": asdas_clasificacion,
         "polimedicacion": polimedicacion,
         "Cambio en Medicacion":cambio_en_medicacion,
         "INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK": inicio_tratamiendo_biologico_yack,
@@ -900,87 +1051,755 @@ for paciente_id, paciente_info in data.items():
         "ADHERENCIA MIROSKY GREEN BIOLOGICO":BIOLOGICO_ADHERENCIA_MIROSKY,
         "ADHERENCIA MIROSKY GREEN JACK":JACK_ADHERENCIA_MIROSKY,
         "ADHERENCIA MIROSKY DMARDS":DMARDS_ADHERENCIA_MIROSKY,
-        "ADHERENCIA A OTROS TRATAMIENTOS FARMACOLOGICOS":adherencia_otros_tratamientos,
         "Dispensacion parenteral":parenteral,
         "Dispesacion medicamentos oral": valor_dispensacion_oral,
         "Interacciones 1si 2no":interacciones,
         "interacciones mayores que requieran":interacciones_mayores,
         "clasificacion relevancia":clasificacion_relevancia,
         "mecanismo farmadinamicas":mecanismo,
-        "farmaco":tipo_farmaco,
         "descripcion de las molecula":descripcion_molecula,
-        "columna 0no 1 si de ram":ram_0no_1si,
+    }
+
+
+def puntuar_pacientes(pacientes) -> List[FilaPuntuada]:
+    """
+    Puntúa un iterable de pacientes. Acepta el diccionario {id: paciente} del
+    extractor (o su JSON) o cualquier iterable de diccionarios de paciente o
+    PacienteRegistro; los demás elementos se ignoran.
+    """
+    if isinstance(pacientes, dict):
+        pacientes = pacientes.values()
+    return [puntuar_paciente(paciente_info) for paciente_info in pacientes if isinstance(paciente_info, Mapping)]
+
+
+#puntuacion columnar----------------------------------------------------
+# Las reglas simples (edad, escolaridad, género, SPA, hospitalización,
+# clinimetría, adherencia a otros tratamientos y RAM) se calculan sobre
+# columnas completas con operaciones vectorizadas; las columnas que salen de
+# texto libre se siguen calculando paciente por paciente con
+# puntuar_columnas_texto. El resultado es el mismo DataFrame que
+# construir_dataframe(puntuar_pacientes(...)).
+
+# Campos del paciente que lee puntuar_columnas_texto
+CAMPOS_TEXTO_LIBRE = (
+    "otro_diagnostico", "tratamiento_principal", "conciliacion_medicamentos", "fecha_consulta",
+    "adherencia_global", "dispensacion", "interacciones_farmacologicas",
+)
+
+
+def _columna_texto(registros: List[Mapping], campo: str, defecto="") -> pd.Series:
+    return pd.Series([str(paciente.get(campo, defecto)) for paciente in registros], dtype=object)
+
+
+def _contiene(columna: pd.Series, *palabras) -> np.ndarray:
+    return np.logical_or.reduce([columna.str.contains(palabra, regex=False).to_numpy(dtype=bool) for palabra in palabras])
+
+
+def _valor_numerico(valor) -> Optional[float]:
+    try:
+        return float(valor)
+    except (ValueError, TypeError):
+        return None
+
+
+def clasificar_escolaridad_columna(escolaridad: pd.Series) -> np.ndarray:
+    """clasificar_escolaridad sobre una columna completa de textos."""
+    return reglas_puntuacion().escolaridad.clasificar_columna(escolaridad)
+
+
+def clasificar_clinimetria_columnas(tipos: pd.Series, valores: pd.Series):
+    """
+    clasificar_clinimetria sobre columnas completas. `tipos` ya normalizados
+    ('das28', 'sledai', 'asdas' o ''); `valores` con NaN donde no hay número.
+    Devuelve (das28, sledai, asdas) como arreglos.
+    """
+    valores = valores.to_numpy(dtype=float)
+    tipos = tipos.to_numpy(dtype=object)
+    return tuple(
+        np.where(tipos == tipo, reglas_puntuacion().clinimetria[tipo].puntuar_arreglo(valores), 0).astype(int)
+        for tipo in ("das28", "sledai", "asdas")
+    )
+
+
+def puntuar_pacientes_columnar(pacientes) -> pd.DataFrame:
+    """
+    Igual que construir_dataframe(puntuar_pacientes(pacientes)), pero con las
+    reglas simples vectorizadas. Pensado para puntuar históricos grandes.
+    """
+    if isinstance(pacientes, dict):
+        pacientes = pacientes.values()
+    registros = [paciente_info for paciente_info in pacientes if isinstance(paciente_info, Mapping)]
+    total = len(registros)
+    if total == 0:
+        return construir_dataframe([])
+
+    with perfilado.etapa("puntuación: columnas vectorizadas"):
+        columnas = _puntuar_columnas_simples(registros, total)
+
+    # Columnas de texto libre, una vez por combinación distinta de textos
+    # (en los históricos el mismo tratamiento se repite consulta tras consulta)
+    with perfilado.etapa("puntuación: columnas de texto libre"):
+        filas_texto = []
+        calculadas = {}
+        for paciente_info in registros:
+            clave = tuple((type(valor), valor) for valor in (paciente_info.get(campo, "") for campo in CAMPOS_TEXTO_LIBRE))
+            try:
+                fila = calculadas.get(clave)
+            except TypeError:  # valores no hashables: se calcula sin guardar
+                fila = puntuar_columnas_texto(paciente_info)
+            else:
+                if fila is None:
+                    fila = calculadas[clave] = puntuar_columnas_texto(paciente_info)
+            filas_texto.append(fila)
+    for columna in COLUMNAS_FINALES:
+        if columna not in columnas:
+            columnas[columna] = [fila[columna] for fila in filas_texto]
+
+    return pd.DataFrame(columnas, columns=COLUMNAS_FINALES)
+
+
+def _puntuar_columnas_simples(registros: List[Mapping], total: int) -> dict:
+    """Columnas de reglas simples del modo columnar, como listas de valores de celda."""
+    # Edad y tipo identificación
+    edades = [paciente.get("edad") for paciente in registros]
+    es_entero = np.array([isinstance(edad, int) for edad in edades], dtype=bool)
+    edad = pd.Series([edad if entero else None for edad, entero in zip(edades, es_entero)], dtype=object)
+    mayor_de_edad = (edad.where(es_entero, 0) >= 18).to_numpy(dtype=bool)
+    tipo_identificacion = np.where(es_entero, np.where(mayor_de_edad, 1, 2), None)
+
+    escolaridad = clasificar_escolaridad_columna(_columna_texto(registros, "nivel_escolaridad").str.strip())
+
+    # Género: 2 sólo si dice masculino y no femenino
+    observaciones = _columna_texto(registros, "observaciones").str.strip().str.upper()
+    genero = np.where(~_contiene(observaciones, "FEMENINO") & _contiene(observaciones, "MASCULINO"), 2, 1)
+
+    # Consumo de SPA
+    niega = {}
+    for campo in ("consumo_alcohol", "consumo_tabaco", "consumo_sustancias"):
+        valor = _columna_texto(registros, campo).str.strip().str.strip('"').str.upper()
+        niega[campo] = (valor == "NIEGA").to_numpy(dtype=bool)
+    consumo_spa = np.select(
+        [
+            niega["consumo_alcohol"] & niega["consumo_tabaco"] & niega["consumo_sustancias"],
+            ~niega["consumo_tabaco"],
+            ~niega["consumo_alcohol"],
+            ~niega["consumo_sustancias"],
+        ],
+        [0, 1, 2, 3],
+        default=0,
+    )
+
+    # Hospitalización últimos 6 meses
+    hospitalizacion = _columna_texto(registros, "hospitalizacion_ultimos_6_meses").str.strip().str.lower()
+    ultimos_6_meses = np.where(hospitalizacion.isin(["no", "no especificado"]).to_numpy(dtype=bool), 0, 4)
+
+    # Clinimetría
+    clinimetria_tipo = _columna_texto(registros, "clinimetria_tipo").str.strip().str.lower()
+    aplica_clinimetria = np.where(((clinimetria_tipo != "") & (clinimetria_tipo != "no aplica")).to_numpy(dtype=bool), 4, 0)
+    tipo_normalizado = pd.Series(np.select(
+        [_contiene(clinimetria_tipo, "das28"), _contiene(clinimetria_tipo, "asdas"), _contiene(clinimetria_tipo, "sledai")],
+        ["das28", "asdas", "sledai"],
+        default="",
+    ), dtype=object)
+    numeros = [_valor_numerico(paciente.get("clinimetria_valor", None)) for paciente in registros]
+    tipo_normalizado[[numero is None for numero in numeros]] = ""
+    valores = pd.Series([np.nan if numero is None else numero for numero in numeros], dtype=float)
+    das28_clasificacion, sledai_clasificacion, asdas_clasificacion = clasificar_clinimetria_columnas(tipo_normalizado, valores)
+
+    # Adherencia a otros tratamientos
+    adherencia = _columna_texto(registros, "adherencia_global").str.lower()
+    adherencia_otros_tratamientos = np.select(
+        [adherencia == "no adherente", adherencia == "parcialmente adherente", adherencia == "adherente"],
+        [4, 3, 1],
+        default=0,  # No evaluable
+    )
+
+    # RAM (sin valor por defecto: un paciente sin "ram" cuenta como RAM)
+    ram_niega = _contiene(_columna_texto(registros, "ram", None).str.lower(), "niega")
+    ram = np.where(ram_niega, 0, 1)
+    ram_adicional = np.full(total, "", dtype=object)
+    ram_adicional[ram_niega] = 0
+
+    columnas = {
+        "Nombre": _columna_texto(registros, "nombre").str.strip(),
+        "Tipo Identificación": tipo_identificacion,
+        "Edad": edad,
+        "Grado Escolaridad": escolaridad,
+        "Género": genero,
+        "Gestación": np.zeros(total, dtype=int),
+        "Consumo de SPA": consumo_spa,
+        "4. Consumo de alcohol o drogas que interacciona con medicamento": np.zeros(total, dtype=int),
+        "Trastornos mentales": np.zeros(total, dtype=int),
+        "Factores relacionados con el trato paciente": np.zeros(total, dtype=int),
+        "hospitalizacion ultimos 6 meses": ultimos_6_meses,
+        "APLICA CLINIMETRÍA\n0. No, requiere de otro parametro\n4. Si, pero es > a 2 meses": aplica_clinimetria,
+        "das28_clasificacion": das28_clasificacion,
+        "sledai_clasificacion": sledai_clasificacion,
+        "asdas_clasificacion": asdas_clasificacion,
+        "ADHERENCIA A OTROS TRATAMIENTOS FARMACOLOGICOS": adherencia_otros_tratamientos,
+        "farmaco": np.ones(total, dtype=int),
+        "columna 0no 1 si de ram": ram,
         "RAM": ram,
-        **columnas_ram_adicionales
+        **{columna: ram_adicional for columna in COLUMNAS_RAM_ADICIONALES},
+    }
+    # Mismos tipos de valor que en las filas del modo por paciente
+    return {columna: valores.tolist() for columna, valores in columnas.items()}
+
+
+def construir_dataframe(filas: List[Mapping]) -> pd.DataFrame:
+    """DataFrame con las filas puntuadas en el orden de columnas de la hoja para subir."""
+    # Las columnas se toman en el orden definido (también sirve con cero filas)
+    if all(isinstance(fila, FilaPuntuada) for fila in filas):
+        return pd.DataFrame([fila.valores_hoja() for fila in filas], columns=COLUMNAS_FINALES)
+    filas = [fila.a_dict() if isinstance(fila, FilaPuntuada) else fila for fila in filas]
+    return pd.DataFrame(filas, columns=COLUMNAS_FINALES)
+
+
+def _valor_celda(valor):
+    """Valor tal como lo escribe df.to_excel: NaN/None vacío e infinitos como texto."""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if valor is None:
+        return None
+    if isinstance(valor, float):
+        if np.isnan(valor):
+            return None
+        if np.isinf(valor):
+            return "inf" if valor > 0 else "-inf"
+    return valor
+
+
+def exportar_excel(df: pd.DataFrame, archivo: str = RUTA_EXCEL_SALIDA):
+    """
+    Guarda la hoja para subir y marca en rojo las celdas RAM == 1.
+    El libro se escribe una sola vez, fila a fila (openpyxl en modo
+    write_only, sin armar todas las celdas en memoria), y el rojo es una
+    regla de formato condicional sobre la columna RAM en vez de pintar
+    celda por celda reabriendo el archivo.
+    """
+    from openpyxl import Workbook
+    from openpyxl.formatting.rule import CellIsRule
+    from openpyxl.styles import PatternFill
+    from openpyxl.utils import get_column_letter
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Sheet1")
+    hoja.append([str(columna) for columna in df.columns])
+    for fila in df.itertuples(index=False, name=None):
+        hoja.append([_valor_celda(valor) for valor in fila])
+
+    # ------------------------------------------
+    # Formato rojo si RAM == 1
+    # ------------------------------------------
+    if "RAM" in df.columns and len(df):
+        letra = get_column_letter(df.columns.get_loc("RAM") + 1)
+        rojo = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+        hoja.conditional_formatting.add(
+            f"{letra}2:{letra}{len(df) + 1}",
+            CellIsRule(operator="equal", formula=["1"], fill=rojo),
+        )
+
+    libro.save(archivo)
+
+
+# Hoja dentro del .xlsx que escribe exportar_excel y patrones de sus filas
+# (los textos van escapados, así que '<row r="' y '<c r="' sólo aparecen como etiquetas)
+HOJA_XML = "xl/worksheets/sheet1.xml"
+PATRON_FILA_XML = re.compile(rb'<row r="(\d+)"')
+PATRON_CELDA_XML = re.compile(rb'<c r="([A-Z]+)(\d+)"')
+
+
+def anexar_excel(df: pd.DataFrame, archivo: str, filas_antes: int) -> bool:
+    """
+    Agrega las filas de `df` al final de una hoja escrita por exportar_excel
+    que ya tiene `filas_antes` filas de datos, sin volver a escribir las
+    anteriores: las filas nuevas se escriben con openpyxl en un libro aparte,
+    se renumeran y se insertan en la hoja, y se extiende la regla roja de
+    RAM. El resultado es el mismo que exportar_excel con todas las filas.
+    Devuelve False (sin tocar el archivo) si la hoja no tiene la forma
+    esperada; entonces hay que exportarla completa.
+    """
+    import zipfile
+    from io import BytesIO
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    if not filas_antes or not len(df) or "RAM" not in df.columns:
+        return False
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Sheet1")
+    for fila in df.itertuples(index=False, name=None):
+        hoja.append([_valor_celda(valor) for valor in fila])
+    nuevo = BytesIO()
+    libro.save(nuevo)
+    with zipfile.ZipFile(nuevo) as libro_nuevo:
+        hoja_nueva = libro_nuevo.read(HOJA_XML)
+    inicio = hoja_nueva.find(b"<sheetData>") + len(b"<sheetData>")
+    filas_xml = hoja_nueva[inicio:hoja_nueva.rfind(b"</sheetData>")]
+    desplazamiento = filas_antes + 1   # encabezado + filas anteriores
+    filas_xml = PATRON_FILA_XML.sub(lambda m: b'<row r="%d"' % (int(m[1]) + desplazamiento), filas_xml)
+    filas_xml = PATRON_CELDA_XML.sub(lambda m: b'<c r="%s%d"' % (m[1], int(m[2]) + desplazamiento), filas_xml)
+
+    letra = get_column_letter(df.columns.get_loc("RAM") + 1).encode()
+    rango_antes = b'sqref="%s2:%s%d"' % (letra, letra, filas_antes + 1)
+    rango = b'sqref="%s2:%s%d"' % (letra, letra, filas_antes + len(df) + 1)
+    try:
+        with zipfile.ZipFile(archivo) as libro_antes:
+            contenido = libro_antes.read(HOJA_XML)
+            fin = contenido.rfind(b"</sheetData>")
+            if fin < 0 or contenido.count(rango_antes) != 1 or b'<row r="%d"' % (filas_antes + 2) in contenido:
+                return False
+            contenido = (contenido[:fin] + filas_xml + contenido[fin:]).replace(rango_antes, rango)
+            with zipfile.ZipFile(archivo + ".tmp", "w") as libro_despues:
+                for info in libro_antes.infolist():
+                    libro_despues.writestr(info, contenido if info.filename == HOJA_XML else libro_antes.read(info))
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+    os.replace(archivo + ".tmp", archivo)
+    return True
+
+
+def _columna_texto_tipada(serie: pd.Series) -> pd.Series:
+    """
+    Columna object de la hoja: si sólo trae enteros o vacíos (p. ej. las
+    columnas de RAM adicionales) queda como entero con nulos; si no, como
+    texto, category salvo que casi todos los valores sean distintos.
+    """
+    valores = serie.tolist()
+    if all(valor == "" or valor is None or (isinstance(valor, (int, np.integer)) and not isinstance(valor, bool))
+           for valor in valores):
+        enteros = pd.Series([None if valor == "" or valor is None else int(valor) for valor in valores], dtype="Int64")
+        return pd.to_numeric(enteros, downcast="integer")
+    texto = pd.Series(["" if _valor_celda(valor) is None else str(valor) for valor in valores], dtype="string")
+    if texto.nunique() <= MAX_PROPORCION_CATEGORIA * len(texto):
+        return texto.astype("category")
+    return texto
+
+
+def tabla_columnar(df: pd.DataFrame, fechas_consulta) -> pd.DataFrame:
+    """
+    La hoja con tipos para análisis: los códigos enteros en el entero más
+    chico que alcanza (int8 para los 0-4), el texto como category y dos
+    columnas más, fecha_consulta (fecha) y mes_consulta ("aaaa-mm" o
+    "sin_fecha"). `fechas_consulta` trae la fecha de consulta de cada fila.
+    """
+    tabla = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if serie.dtype.kind in "iu":
+            tabla[columna] = pd.to_numeric(serie, downcast="integer")
+        elif serie.dtype == object:
+            tabla[columna] = _columna_texto_tipada(serie)
+        else:
+            tabla[columna] = serie
+    fechas = pd.to_datetime(pd.Series([parsear_fecha_consulta(fecha) for fecha in fechas_consulta], dtype=object))
+    tabla["fecha_consulta"] = fechas
+    tabla[COLUMNA_MES] = fechas.dt.strftime("%Y-%m").fillna("sin_fecha").astype(str)
+    return pd.DataFrame(tabla, index=df.index)
+
+
+def exportar_columnar(df: pd.DataFrame, fechas_consulta, carpeta: str, formato: str = "parquet"):
+    """
+    Guarda la hoja en Parquet o Feather (Arrow IPC) partida por mes de
+    consulta: carpeta/mes_consulta=aaaa-mm/pacientes.parquet, la estructura
+    que pyarrow.dataset, DuckDB o Spark leen como una sola tabla. Cada
+    partición se reescribe entera y se borran las de meses que ya no tienen
+    pacientes. Feather se guarda sin comprimir para poder mapearlo en memoria.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print(f"❌ Para guardar en {formato} hace falta pyarrow (pip install pyarrow)")
+        return
+    tabla = tabla_columnar(df, fechas_consulta)
+    nombre = FORMATOS_COLUMNARES[formato]
+    escritos = set()
+    for mes, particion in tabla.groupby(COLUMNA_MES, sort=True):
+        carpeta_mes = os.path.join(carpeta, f"{COLUMNA_MES}={mes}")
+        os.makedirs(carpeta_mes, exist_ok=True)
+        ruta = os.path.join(carpeta_mes, nombre)
+        particion = particion.drop(columns=COLUMNA_MES).reset_index(drop=True)
+        if formato == "feather":
+            particion.to_feather(ruta, compression="uncompressed")
+        else:
+            particion.to_parquet(ruta, index=False)
+        escritos.add(ruta)
+    for ruta in glob.glob(os.path.join(carpeta, f"{COLUMNA_MES}=*", nombre)):
+        if ruta not in escritos:
+            os.remove(ruta)
+    print(f"✅ {len(tabla)} pacientes guardados en {carpeta} ({formato}, {len(escritos)} meses)")
+
+
+# Funciones que mide perfilado.activar(parte10), con la columna de la hoja
+# que alimentan
+FUNCIONES_PERFILADAS = {
+    "clasificar_escolaridad": "Grado Escolaridad",
+    "clasificar_escolaridad_columna": "Grado Escolaridad (columnar)",
+    "clasificar_clinimetria": "das28 / sledai / asdas_clasificacion",
+    "clasificar_clinimetria_columnas": "das28 / sledai / asdas_clasificacion (columnar)",
+    "clasificar_comorbilidades": "1. a 10. comorbilidades, ¿Cuáles otras?",
+    "extraer_fechas": "Cambio en Medicacion",
+    "clasificar_fecha_tratamiento": "Cambio en Medicacion",
+    "parsear_fecha": "fechas de tratamiento",
+    "parsear_fecha_consulta": "fecha de consulta",
+    "detectar_medicamentos": "medicamentos (inicio, adherencia, parenteral, interacciones)",
+    "fechas_inicio_grupo": "INICIO TRATAMIENTO (fechas por medicamento)",
+    "evaluar_tratamiento_con_fecha_biologico_yak": "INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK",
+    "evaluar_tratamiento_con_fecha_dmards": "INICIO TRATAMIENTO DMARDS",
+    "evaluar_adherencia_biologicos": "ADHERENCIA MIROSKY GREEN BIOLOGICO",
+    "evaluar_adherencia_inhibidoresjack": "ADHERENCIA MIROSKY GREEN JACK",
+    "evaluar_adherencia_demards": "ADHERENCIA MIROSKY DMARDS",
+    "evaluar_parenteral": "Dispensacion parenteral",
+    "puntuar_paciente": "fila completa",
+    "puntuar_columnas_texto": "columnas de texto libre",
+    "puntuar_pacientes_columnar": "hoja completa (columnar)",
+    "exportar_excel": "exportación",
+    "cargar_pacientes": "lectura del JSON",
+}
+
 
+def cargar_pacientes(ruta: str = RUTA_JSON_PACIENTES, compacto: bool = True) -> dict:
+    """
+    Carga el JSON del extractor. Con compacto=True cada paciente se convierte
+    en PacienteRegistro apenas se lee (ver registros.py), en lugar de quedar
+    como diccionario.
+    """
+    with open(ruta, "r", encoding="utf-8") as file:
+        return json.load(file, object_hook=compactar_paciente if compacto else None)
+
+
+def puntuar_en_lotes(pacientes, tamano_lote: int = TAMANO_LOTE_PUNTUACION) -> pd.DataFrame:
+    """
+    Puntúa un iterable de pacientes (p. ej. leer_pacientes_jsonl) por lotes con
+    el modo columnar: en memoria sólo queda un lote de registros a la vez más
+    las filas ya puntuadas.
+    """
+    hojas = []
+    lote = []
+    for paciente_info in pacientes:
+        lote.append(paciente_info)
+        if len(lote) >= tamano_lote:
+            hojas.append(puntuar_pacientes_columnar(lote))
+            lote = []
+    if lote:
+        hojas.append(puntuar_pacientes_columnar(lote))
+    if not hojas:
+        return construir_dataframe([])
+    return pd.concat(hojas, ignore_index=True)
+
+
+def ruta_hoja_nuevas(archivo: str) -> str:
+    return os.path.splitext(archivo)[0] + ".nuevas.xlsx"
+
+
+def puntuar_almacen(ruta_almacen: str, archivo: str = RUTA_EXCEL_SALIDA, solo_nuevas: bool = False,
+                    consumidor: str = "parte10", carpeta_columnar: str = None, formato: str = "parquet",
+                    archivo_nuevas: str = None):
+    """
+    Puntúa las visitas del almacén SQLite: todas, o con solo_nuevas sólo las
+    agregadas o cambiadas desde la última corrida (la marca se guarda en el
+    almacén una vez exportada la hoja). Con solo_nuevas la hoja va a
+    archivo_nuevas (por defecto <archivo>.nuevas.xlsx): la hoja completa
+    nunca se reemplaza por unas pocas filas. Con carpeta_columnar guarda
+    además la hoja en Parquet/Feather (ver exportar_columnar).
+    """
+    if solo_nuevas:
+        archivo = archivo_nuevas or ruta_hoja_nuevas(archivo)
+    conexion = abrir_almacen(ruta_almacen)
+    try:
+        if solo_nuevas:
+            pacientes, version = visitas_nuevas(conexion, consumidor)
+            if not pacientes:
+                print(f"✅ No hay visitas nuevas en {ruta_almacen}")
+                return
+        else:
+            pacientes, version = todas_las_visitas(conexion), None
+        df = puntuar_pacientes_columnar(pacientes)
+        exportar_excel(df, archivo)
+        if carpeta_columnar:
+            exportar_columnar(df, [paciente.get("fecha_consulta") for paciente in pacientes], carpeta_columnar, formato)
+        if version is not None:
+            confirmar_lectura(conexion, consumidor, version)
+    finally:
+        conexion.close()
+    print(f"✅ {len(df)} pacientes guardados en {archivo}")
+
+
+# ---------------------------------------------------------------------------
+# Puntuación incremental
+# ---------------------------------------------------------------------------
+# El estado de la última corrida se guarda en un JSON junto a la hoja: la
+# fila puntuada de cada paciente (por el hash de su contenido: la puntuación
+# sólo depende del paciente), qué hash tenía cada visita (nombre + fecha de
+# consulta) y las huellas de las reglas y del código. Sólo se puntúan los
+# pacientes cuyo hash no está en el estado; si cambian las tablas de reglas
+# o este módulo, el estado no sirve y se repuntúa todo.
+
+def _serializable(valor):
+    if isinstance(valor, (set, frozenset)):
+        return sorted(valor)
+    return str(valor)
+
+
+def tablas_reglas() -> dict:
+    """Tablas de las que depende la puntuación."""
+    return {
+        "categorias": categorias,
+        "catalogo_medicamentos": CATALOGO_MEDICAMENTOS,
+        "columnas": COLUMNAS_FINALES,
+        "reglas_puntuacion": reglas_puntuacion().fuente,
     }
 
-    # Agregar columnas de clasificación
-    fila_paciente.update(clasificacion)
-
-    # Añadir al conjunto de datos
-    pacientes_data.append(fila_paciente)
-
-
-# Crear DataFrame
-df = pd.DataFrame(pacientes_data)
-
-# Ordenar las columnas
-
-# Concatenamos en el orden deseado: otras columnas, luego las de clasificación por enfermedades, y al final las de clinimetría
-columnas_finales = ["Nombre"]+["Tipo Identificación"]+["Edad"]+["Grado Escolaridad"]+["Género"]+["Gestación"]+["Consumo de SPA"]+["4. Consumo de alcohol o drogas que interacciona con medicamento"]+["Trastornos mentales"]+["Factores relacionados con el trato paciente"]+["hospitalizacion ultimos 6 meses"]+["1. Enfermedad cardiovascular"]+["2. Hipertensión arterial"]+["3. Diabetes mellitus"]+["4. Enfermedad renal"]+["5. Enfermedad hepatica"]+["6. Osteoporosis/ Artrosis/ Osteoartrosis"]+["7. Enfermedad gastrointestinal"]+["8. Hipotiroidismo/Hipertiroidismo"]+["9. Cancer"]+["10. Otros"]+["¿Cuáles otras?"]+["4. Presenta más de 2 comorbilidades de la lista \n2. Presenta 1 comorbilidad de la lista"]+["APLICA CLINIMETRÍA\n0. No, requiere de otro parametro\n4. Si, pero es > a 2 meses"]+["das28_clasificacion"]+["sledai_clasificacion"]+["asdas_clasificacion"] +["polimedicacion"]+["Cambio en Medicacion"]+["INICIO TRATAMIENTO  BIOLOGICO / ANTIYACK"] + ["INICIO TRATAMIENTO DMARDS"]+["ADHERENCIA MIROSKY GREEN BIOLOGICO"]+["ADHERENCIA MIROSKY GREEN JACK"]+["ADHERENCIA MIROSKY DMARDS"]+["ADHERENCIA A OTROS TRATAMIENTOS FARMACOLOGICOS"]+["Dispensacion parenteral"]+["Dispesacion medicamentos oral"]+["Interacciones 1si 2no"]+["interacciones mayores que requieran"]+["clasificacion relevancia"]+["mecanismo farmadinamicas"]+["farmaco"]+["descripcion de las molecula"]+["columna 0no 1 si de ram"]+["RAM"]+[  # Aquí agregas todas las columnas nuevas
-        "MEDICAMENTO_SOSPECHOSO",
-        "ESTADO ACUTAL RAM",
-        "0NO 2 SI",
-        "TIPO",
-        "DEFINIDO POR COMITE FV",
-        "0 NO 1 SI",
-        "ADMINISTRACION ERRONEA DEL MEDICAMENTO",
-        "CARACTERISTICAS PERSONALES",
-        "CONVERSACION INADECUADA",
-        "CONTRAINDICACION",
-        "DOSIS PAUTAS",
-        "DUPLICIDAD",
-        "ERRROES EN LA DISPENSACION",
-        "ERRORES EN LA PRESCIRPCION",
-        "IN CUMPLIMIENTO",
-        "INTERACCIONES",
-        "OTROS PROBLEMAS",
-        "PROBAVBILIDAD DE EFECTOS ADVERSOS",
-        "PROBLEMA DE SALUD",
-        "OTROS"
-    ]
 
-# Reordenar el DataFrame según el orden definido
-df = df[columnas_finales]
-
-# Guardar a Excel
-df.to_excel("HOJAexcelSUBIR\pacientes_detallado.xlsx", index=False)
-# ------------------------------------------
-# Aplicar formato rojo si RAM == 1
-# ------------------------------------------
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-
-# Abrir el archivo recién guardado
-archivo = "HOJAexcelSUBIR\pacientes_detallado.xlsx"
-libro = load_workbook(archivo)
-hoja = libro.active
-
-# Buscar la columna "RAM"
-columna_ram = None
-for col in range(1, hoja.max_column + 1):
-    if hoja.cell(row=1, column=col).value == "RAM":
-        columna_ram = col
-        break
-
-# Aplicar color rojo si RAM == 1
-if columna_ram:
-    for fila in range(2, hoja.max_row + 1):
-        celda = hoja.cell(row=fila, column=columna_ram)
-        if celda.value == 1:
-            celda.fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-
-# Guardar cambios
-libro.save(archivo)
+def huella_reglas() -> str:
+    texto = json.dumps(tablas_reglas(), ensure_ascii=False, sort_keys=True, default=_serializable)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def huella_codigo() -> str:
+    # Este módulo y el que compila las reglas
+    huella = hashlib.sha256()
+    for modulo in (__file__, reglas.__file__):
+        with open(os.path.abspath(modulo), "rb") as f:
+            huella.update(f.read())
+    return huella.hexdigest()[:16]
+
+
+def huella_paciente(paciente_info: Mapping) -> str:
+    texto = json.dumps(paciente_info, ensure_ascii=False, default=a_json)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def clave_visita(paciente_info: Mapping, huella: str) -> str:
+    """Nombre normalizado + fecha de consulta, o el hash del paciente si le falta alguno."""
+    nombre = paciente_info.get("nombre")
+    fecha = paciente_info.get("fecha_consulta")
+    if isinstance(nombre, str) and nombre.strip() and fecha:
+        return f"{' '.join(nombre.split()).upper()}|{fecha}"
+    return huella
+
+
+def ruta_estado_incremental(archivo: str) -> str:
+    return os.path.splitext(archivo)[0] + ".puntuados.json"
+
+
+def leer_estado_incremental(ruta_estado: str):
+    """
+    Devuelve (estado, motivo). Con motivo (por qué hay que repuntuar todo)
+    las filas del estado no sirven, pero sus visitas sí para contar cuáles
+    son nuevas.
+    """
+    try:
+        with open(ruta_estado, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except FileNotFoundError:
+        return {}, "no hay puntuaciones anteriores"
+    except (OSError, ValueError) as e:
+        return {}, f"no se pudo leer {ruta_estado} ({e})"
+    if estado.get("reglas") != huella_reglas():
+        return estado, "cambiaron las tablas de reglas"
+    if estado.get("codigo") != huella_codigo():
+        return estado, "cambió el código de la puntuación"
+    return estado, None
+
+
+def _firma_hoja(archivo: str):
+    """[tamaño, mtime] de la hoja, para saber si sigue siendo la que se escribió (None si no existe)."""
+    try:
+        estado = os.stat(archivo)
+    except OSError:
+        return None
+    return [estado.st_size, estado.st_mtime_ns]
+
+
+def _valor_json(valor):
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def _hoja_de_filas(filas: dict, huellas: list) -> pd.DataFrame:
+    if not huellas:
+        return construir_dataframe([])
+    return pd.DataFrame.from_records([filas[huella] for huella in huellas], columns=COLUMNAS_FINALES)
+
+
+def puntuar_incremental(pacientes, archivo: str = RUTA_EXCEL_SALIDA, ruta_estado: str = None,
+                        archivo_delta: str = None, carpeta_columnar: str = None, formato: str = "parquet"):
+    """
+    Puntúa sólo los pacientes nuevos o cambiados desde la corrida anterior y
+    deja la hoja igual a la de una corrida desde cero: anexando las filas
+    nuevas si sólo se agregaron pacientes al final, o reescribiéndola. Con
+    archivo_delta guarda además una hoja sólo con las filas puntuadas ahora,
+    y con carpeta_columnar la hoja completa en Parquet/Feather.
+    """
+    ruta_estado = ruta_estado or ruta_estado_incremental(archivo)
+    estado, motivo = leer_estado_incremental(ruta_estado)
+    visitas_antes, filas = estado.get("visitas", {}), estado.get("filas", {})
+    if motivo:
+        print(f"⚠️ Puntuación completa: {motivo}")
+        filas = {}
+
+    if isinstance(pacientes, dict):
+        pacientes = pacientes.values()
+    visitas = {}
+    huellas = []
+    fechas = []
+    pendientes = {}
+    for paciente_info in pacientes:
+        if not isinstance(paciente_info, Mapping):
+            continue
+        huella = huella_paciente(paciente_info)
+        huellas.append(huella)
+        fechas.append(paciente_info.get("fecha_consulta"))
+        # Otro paciente con el mismo nombre y fecha se conserva aparte, como en
+        # el extractor (resolver_id_global): se numera en el orden de llegada,
+        # para que si cambia cuente como cambiado y no como nuevo
+        clave = base = clave_visita(paciente_info, huella)
+        repeticion = 1
+        while visitas.get(clave, huella) != huella:
+            repeticion += 1
+            clave = f"{base}|{repeticion}"
+        visitas.setdefault(clave, huella)
+        if huella not in filas:
+            pendientes.setdefault(huella, paciente_info)
+
+    # La hoja sólo depende de la lista de pacientes (en orden) y de las reglas
+    if not pendientes and huellas == estado.get("huellas") and _firma_hoja(archivo) == estado.get("hoja"):
+        print(f"✅ Sin pacientes nuevos ni cambiados: {archivo} ya está al día")
+        return
+
+    delta = puntuar_pacientes_columnar(list(pendientes.values()))
+    for huella, fila in zip(pendientes, delta.itertuples(index=False, name=None)):
+        filas[huella] = [_valor_json(valor) for valor in fila]
+    nuevas = sum(clave not in visitas_antes for clave in visitas)
+    cambiadas = sum(clave in visitas_antes and visitas_antes[clave] != huella for clave, huella in visitas.items())
+
+    # Si sólo se agregaron pacientes al final y la hoja no se tocó desde la
+    # corrida anterior, se anexan las filas nuevas en vez de reescribirla
+    anteriores = estado.get("huellas") or []
+    anexadas = (not motivo and len(huellas) > len(anteriores) and huellas[:len(anteriores)] == anteriores
+                and estado.get("hoja") is not None and _firma_hoja(archivo) == estado.get("hoja")
+                and anexar_excel(_hoja_de_filas(filas, huellas[len(anteriores):]), archivo, len(anteriores)))
+    if not anexadas:
+        exportar_excel(_hoja_de_filas(filas, huellas), archivo)
+    if archivo_delta:
+        exportar_excel(delta, archivo_delta)
+        print(f"✅ {len(delta)} filas nuevas o cambiadas en {archivo_delta}")
+    if carpeta_columnar:
+        exportar_columnar(_hoja_de_filas(filas, huellas), fechas, carpeta_columnar, formato)
+
+    # Sólo se conservan las filas de los pacientes actuales
+    usadas = set(huellas)
+    estado = {
+        "reglas": huella_reglas(),
+        "codigo": huella_codigo(),
+        "visitas": visitas,
+        "huellas": huellas,
+        "hoja": _firma_hoja(archivo),
+        "filas": {huella: fila for huella, fila in filas.items() if huella in usadas},
+    }
+    with open(ruta_estado + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(ruta_estado + ".tmp", ruta_estado)
+    modo = f"{len(huellas) - len(anteriores)} filas anexadas" if anexadas else "hoja reescrita"
+    print(f"✅ {len(huellas)} pacientes guardados en {archivo} ({modo}; {len(pendientes)} puntuados ahora: "
+          f"{nuevas} visitas nuevas, {cambiadas} cambiadas)")
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Puntúa los pacientes extraídos y genera la hoja para subir.")
+    parser.add_argument("entrada", nargs="?", default=RUTA_JSON_PACIENTES,
+                        help="JSON del extractor, JSONL (.jsonl / .jsonl.gz) con un paciente por línea "
+                             "o almacén SQLite (.sqlite / .db)")
+    parser.add_argument("--salida", default=RUTA_EXCEL_SALIDA, help="Ruta de la hoja de Excel")
+    parser.add_argument("--seguir", action="store_true",
+                        help="JSONL: seguir leyendo el archivo mientras el extractor lo escribe")
+    parser.add_argument("--espera-maxima", type=float, default=None,
+                        help="Con --seguir, terminar tras estos segundos sin pacientes nuevos")
+    parser.add_argument("--solo-nuevas", action="store_true",
+                        help="Almacén SQLite: puntuar sólo las visitas nuevas o cambiadas desde la última corrida "
+                             "y guardarlas en una hoja aparte (--delta o <salida>.nuevas.xlsx)")
+    parser.add_argument("--incremental", nargs="?", const="", default=None,
+                        help="Puntuar sólo los pacientes nuevos o cambiados desde la corrida anterior "
+                             "(estado en <salida>.puntuados.json o en la ruta dada); si cambiaron las "
+                             "reglas se repuntúa todo")
+    parser.add_argument("--delta", default=None,
+                        help="Con --incremental, guardar además una hoja sólo con las filas nuevas o cambiadas; "
+                             "con --solo-nuevas, la hoja donde se guardan")
+    parser.add_argument("--columnar", default=None,
+                        help="Carpeta donde guardar además la hoja en Parquet/Feather, una partición por "
+                             "mes de consulta (necesita pyarrow)")
+    parser.add_argument("--formato", choices=sorted(FORMATOS_COLUMNARES), default="parquet",
+                        help="Formato de --columnar")
+    parser.add_argument("--reglas", default=None,
+                        help=f"Archivo de reglas de puntuación (por defecto {os.path.basename(RUTA_REGLAS)} "
+                             "junto a este script)")
+    parser.add_argument("--perfil", nargs="?", const="", default=None,
+                        help="Medir tiempos, llamadas y regex por función y columna; con una ruta, "
+                             "guardar además el reporte en JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    if args.reglas:
+        try:
+            usar_reglas(args.reglas)
+        except (OSError, ValueError) as e:
+            print(f"❌ No se pudieron cargar las reglas {args.reglas}: {e}")
+            return
+    if args.perfil is None:
+        return ejecutar(args)
+
+    perfilado.activar(sys.modules[__name__])
+    try:
+        ejecutar(args)
+    finally:
+        perfilado.desactivar()
+        perfilado.mostrar_reporte()
+        if args.perfil:
+            perfilado.guardar_reporte(args.perfil)
+
+
+def _anotar_fechas(pacientes, fechas: list):
+    """Deja pasar los pacientes anotando la fecha de consulta de cada fila de la hoja."""
+    if isinstance(pacientes, dict):
+        pacientes = pacientes.values()
+    for paciente_info in pacientes:
+        if isinstance(paciente_info, Mapping):
+            fechas.append(paciente_info.get("fecha_consulta"))
+        yield paciente_info
+
+
+def ejecutar(args):
+    if args.columnar and args.solo_nuevas and args.incremental is None:
+        print("⚠️ --columnar necesita todas las visitas: con --solo-nuevas no se guarda (use --incremental)")
+        args.columnar = None
+    if args.incremental is not None:
+        if es_ruta_almacen(args.entrada):
+            conexion = abrir_almacen(args.entrada)
+            try:
+                pacientes = todas_las_visitas(conexion)
+            finally:
+                conexion.close()
+        elif es_ruta_jsonl(args.entrada):
+            pacientes = leer_pacientes_jsonl(args.entrada, args.seguir, args.espera_maxima)
+        else:
+            pacientes = cargar_pacientes(args.entrada)
+        return puntuar_incremental(pacientes, args.salida, args.incremental or None, args.delta,
+                                   args.columnar, args.formato)
+    if es_ruta_almacen(args.entrada):
+        return puntuar_almacen(args.entrada, args.salida, args.solo_nuevas,
+                               carpeta_columnar=args.columnar, formato=args.formato, archivo_nuevas=args.delta)
+    fechas = []
+    if es_ruta_jsonl(args.entrada):
+        df = puntuar_en_lotes(_anotar_fechas(leer_pacientes_jsonl(args.entrada, args.seguir, args.espera_maxima), fechas))
+    else:
+        df = puntuar_pacientes_columnar(list(_anotar_fechas(cargar_pacientes(args.entrada), fechas)))
+    exportar_excel(df, args.salida)
+    print(f"✅ {len(df)} pacientes guardados en {args.salida}")
+    if args.columnar:
+        exportar_columnar(df, fechas, args.columnar, args.formato)
+
 
+if __name__ == "__main__":
+    main()
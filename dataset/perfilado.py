@@ -0,0 +1,274 @@
+"""
+Perfilado opcional del flujo (extractor y puntuación).
+
+Desactivado no cuesta nada: los módulos quedan tal cual. Al activarlo se
+reemplazan, mientras dure la medición, los atributos de módulo que cada
+módulo declara en FUNCIONES_PERFILADAS (nombre -> etiqueta) por envolturas
+que acumulan tiempo y llamadas, y sus patrones precompilados, el módulo `re`
+y `datetime` por versiones que cuentan evaluaciones de regex e intentos de
+strptime. `desactivar()` deja los originales en su lugar.
+
+    perfilado.activar(ExtraerDatosDelExcel, parte10)
+    ...
+    perfilado.desactivar()
+    perfilado.mostrar_reporte()
+    perfilado.guardar_reporte("perfil.json")
+
+Las etapas gruesas (lectura, exportación...) se marcan con
+`with perfilado.etapa("lectura"):`, que sin perfilado activo es un
+contexto vacío.
+
+Las llamadas que se hacen dentro de un pool de procesos no se cuentan: cada
+trabajador tiene su propia copia de los contadores.
+"""
+import functools
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Métodos de un patrón compilado (y funciones del módulo re) que evalúan la regex
+METODOS_REGEX = ("search", "match", "fullmatch", "findall", "finditer", "sub", "subn", "split")
+
+_activo = False
+_reemplazos = []   # (objeto, atributo, valor original) para restaurar al desactivar
+_funciones = defaultdict(lambda: {"llamadas": 0, "segundos": 0.0})
+_etapas = defaultdict(lambda: {"llamadas": 0, "segundos": 0.0})
+_regex = defaultdict(int)
+_strptime = defaultdict(int)
+_NULO = nullcontext()
+
+
+def activo() -> bool:
+    return _activo
+
+
+def reiniciar():
+    """Pone en cero todos los contadores."""
+    for contadores in (_funciones, _etapas, _regex, _strptime):
+        contadores.clear()
+
+
+# ---------------------------------------------------------------------------
+# Envolturas
+# ---------------------------------------------------------------------------
+
+def _envolver_funcion(funcion, clave):
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            datos = _funciones[clave]
+            datos["llamadas"] += 1
+            datos["segundos"] += time.perf_counter() - inicio
+    return envoltura
+
+
+class _PatronContado:
+    """Patrón compilado que cuenta cada evaluación y delega todo lo demás."""
+
+    def __init__(self, patron, clave):
+        self._patron = patron
+        self._clave = clave
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._patron, nombre)
+        if nombre not in METODOS_REGEX:
+            return atributo
+
+        def evaluar(*args, **kwargs):
+            _regex[self._clave] += 1
+            return atributo(*args, **kwargs)
+        return evaluar
+
+
+class _ReContado:
+    """Sustituto del módulo re: cuenta las regex evaluadas con re.search(...) y compañía."""
+
+    def __init__(self, modulo):
+        self._modulo = modulo
+
+    def __getattr__(self, nombre):
+        atributo = getattr(re, nombre)
+        if nombre not in METODOS_REGEX:
+            return atributo
+
+        def evaluar(patron, *args, **kwargs):
+            _regex[f"{self._modulo}: re.{nombre}({str(getattr(patron, 'pattern', patron))[:40]!r})"] += 1
+            return atributo(patron, *args, **kwargs)
+        return evaluar
+
+
+class _MetaDatetimeContado(type):
+    # isinstance(x, datetime) sigue funcionando igual dentro del módulo perfilado
+    def __instancecheck__(cls, objeto):
+        return isinstance(objeto, datetime)
+
+    def __subclasscheck__(cls, subclase):
+        return issubclass(subclase, datetime)
+
+
+def _crear_datetime_contado(modulo):
+    class DatetimeContado(datetime, metaclass=_MetaDatetimeContado):
+        """datetime que cuenta los intentos de strptime; crea datetime comunes."""
+
+        def __new__(cls, *args, **kwargs):
+            return datetime(*args, **kwargs)
+
+        @staticmethod
+        def strptime(texto, formato):
+            _strptime[f"{modulo}: {formato}"] += 1
+            return datetime.strptime(texto, formato)
+
+    return DatetimeContado
+
+
+def _contar_patrones(valor, clave):
+    """Copia de `valor` con los patrones (sueltos, en listas, tuplas o valores de dict) contados."""
+    if isinstance(valor, re.Pattern):
+        return _PatronContado(valor, clave)
+    if isinstance(valor, (list, tuple)) and any(isinstance(v, re.Pattern) for v in valor):
+        return type(valor)(_contar_patrones(v, f"{clave}[{i}]") for i, v in enumerate(valor))
+    if isinstance(valor, dict):
+        nuevos = {k: _contar_patrones(v, f"{clave}[{k!r}]") for k, v in valor.items()}
+        if any(nuevos[k] is not valor[k] for k in valor):
+            return nuevos
+    if isinstance(valor, tuple):
+        nuevos = tuple(_contar_patrones(v, f"{clave}[{i}]") for i, v in enumerate(valor))
+        if any(n is not v for n, v in zip(nuevos, valor)):
+            return nuevos
+    return valor
+
+
+def _nombre_modulo(modulo):
+    # Corrido como script el módulo se llama __main__: se usa el nombre del archivo
+    ruta = getattr(modulo, "__file__", None)
+    if modulo.__name__ == "__main__" and ruta:
+        return os.path.splitext(os.path.basename(ruta))[0]
+    return modulo.__name__
+
+
+def _reemplazar(objeto, atributo, nuevo):
+    _reemplazos.append((objeto, atributo, getattr(objeto, atributo)))
+    setattr(objeto, atributo, nuevo)
+
+
+# ---------------------------------------------------------------------------
+# Activación
+# ---------------------------------------------------------------------------
+
+def activar(*modulos, funciones_extra=()):
+    """
+    Instrumenta los módulos dados. `funciones_extra` son tuplas
+    (objeto, atributo, etiqueta) para funciones de otras librerías, p. ej.
+    (pd, "read_excel", "lectura del libro").
+    """
+    global _activo
+    if _activo:
+        return
+    _activo = True
+
+    for modulo in modulos:
+        nombre_modulo = _nombre_modulo(modulo)
+        for nombre, valor in list(vars(modulo).items()):
+            if nombre.isupper():
+                contado = _contar_patrones(valor, f"{nombre_modulo}.{nombre}")
+                if contado is not valor:
+                    _reemplazar(modulo, nombre, contado)
+        if getattr(modulo, "re", None) is re:
+            _reemplazar(modulo, "re", _ReContado(nombre_modulo))
+        if getattr(modulo, "datetime", None) is datetime:
+            _reemplazar(modulo, "datetime", _crear_datetime_contado(nombre_modulo))
+
+        for nombre, etiqueta in getattr(modulo, "FUNCIONES_PERFILADAS", {}).items():
+            clave = (f"{nombre_modulo}.{nombre}", etiqueta)
+            _reemplazar(modulo, nombre, _envolver_funcion(getattr(modulo, nombre), clave))
+
+    for objeto, atributo, etiqueta in funciones_extra:
+        clave = (f"{_nombre_modulo(objeto)}.{atributo}", etiqueta)
+        _reemplazar(objeto, atributo, _envolver_funcion(getattr(objeto, atributo), clave))
+
+
+def desactivar():
+    """Restaura las funciones, patrones y módulos originales (los contadores se conservan)."""
+    global _activo
+    while _reemplazos:
+        objeto, atributo, original = _reemplazos.pop()
+        setattr(objeto, atributo, original)
+    _activo = False
+
+
+def etapa(nombre):
+    """Contexto que mide una etapa gruesa del flujo; vacío si el perfilado no está activo."""
+    if not _activo:
+        return _NULO
+    return _medir_etapa(nombre)
+
+
+@contextmanager
+def _medir_etapa(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        datos = _etapas[nombre]
+        datos["llamadas"] += 1
+        datos["segundos"] += time.perf_counter() - inicio
+
+
+# ---------------------------------------------------------------------------
+# Reporte
+# ---------------------------------------------------------------------------
+
+def resultados() -> dict:
+    """Contadores acumulados, cada sección ordenada de mayor a menor."""
+    def ordenar(datos):
+        return sorted(datos, key=lambda d: d.get("segundos", d.get("evaluaciones", 0)), reverse=True)
+
+    return {
+        "etapas": ordenar({"etapa": nombre, **datos} for nombre, datos in _etapas.items()),
+        "funciones": ordenar({"funcion": funcion, "etiqueta": etiqueta, **datos}
+                             for (funcion, etiqueta), datos in _funciones.items()),
+        "regex": ordenar({"patron": clave, "evaluaciones": n} for clave, n in _regex.items()),
+        "strptime": ordenar({"formato": clave, "evaluaciones": n} for clave, n in _strptime.items()),
+        "totales": {
+            "evaluaciones_regex": sum(_regex.values()),
+            "intentos_strptime": sum(_strptime.values()),
+        },
+    }
+
+
+def mostrar_reporte(limite=15):
+    datos = resultados()
+    print("\n⏱️ Perfil del flujo")
+    if datos["etapas"]:
+        print("\nEtapas:")
+        for fila in datos["etapas"]:
+            print(f"  {fila['etapa']:<40} {fila['segundos']:>10.3f} s {fila['llamadas']:>9} veces")
+    if datos["funciones"]:
+        print("\nFunciones (tiempo inclusivo):")
+        for fila in datos["funciones"][:limite]:
+            por_llamada = fila["segundos"] / fila["llamadas"] * 1e6 if fila["llamadas"] else 0
+            print(f"  {fila['funcion']:<55} {fila['segundos']:>9.3f} s {fila['llamadas']:>9} llamadas "
+                  f"{por_llamada:>9.1f} µs  {fila['etiqueta']}")
+    if datos["regex"]:
+        print(f"\nEvaluaciones de regex: {datos['totales']['evaluaciones_regex']}")
+        for fila in datos["regex"][:limite]:
+            print(f"  {fila['patron']:<70} {fila['evaluaciones']:>10}")
+    print(f"\nIntentos de strptime: {datos['totales']['intentos_strptime']}")
+    for fila in datos["strptime"][:limite]:
+        print(f"  {fila['formato']:<70} {fila['evaluaciones']:>10}")
+
+
+def guardar_reporte(ruta):
+    try:
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(resultados(), f, ensure_ascii=False, indent=4)
+        print(f"✅ Perfil guardado en {ruta}")
+    except OSError as e:
+        print(f"❌ No se pudo guardar el perfil en {ruta}: {e}")
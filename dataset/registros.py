@@ -0,0 +1,171 @@
+"""
+Registro compacto de paciente.
+
+El diccionario que arma ExtraerDatosDelExcel.construir_paciente repite en
+cada paciente las mismas claves y, en los campos categóricos (adherencia,
+dispensación, escolaridad, consumo...), las mismas pocas cadenas, cada una
+como un objeto aparte después de leer el JSON. PacienteRegistro guarda cada
+campo en un slot y los categóricos como un entero pequeño que indexa el
+vocabulario del campo, compartido por todos los registros del proceso.
+
+Se comporta como un diccionario de sólo lectura (get, [], keys, items, ==
+con un dict) y `a_dict()` devuelve exactamente el diccionario original:
+mismas claves, mismo orden, mismos valores.
+"""
+import math
+from collections.abc import Mapping
+
+# Campos del paciente en el orden en que los arma construir_paciente
+CAMPOS_PACIENTE = (
+    "nombre", "clinimetria_tipo", "clinimetria_valor", "observaciones",
+    "otro_diagnostico", "tratamiento_principal", "conciliacion_medicamentos", "nivel_escolaridad",
+    "consumo_alcohol", "consumo_tabaco", "consumo_sustancias", "hospitalizacion_ultimos_6_meses",
+    "edad", "diagnostico", "codigo_cie10", "ram", "interacciones_farmacologicas", "adherencia_global",
+    "dispensacion", "fecha_consulta",
+)
+
+_CAMPOS = frozenset(CAMPOS_PACIENTE)
+
+_AUSENTE = object()   # slot de un campo que el paciente no trae
+_NAN = object()       # clave del vocabulario para NaN (NaN != NaN no sirve de clave)
+
+
+class Vocabulario:
+    """Valores distintos de un campo categórico; cada valor se guarda una vez y se codifica por su posición."""
+
+    __slots__ = ("valores", "_codigos")
+
+    def __init__(self, valores_iniciales=()):
+        self.valores = []
+        self._codigos = {}
+        for valor in valores_iniciales:
+            self.codificar(valor)
+
+    @staticmethod
+    def _clave(valor):
+        if isinstance(valor, float) and math.isnan(valor):
+            return _NAN
+        # Con el tipo en la clave, 1, 1.0 y True no se confunden
+        return type(valor), valor
+
+    def codificar(self, valor) -> int:
+        clave = self._clave(valor)
+        codigo = self._codigos.get(clave)
+        if codigo is None:
+            codigo = self._codigos[clave] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+    def decodificar(self, codigo: int):
+        return self.valores[codigo]
+
+    def __len__(self):
+        return len(self.valores)
+
+
+# Campos categóricos. Los códigos de adherencia y dispensación son fijos (los
+# valores que produce el extractor, en este orden); los demás se asignan a
+# medida que aparecen valores nuevos.
+VOCABULARIOS = {
+    "adherencia_global": Vocabulario(["No especificado", "Adherente", "Totalmente adherente",
+                                      "Parcialmente adherente", "No adherente"]),
+    "dispensacion": Vocabulario(["No identificado", "dispensacion completa", "dispensacion parcial",
+                                 "no dispensacion"]),
+    "nivel_escolaridad": Vocabulario(["No especificado"]),
+    "clinimetria_tipo": Vocabulario(["No aplica"]),
+    "consumo_alcohol": Vocabulario(["No especificado", "Niega"]),
+    "consumo_tabaco": Vocabulario(["No especificado", "Niega"]),
+    "consumo_sustancias": Vocabulario(["No especificado", "Niega"]),
+    "hospitalizacion_ultimos_6_meses": Vocabulario(["No especificado", "No"]),
+    "codigo_cie10": Vocabulario(["No especificado"]),
+    "diagnostico": Vocabulario(["No especificado"]),
+    "ram": Vocabulario(["No especificado", "Niega"]),
+    "fecha_consulta": Vocabulario(),
+}
+
+# Orden de claves de cada paciente: casi todos comparten la misma tupla
+_ORDENES_CLAVES = {CAMPOS_PACIENTE: CAMPOS_PACIENTE}
+
+
+class PacienteRegistro(Mapping):
+    __slots__ = CAMPOS_PACIENTE + ("_claves", "_extras")
+
+    @classmethod
+    def desde_dict(cls, paciente_dict: Mapping) -> "PacienteRegistro":
+        registro = cls.__new__(cls)
+        extras = None
+        for campo in CAMPOS_PACIENTE:
+            setattr(registro, campo, _AUSENTE)
+        for campo, valor in paciente_dict.items():
+            if campo in _CAMPOS:
+                vocabulario = VOCABULARIOS.get(campo)
+                try:
+                    setattr(registro, campo, vocabulario.codificar(valor) if vocabulario is not None else valor)
+                    continue
+                except TypeError:  # valor no hashable: se guarda tal cual entre los extras
+                    pass
+            extras = extras if extras is not None else {}
+            extras[campo] = valor
+        claves = tuple(paciente_dict)
+        registro._claves = _ORDENES_CLAVES.setdefault(claves, claves)
+        registro._extras = extras
+        return registro
+
+    def __getitem__(self, campo):
+        if campo in _CAMPOS:
+            valor = getattr(self, campo)
+            if valor is not _AUSENTE:
+                vocabulario = VOCABULARIOS.get(campo)
+                return valor if vocabulario is None else vocabulario.valores[valor]
+        if self._extras is not None and campo in self._extras:
+            return self._extras[campo]
+        raise KeyError(campo)
+
+    def get(self, campo, defecto=None):
+        try:
+            return self[campo]
+        except KeyError:
+            return defecto
+
+    def __contains__(self, campo):
+        return campo in self._claves
+
+    def __iter__(self):
+        return iter(self._claves)
+
+    def __len__(self):
+        return len(self._claves)
+
+    def a_dict(self) -> dict:
+        return {campo: self[campo] for campo in self._claves}
+
+    def codigo(self, campo):
+        """Código del campo categórico (None si el paciente no lo trae)."""
+        codigo = getattr(self, campo)
+        return None if codigo is _AUSENTE or campo not in VOCABULARIOS else codigo
+
+    def __repr__(self):
+        return f"PacienteRegistro({self.a_dict()!r})"
+
+    def __reduce__(self):
+        # Los códigos sólo valen dentro del proceso: se serializa el diccionario
+        return PacienteRegistro.desde_dict, (self.a_dict(),)
+
+
+def normalizar_nombre(nombre):
+    """Nombre en mayúsculas y con los espacios colapsados, para comparar registros."""
+    return " ".join(str(nombre).split()).upper()
+
+
+def compactar_paciente(valor):
+    """object_hook para json.load: los diccionarios de paciente se convierten en PacienteRegistro."""
+    if "nombre" in valor:
+        return PacienteRegistro.desde_dict(valor)
+    return valor
+
+
+def a_json(valor):
+    """`default` para json.dump: escribe un PacienteRegistro como su diccionario."""
+    if isinstance(valor, PacienteRegistro):
+        return valor.a_dict()
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
@@ -0,0 +1,161 @@
+"""
+Reglas de puntuación declarativas.
+
+Los umbrales clínicos de la hoja (bandas de DAS28, SLEDAI y ASDAS, ventanas
+de meses desde el inicio de un tratamiento, mínimo de medicamentos para
+polimedicación y palabras clave de escolaridad) están en
+reglas_puntuacion.json. parte10 compila el archivo una sola vez, la primera
+vez que puntúa (importarlo no lee archivos):
+
+- cada banda en un arreglo de bordes y uno de puntajes: una búsqueda binaria
+  (bisect para un paciente, np.searchsorted para una columna) da el índice
+  del puntaje, sin cadenas de if/elif;
+- cada ventana de meses igual, con bisect sobre los meses;
+- cada regla de escolaridad en una regex con todas sus palabras, evaluada en
+  orden (la primera que aparece gana), o con np.select sobre una columna.
+
+    reglas = cargar_reglas()          # reglas_puntuacion.json junto a este módulo
+    reglas.clinimetria["das28"].puntuar(3.0)                      # -> 2
+    reglas.clinimetria["das28"].puntuar_arreglo(np.array([...]))
+"""
+import json
+import math
+import os
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+RUTA_REGLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reglas_puntuacion.json")
+
+# Clinimetrías y ventanas que la hoja necesita (cada una alimenta su columna)
+CLINIMETRIAS = ("das28", "sledai", "asdas")
+VENTANAS = ("cambio_medicacion", "inicio_biologico_jak", "inicio_dmards")
+
+
+def _validar(condicion, mensaje):
+    if not condicion:
+        raise ValueError(f"Reglas de puntuación inválidas: {mensaje}")
+
+
+def _bordes_crecientes(bordes, nombre):
+    _validar(isinstance(bordes, list) and all(isinstance(b, (int, float)) for b in bordes),
+             f"{nombre}: los bordes deben ser una lista de números")
+    _validar(all(a < b for a, b in zip(bordes, bordes[1:])), f"{nombre}: los bordes deben ser crecientes")
+
+
+class Bandas:
+    """
+    Puntaje según la banda en la que cae un valor. Con cerrado="izquierda"
+    el borde pertenece a la banda de arriba (valor < borde), con "derecha" a
+    la de abajo (valor <= borde). NaN cae en la última banda, como en las
+    comparaciones que reemplaza (todas falsas).
+    """
+
+    __slots__ = ("bordes", "puntajes", "derecha", "puntaje_cero", "_bordes", "_puntajes")
+
+    def __init__(self, nombre, bordes, puntajes, cerrado="izquierda", puntaje_cero=None):
+        _bordes_crecientes(bordes, nombre)
+        _validar(len(puntajes) == len(bordes) + 1, f"{nombre}: hace falta un puntaje más que bordes")
+        _validar(cerrado in ("izquierda", "derecha"), f"{nombre}: cerrado debe ser 'izquierda' o 'derecha'")
+        self.bordes = list(bordes)
+        self.puntajes = list(puntajes)
+        self.derecha = cerrado == "derecha"
+        self.puntaje_cero = puntaje_cero
+        self._bordes = np.asarray(bordes, dtype=float)
+        self._puntajes = np.asarray(puntajes)
+
+    def puntuar(self, valor: float) -> int:
+        if self.puntaje_cero is not None and valor == 0:
+            return self.puntaje_cero
+        if math.isnan(valor):
+            return self.puntajes[-1]
+        return self.puntajes[(bisect_left if self.derecha else bisect_right)(self.bordes, valor)]
+
+    def puntuar_arreglo(self, valores: np.ndarray) -> np.ndarray:
+        # searchsorted ubica NaN después de todos los bordes: última banda
+        puntajes = self._puntajes[np.searchsorted(self._bordes, valores, side="left" if self.derecha else "right")]
+        if self.puntaje_cero is not None:
+            puntajes = np.where(valores == 0, self.puntaje_cero, puntajes)
+        return puntajes
+
+
+class Ventanas:
+    """Puntaje según los meses transcurridos: meses < límite de cada ventana, en orden."""
+
+    __slots__ = ("meses", "puntajes", "puntaje_sin_fecha")
+
+    def __init__(self, nombre, meses, puntajes, puntaje_sin_fecha=None):
+        _bordes_crecientes(meses, nombre)
+        _validar(len(puntajes) == len(meses) + 1, f"{nombre}: hace falta un puntaje más que ventanas")
+        self.meses = list(meses)
+        self.puntajes = list(puntajes)
+        self.puntaje_sin_fecha = puntaje_sin_fecha
+
+    def puntuar(self, diferencia_meses: int) -> int:
+        return self.puntajes[bisect_right(self.meses, diferencia_meses)]
+
+
+class ReglasEscolaridad:
+    """Primera regla (en el orden del archivo) con alguna palabra en el texto; si ninguna, el puntaje por defecto."""
+
+    __slots__ = ("correcciones", "reglas", "por_defecto")
+
+    def __init__(self, correcciones, reglas, por_defecto):
+        _validar(all(regla.get("palabras") for regla in reglas), "escolaridad: cada regla necesita palabras")
+        self.correcciones = list(correcciones.items())
+        self.reglas = [(re.compile("|".join(map(re.escape, regla["palabras"]))), regla["puntaje"])
+                       for regla in reglas]
+        self.por_defecto = por_defecto
+
+    def _corregir(self, texto: str) -> str:
+        for error, correccion in self.correcciones:
+            texto = texto.replace(error, correccion)
+        return texto
+
+    def clasificar(self, escolaridad_raw) -> int:
+        texto = self._corregir(str(escolaridad_raw).lower().strip())
+        return next((puntaje for patron, puntaje in self.reglas if patron.search(texto)), self.por_defecto)
+
+    def clasificar_columna(self, escolaridad: pd.Series) -> np.ndarray:
+        texto = escolaridad.str.lower().str.strip()
+        for error, correccion in self.correcciones:
+            texto = texto.str.replace(error, correccion, regex=False)
+        return np.select(
+            [texto.str.contains(patron, regex=True).to_numpy(dtype=bool) for patron, _ in self.reglas],
+            [puntaje for _, puntaje in self.reglas],
+            default=self.por_defecto,
+        )
+
+
+class ReglasPuntuacion:
+    """Reglas compiladas; `fuente` es el diccionario leído del archivo (para la huella de la puntuación incremental)."""
+
+    __slots__ = ("fuente", "clinimetria", "ventanas", "minimo_polimedicacion", "puntaje_polimedicacion",
+                 "escolaridad")
+
+    def __init__(self, fuente: dict):
+        self.fuente = fuente
+        try:
+            clinimetria = fuente["clinimetria"]
+            ventanas = fuente["ventanas_tratamiento"]
+            polimedicacion = fuente["polimedicacion"]
+            escolaridad = fuente["escolaridad"]
+            _validar(all(nombre in clinimetria for nombre in CLINIMETRIAS),
+                     f"clinimetria debe definir {', '.join(CLINIMETRIAS)}")
+            _validar(all(nombre in ventanas for nombre in VENTANAS),
+                     f"ventanas_tratamiento debe definir {', '.join(VENTANAS)}")
+            self.clinimetria = {nombre: Bandas(nombre, **clinimetria[nombre]) for nombre in CLINIMETRIAS}
+            self.ventanas = {nombre: Ventanas(nombre, **ventanas[nombre]) for nombre in VENTANAS}
+            self.minimo_polimedicacion = polimedicacion["minimo_medicamentos"]
+            self.puntaje_polimedicacion = polimedicacion["puntaje"]
+            self.escolaridad = ReglasEscolaridad(**escolaridad)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Reglas de puntuación inválidas: falta o sobra {e}") from e
+
+
+def cargar_reglas(ruta: str = RUTA_REGLAS) -> ReglasPuntuacion:
+    """Lee y compila el archivo de reglas. ValueError si no tiene la forma esperada."""
+    with open(ruta, "r", encoding="utf-8") as f:
+        return ReglasPuntuacion(json.load(f))
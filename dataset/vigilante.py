@@ -0,0 +1,277 @@
+"""
+Servicio que vigila la carpeta de entrevistas y mantiene al día las salidas.
+
+Cada `intervalo` segundos se lista la carpeta (sondeo con os.stat, sin APIs
+propias de cada sistema operativo). Un libro nuevo o modificado se procesa
+cuando está quieto: su tamaño y fecha de modificación no cambiaron desde el
+sondeo anterior y la última modificación tiene al menos `espera` segundos,
+así no se lee un libro a medio copiar o a medio guardar. Cada libro se
+extrae y se puntúa en un proceso del pool; el proceso principal sólo junta
+los resultados y reescribe el JSON y la hoja para subir y, si se pidió,
+sincroniza el almacén SQLite con el mismo resultado fusionado.
+
+Los pacientes y filas de cada libro se guardan en memoria: un libro nuevo no
+obliga a volver a extraer ni a puntuar los demás. La fusión sigue las reglas
+del modo por lotes (libros por fecha de consulta, gana el primero), así que
+las salidas son las mismas que daría correr el extractor y parte10 sobre la
+carpeta completa. El almacén recibe las mismas visitas: las de un libro
+quitado de la carpeta se borran salvo que otro libro las tenga.
+
+    python vigilante.py ENTREVISTAS --almacen --trabajadores 2
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import ExtraerDatosDelExcel as extractor
+import parte10
+from almacen import abrir_almacen, sincronizar_libros
+from registros import PacienteRegistro
+
+INTERVALO_SONDEO = 2.0   # segundos entre dos listados de la carpeta
+ESPERA_ESTABLE = 3.0     # segundos sin modificaciones antes de leer un libro
+
+QUITADO = object()       # resultado que avisa al escritor que el libro se quitó de la carpeta
+
+
+def firma_archivo(ruta_archivo):
+    """(tamaño, mtime en ns) del libro, o None si ya no existe."""
+    try:
+        estado = os.stat(ruta_archivo)
+    except OSError:
+        return None
+    return estado.st_size, estado.st_mtime_ns
+
+
+def extraer_y_puntuar(ruta_archivo, streaming=False, dir_cache=None):
+    """
+    Trabajo de un proceso del pool: extrae el libro (o lo toma del caché de
+    extracción) y puntúa sus pacientes. Devuelve (bloques, filas) con una
+    fila de la hoja por paciente, en el mismo orden, o None si el libro no
+    se pudo leer.
+    """
+    clave = None
+    bloques = None
+    if dir_cache:
+        clave = extractor.clave_cache(ruta_archivo, streaming)
+        bloques = extractor.leer_cache(dir_cache, clave)
+    if bloques is None:
+        bloques = extractor.procesar_libro(ruta_archivo, 1, streaming)
+        if bloques is None:
+            return None
+        if dir_cache:
+            extractor.guardar_cache(dir_cache, clave, ruta_archivo, bloques)
+    hoja = parte10.puntuar_pacientes_columnar(list(bloques.values()))
+    return bloques, list(hoja.itertuples(index=False, name=None))
+
+
+class Consolidado:
+    """
+    Resultados por libro ({ruta: [(id_global, huella, paciente, fila)]}) y su
+    fusión en el orden y con las reglas de duplicados del modo por lotes.
+    """
+
+    def __init__(self):
+        self.por_libro = {}
+        self.avisados = set()   # colisiones de id ya avisadas (no se repiten en cada reescritura)
+
+    def actualizar(self, ruta_archivo, bloques, filas):
+        """Reemplaza los resultados del libro."""
+        nombre_archivo = os.path.basename(ruta_archivo)
+        entradas = []
+        for (id_local, paciente_dict), fila in zip(bloques.items(), filas):
+            id_global = extractor.generar_id_global(paciente_dict, nombre_archivo, id_local)
+            entradas.append((id_global, extractor.huella_registro(paciente_dict),
+                             PacienteRegistro.desde_dict(paciente_dict), fila))
+        self.por_libro[ruta_archivo] = entradas
+
+    def quitar(self, ruta_archivo) -> bool:
+        return self.por_libro.pop(ruta_archivo, None) is not None
+
+    def fusionar(self):
+        """
+        (pacientes {id_global: paciente}, hoja, libros {id_global: libro})
+        de todos los libros, sin duplicados.
+        """
+        pacientes = {}
+        libros = {}
+        vistos = {}
+        filas = []
+        for ruta_archivo in sorted(self.por_libro, key=extractor.clave_orden_libro):
+            nombre_archivo = os.path.basename(ruta_archivo)
+            for id_base, huella, paciente, fila in self.por_libro[ruta_archivo]:
+                id_global = extractor.resolver_id_global(vistos, id_base, huella, nombre_archivo, paciente,
+                                                         self.avisados)
+                if id_global is None:
+                    continue
+                pacientes[id_global] = paciente
+                libros[id_global] = nombre_archivo
+                filas.append(fila)
+        if not filas:
+            return pacientes, parte10.construir_dataframe([]), libros
+        return pacientes, pd.DataFrame.from_records(filas, columns=parte10.COLUMNAS_FINALES), libros
+
+
+def sincronizar_almacen(pacientes, libros, ruta_almacen, libros_cambiados):
+    """Lleva al almacén el resultado fusionado; borra las visitas que ya no tiene ningún libro cambiado."""
+    try:
+        conexion = abrir_almacen(ruta_almacen)
+        try:
+            visitas = [(id_global, paciente, libros[id_global]) for id_global, paciente in pacientes.items()]
+            conteo = sincronizar_libros(conexion, visitas, libros_cambiados)
+        finally:
+            conexion.close()
+    except Exception as e:
+        print(f"❌ Error al guardar en el almacén {ruta_almacen}: {e}")
+        return
+    print(f"✅ Almacén {ruta_almacen}: {conteo['nuevas']} visitas nuevas, {conteo['actualizadas']} actualizadas, "
+          f"{conteo['quitadas']} quitadas")
+
+
+def escribir_salidas(consolidado, ruta_json, ruta_excel, ruta_almacen=None, libros_cambiados=()):
+    pacientes, hoja, libros = consolidado.fusionar()
+    if ruta_almacen:
+        sincronizar_almacen(pacientes, libros, ruta_almacen, libros_cambiados)
+    if ruta_json:
+        # Como la hoja: se escribe a un temporal y se renombra
+        extractor.guardar_pacientes(pacientes.items(), ruta_json, reemplazar=True)
+    if ruta_excel:
+        # Se escribe a un temporal y se renombra: quien abra la hoja nunca la ve a medias
+        temporal = ruta_excel + ".tmp"
+        try:
+            parte10.exportar_excel(hoja, temporal)
+            os.replace(temporal, ruta_excel)
+        except OSError as e:
+            print(f"❌ No se pudo guardar la hoja {ruta_excel}: {e}")
+            return len(pacientes)
+        print(f"✅ {len(hoja)} pacientes puntuados en {ruta_excel}")
+    return len(pacientes)
+
+
+async def _procesar(pool, ruta_archivo, detectado, streaming, dir_cache, eventos):
+    loop = asyncio.get_running_loop()
+    try:
+        resultado = await loop.run_in_executor(pool, extraer_y_puntuar, ruta_archivo, streaming, dir_cache)
+    except Exception as e:
+        print(f"❌ Error al procesar {ruta_archivo}: {e}")
+        resultado = None
+    await eventos.put((ruta_archivo, detectado, resultado))
+
+
+async def _escribir(eventos, consolidado, ruta_json, ruta_excel, ruta_almacen):
+    """
+    Único que modifica `consolidado`: aplica los libros terminados (o
+    quitados de la carpeta) y reescribe las salidas una vez por tanda.
+    """
+    while True:
+        tanda = [await eventos.get()]
+        while not eventos.empty():
+            tanda.append(eventos.get_nowait())
+
+        cambiados = set()
+        for ruta_archivo, detectado, resultado in tanda:
+            nombre_archivo = os.path.basename(ruta_archivo)
+            if resultado is QUITADO or not os.path.isfile(ruta_archivo):
+                if consolidado.quitar(ruta_archivo):
+                    print(f"🗑️ {nombre_archivo} ya no está en la carpeta")
+                    cambiados.add(nombre_archivo)
+            elif resultado is None:
+                # Se reintenta cuando el libro vuelva a cambiar (p. ej. terminó de copiarse)
+                print(f"⚠️ {nombre_archivo} no se pudo leer; se reintentará si cambia")
+            else:
+                bloques, filas = resultado
+                consolidado.actualizar(ruta_archivo, bloques, filas)
+                print(f"📄 {nombre_archivo}: {len(bloques)} pacientes")
+                cambiados.add(nombre_archivo)
+        if cambiados:
+            total = await asyncio.to_thread(escribir_salidas, consolidado, ruta_json, ruta_excel,
+                                            ruta_almacen, cambiados)
+            demora = time.monotonic() - min(detectado for _, detectado, _ in tanda)
+            print(f"⏱️ Salidas actualizadas ({total} pacientes) {demora:.1f} s después de detectar los cambios")
+
+
+async def vigilar(carpeta, ruta_json=parte10.RUTA_JSON_PACIENTES, ruta_excel=parte10.RUTA_EXCEL_SALIDA,
+                  ruta_almacen=None, intervalo=INTERVALO_SONDEO, espera=ESPERA_ESTABLE,
+                  trabajadores=1, streaming=False, dir_cache=None):
+    """Vigila `carpeta` hasta que se cancele la tarea (Ctrl+C desde la línea de comandos)."""
+    consolidado = Consolidado()
+    eventos = asyncio.Queue()
+    vistas = {}       # ruta -> (firma del sondeo anterior, cuándo se vio por primera vez esa firma)
+    procesadas = {}   # ruta -> firma con la que se procesó (o se intentó procesar)
+    en_curso = set()
+    tareas = set()
+
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        escritor = asyncio.create_task(_escribir(eventos, consolidado, ruta_json, ruta_excel, ruta_almacen))
+        try:
+            while True:
+                ahora = time.time()
+                actuales = {ruta: firma_archivo(ruta) for ruta in extractor.listar_libros(carpeta)}
+                for ruta_archivo, firma in actuales.items():
+                    anterior, detectado = vistas.get(ruta_archivo, (None, None))
+                    if firma != anterior:
+                        vistas[ruta_archivo] = firma, time.monotonic()
+                        continue
+                    if (firma is None or procesadas.get(ruta_archivo) == firma
+                            or ruta_archivo in en_curso or ahora - firma[1] / 1e9 < espera):
+                        continue
+                    procesadas[ruta_archivo] = firma
+                    en_curso.add(ruta_archivo)
+                    tarea = asyncio.create_task(_procesar(pool, ruta_archivo, detectado,
+                                                          streaming, dir_cache, eventos))
+                    tareas.add(tarea)
+                    tarea.add_done_callback(tareas.discard)
+                    tarea.add_done_callback(lambda _, ruta=ruta_archivo: en_curso.discard(ruta))
+
+                for ruta_archivo in [ruta for ruta in vistas if ruta not in actuales]:
+                    del vistas[ruta_archivo]
+                    if procesadas.pop(ruta_archivo, None) is not None:
+                        await eventos.put((ruta_archivo, time.monotonic(), QUITADO))
+                if escritor.done():
+                    escritor.result()   # propaga el error del escritor
+                await asyncio.sleep(intervalo)
+        finally:
+            escritor.cancel()
+            for tarea in tareas:
+                tarea.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vigila la carpeta de entrevistas y actualiza el JSON, "
+                                                 "la hoja para subir y el almacén con cada libro nuevo.")
+    parser.add_argument("carpeta", nargs="?", default="ENTREVISTAS", help="Carpeta de libros de entrevistas")
+    parser.add_argument("--salida", default=parte10.RUTA_JSON_PACIENTES,
+                        help="JSON de pacientes (.jsonl o .jsonl.gz: un paciente por línea)")
+    parser.add_argument("--excel", default=parte10.RUTA_EXCEL_SALIDA, help="Hoja para subir")
+    parser.add_argument("--almacen", nargs="?", const=extractor.RUTA_ALMACEN, default=None,
+                        help=f"Mantener también el almacén SQLite con las mismas visitas (por defecto {extractor.RUTA_ALMACEN})")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_SONDEO,
+                        help="Segundos entre dos revisiones de la carpeta")
+    parser.add_argument("--espera", type=float, default=ESPERA_ESTABLE,
+                        help="Segundos sin cambios antes de leer un libro")
+    parser.add_argument("--trabajadores", type=int, default=1,
+                        help="Procesos para extraer y puntuar libros (0 = todos los núcleos)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Leer los libros fila a fila con openpyxl (read_only) en vez de pd.read_excel")
+    parser.add_argument("--cache", nargs="?", const=extractor.RUTA_CACHE_POR_DEFECTO, default=None,
+                        help="Reutilizar la extracción de los libros que no cambiaron al reiniciar el servicio")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.carpeta):
+        print(f"❌ No existe la carpeta {args.carpeta}")
+        return
+    trabajadores = args.trabajadores if args.trabajadores > 0 else (os.cpu_count() or 1)
+    print(f"👀 Vigilando {args.carpeta} cada {args.intervalo:g} s (Ctrl+C para terminar)")
+    try:
+        asyncio.run(vigilar(args.carpeta, args.salida, args.excel, args.almacen, args.intervalo,
+                            args.espera, trabajadores, args.streaming, args.cache))
+    except KeyboardInterrupt:
+        print("\n✅ Vigilancia detenida")
+
+
+if __name__ == "__main__":
+    main()